@@ -46,7 +46,7 @@ def _find_packages():
 
 setup(
     name='stressrunner',
-    python_requires='>=3.4.0',
+    python_requires='>=3.7.0',
     version='1.1.13',
     description="A stressrunner similar as TextTestRunner for stress test, support for html report.",
     long_description=read_file('README.md'),
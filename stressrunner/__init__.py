@@ -7,8 +7,7 @@
 @Email : tao.xu2008@outlook.com
 """
 
-from .runner import *
-from .mail import *
+import importlib
 
 __all__ = ['StressRunner', 'send_mail']
 
@@ -20,5 +19,34 @@ Based on unittest.
 Support iterative exection, html report, send html report, etc.
 """
 
+# the submodules are imported at the first access of their names (PEP 562),
+# e.g. mail (smtplib, email) is not imported unless send_mail is used
+_LAZY_NAMES = {
+    'StressRunner': 'stressrunner.runner',
+    'send_mail': 'stressrunner.mail',
+}
+# the public names of these modules were star imported here
+_STAR_MODULES = ('stressrunner.runner', 'stressrunner.mail')
+
+
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    module_names = [_LAZY_NAMES[name]] if name in _LAZY_NAMES else _STAR_MODULES
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        if not name.startswith('_') and hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    if name in globals():  # a submodule imported by the modules above
+        return globals()[name]
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
+
+
 if __name__ == '__main__':
     pass
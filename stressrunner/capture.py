@@ -0,0 +1,288 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bounded output capture.
+A test case may print hundreds of MB, only the head and the tail of its
+output are kept in memory, the full output is spilled to a file on disk and
+referenced by path/offset in the captured text.
+The output is captured from sys.stdout/sys.stderr (OutputRedirector in
+runner), or from the file descriptors 1 and 2 (FdCapture).
+"""
+
+import os
+import re
+import codecs
+import threading
+import collections
+
+OMITTED_LINE = "\n... {0} characters omitted ...\n"
+SPILLED_LINE = "\n... {0} characters omitted, full output: {1} (offset {2}, {3} bytes) ...\n"
+SPILL_SUFFIXES = ('.stdout.log', '.stderr.log')  # the spill files of the stdout and stderr of a test case
+
+
+def spill_file_name(name):
+    """A file name from a test id"""
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def remove_spill_files(spill_dir):
+    """
+    Remove the spill files of a previous run, the spill files are appended
+    during a run, by all the records of a test case
+    :param spill_dir:
+    :return:
+    """
+    if not os.path.isdir(spill_dir):
+        return
+    for name in os.listdir(spill_dir):
+        if name.endswith(SPILL_SUFFIXES):
+            os.remove(os.path.join(spill_dir, name))
+
+
+class CaptureBuffer(object):
+    """
+    Text buffer of a captured stream, keep the first head and the last tail
+    characters in memory. Once the output exceeds head + tail, the full output
+    is appended to spill_path, the text in the middle is dropped from memory.
+    :param head: characters kept from the start
+    :param tail: characters kept from the end, in a ring buffer
+    :param spill_path: the file to append the full output to, None to drop the middle
+    """
+
+    def __init__(self, head=65536, tail=65536, spill_path=None):
+        self.head = head
+        self.tail = tail
+        self.spill_path = spill_path
+        self._head = []
+        self._head_size = 0
+        self._tail = collections.deque()
+        self._tail_size = 0
+        self._size = 0  # characters written
+        self._spill = None
+        self._spill_offset = 0
+        self._spill_size = 0
+
+    def write(self, s):
+        if not s:
+            return 0
+        size = len(s)
+        self._size += size
+        if self._spill is not None:
+            self._spill_write(s)
+
+        room = self.head - self._head_size
+        if room > 0:
+            self._head.append(s[:room])
+            self._head_size += min(room, size)
+            s = s[room:]
+        if s:
+            self._tail.append(s)
+            self._tail_size += len(s)
+            if self._tail_size > self.tail:
+                if self._spill is None and self.spill_path is not None:
+                    self._open_spill()
+                self._trim()
+        return size
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _open_spill(self):
+        """Start spilling, with the output so far, which is all still in memory"""
+        spill_dir = os.path.dirname(self.spill_path)
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._spill = open(self.spill_path, 'ab')
+        self._spill_offset = self._spill.tell()
+        self._spill_size = 0
+        self._spill_write(''.join(self._head))
+        self._spill_write(''.join(self._tail))
+
+    def _spill_write(self, s):
+        data = s.encode('UTF-8', 'replace')
+        self._spill.write(data)
+        self._spill_size += len(data)
+
+    def _trim(self):
+        excess = self._tail_size - self.tail
+        while excess > 0:
+            chunk = self._tail[0]
+            if len(chunk) <= excess:
+                self._tail.popleft()
+                self._tail_size -= len(chunk)
+                excess -= len(chunk)
+            else:
+                self._tail[0] = chunk[excess:]
+                self._tail_size -= excess
+                excess = 0
+
+    @property
+    def omitted(self):
+        """The number of characters dropped from memory"""
+        return self._size - self._head_size - self._tail_size
+
+    def getvalue(self):
+        """The head and the tail, with a line about the omitted output between"""
+        head = ''.join(self._head)
+        tail = ''.join(self._tail)
+        omitted = self.omitted
+        if not omitted:
+            return head + tail
+        if self._spill is not None:
+            self._spill.flush()
+            line = SPILLED_LINE.format(omitted, self.spill_path, self._spill_offset, self._spill_size)
+        else:
+            line = OMITTED_LINE.format(omitted)
+        return head + line + tail
+
+    def flush(self):
+        if self._spill is not None:
+            self._spill.flush()
+
+    def clear(self):
+        """Drop the captured output and close the spill file, ready for the next test case"""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._head = []
+        self._head_size = 0
+        self._tail.clear()
+        self._tail_size = 0
+        self._size = 0
+
+
+# written through the pipe to know when the output before it has been drained
+SYNC_PREFIX = b'\x00stressrunner-sync:'
+
+
+class FdCapture(object):
+    """
+    Capture a file descriptor (1 or 2) at the OS level: the fd is redirected
+    into a pipe with os.dup2, so the output of subprocesses, C extensions and
+    os.write is captured too, and a reader thread drains the pipe into the
+    target buffer, echoing it to the original fd.
+    Use fd_capture(fd) for the one FdCapture of a fd in the process.
+    :param fd: the file descriptor to capture
+    :param echo: write the output to the original fd too
+    """
+
+    sync_timeout = 5
+
+    def __init__(self, fd, echo=True):
+        self.fd = fd
+        self.echo = echo
+        self._saved_fd = None
+        self._read_fd = None
+        self._reader = None
+        self._target = None
+        self._decoder = None
+        self._cond = threading.Condition()
+        self._sync_token = 0
+        self._synced_token = 0
+
+    @property
+    def started(self):
+        return self._saved_fd is not None
+
+    def start(self):
+        if self.started:
+            return
+        self._saved_fd = os.dup(self.fd)
+        self._read_fd, write_fd = os.pipe()
+        os.dup2(write_fd, self.fd)
+        os.close(write_fd)
+        self._decoder = codecs.getincrementaldecoder('UTF-8')('replace')
+        self._reader = threading.Thread(target=self._drain, args=(self._read_fd, self._saved_fd),
+                                        name='FdCapture-{0}'.format(self.fd))
+        self._reader.daemon = True
+        self._reader.start()
+
+    def set_target(self, target):
+        """
+        :param target: the buffer to write the captured text into, None to only echo it
+        :return:
+        """
+        with self._cond:
+            self._target = target
+
+    def sync(self):
+        """Wait until the output written to the fd so far has been drained"""
+        if not self.started:
+            return
+        with self._cond:
+            self._sync_token += 1
+            token = self._sync_token
+        # less than PIPE_BUF, written atomically
+        os.write(self.fd, SYNC_PREFIX + str(token).encode() + b'\x00')
+        with self._cond:
+            self._cond.wait_for(lambda: self._synced_token >= token, self.sync_timeout)
+
+    def stop(self):
+        """Restore the fd, the reader exits once the pipe is closed by all the writers"""
+        if not self.started:
+            return
+        self.sync()
+        self.set_target(None)
+        os.dup2(self._saved_fd, self.fd)
+        self._reader.join(self.sync_timeout)
+        if not self._reader.is_alive():
+            os.close(self._saved_fd)
+        # else a subprocess still holds the pipe, the reader keeps echoing to the saved fd
+        self._saved_fd = None
+
+    def _emit(self, data, echo_fd):
+        if not data:
+            return
+        if self.echo:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(echo_fd, view):]
+        text = self._decoder.decode(data)
+        with self._cond:
+            if self._target is not None and text:
+                self._target.write(text)
+
+    def _drain(self, read_fd, echo_fd):
+        pending = b''
+        while True:
+            data = os.read(read_fd, 65536)
+            if not data:
+                break
+            pending += data
+            while pending:
+                idx = pending.find(SYNC_PREFIX)
+                if idx < 0:
+                    # keep a partial sync marker at the end for the next read
+                    keep = 0
+                    zero = pending.rfind(b'\x00', max(len(pending) - len(SYNC_PREFIX) + 1, 0))
+                    if zero >= 0 and SYNC_PREFIX.startswith(pending[zero:]):
+                        keep = len(pending) - zero
+                    self._emit(pending[:len(pending) - keep], echo_fd)
+                    pending = pending[len(pending) - keep:]
+                    break
+                end = pending.find(b'\x00', idx + len(SYNC_PREFIX))
+                if end < 0:
+                    self._emit(pending[:idx], echo_fd)
+                    pending = pending[idx:]
+                    break
+                self._emit(pending[:idx], echo_fd)
+                token = int(pending[idx + len(SYNC_PREFIX):end])
+                pending = pending[end + 1:]
+                with self._cond:
+                    self._synced_token = max(self._synced_token, token)
+                    self._cond.notify_all()
+        self._emit(pending, echo_fd)
+        os.close(read_fd)
+
+
+_fd_captures = {}
+
+
+def fd_capture(fd):
+    """The FdCapture of fd in this process"""
+    capture = _fd_captures.get(fd)
+    if capture is None:
+        capture = _fd_captures[fd] = FdCapture(fd)
+    return capture
@@ -0,0 +1,121 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Logger setup, done once per process.
+The default StressRunner logger is installed with coloredlogs at the first
+use only, and any logger can be switched to asynchronous logging: its
+handlers are moved behind a QueueHandler/QueueListener, so the test cases
+never wait on the terminal or file I/O of a log line.
+"""
+
+import os
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s %(name)s %(levelname)s: %(message)s'
+DEFAULT_LOGGER_NAME = 'StressRunner'
+
+_lock = threading.RLock()
+_installed = set()  # logger names installed by get_default_logger
+_async_handlers = {}  # logger name -> _AsyncHandler
+
+
+class _AsyncHandler(QueueHandler):
+    """QueueHandler with its QueueListener, restarted in forked children"""
+
+    def __init__(self, handlers):
+        super(_AsyncHandler, self).__init__(queue.Queue(-1))
+        self.handlers = handlers
+        self.listener = None
+        self.start()
+
+    def start(self):
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Log the queued records and stop the listener thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def after_fork(self):
+        # the listener thread does not exist in the child, the queue may be locked
+        self.queue = queue.Queue(-1)
+        self.listener = None
+        self.start()
+
+
+def enable_async_logging(logger):
+    """
+    Move the handlers of logger behind a queue, emitted by a listener thread.
+    Idempotent, the queued records are emitted at exit.
+    :param logger: logging.Logger
+    :return: logger
+    """
+    with _lock:
+        if logger.name in _async_handlers:
+            return logger
+        handlers = list(logger.handlers)
+        if not handlers:
+            return logger
+        for handler in handlers:
+            logger.removeHandler(handler)
+        async_handler = _AsyncHandler(handlers)
+        logger.addHandler(async_handler)
+        _async_handlers[logger.name] = async_handler
+    return logger
+
+
+def disable_async_logging(logger):
+    """
+    Stop the listener and give the handlers back to logger
+    :param logger: logging.Logger
+    :return: logger
+    """
+    with _lock:
+        async_handler = _async_handlers.pop(logger.name, None)
+        if async_handler is None:
+            return logger
+        logger.removeHandler(async_handler)
+        async_handler.stop()
+        for handler in async_handler.handlers:
+            logger.addHandler(handler)
+    return logger
+
+
+def get_default_logger(async_logging=False, name=DEFAULT_LOGGER_NAME):
+    """
+    The StressRunner logger, coloredlogs is installed on it once per process
+    :param async_logging: emit the log records in a listener thread
+    :param name: the logger name
+    :return: logging.Logger
+    """
+    logger = logging.getLogger(name)
+    with _lock:
+        if name not in _installed:
+            import coloredlogs
+            coloredlogs.install(logger=logger, level=logging.DEBUG, fmt=LOG_FORMAT)
+            _installed.add(name)
+    if async_logging:
+        enable_async_logging(logger)
+    return logger
+
+
+def _stop_all():
+    for async_handler in list(_async_handlers.values()):
+        async_handler.stop()
+
+
+def _after_fork():
+    for async_handler in _async_handlers.values():
+        async_handler.after_fork()
+
+
+atexit.register(_stop_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,230 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per test case loop scheduler.
+Repeat one test case in a flat loop (constant stack depth), limited by
+iterations, wall-clock duration and/or a stop condition, optionally on
+N concurrent threads.
+"""
+
+import copy
+import time
+import threading
+import unittest
+
+
+class CaseLoop(object):
+    """
+    Loop policy for a single test case
+    :param iterations: max iterations per case, 0 means no limit
+    :param duration: max wall-clock seconds per case, None means no limit
+    :param stop_condition: callable(result) -> bool, stop the loop once it returns True
+    :param concurrency: run the loop on N threads, the limits apply to each thread
+    """
+
+    def __init__(self, iterations=1, duration=None, stop_condition=None, concurrency=1):
+        self.iterations = iterations
+        self.duration = duration
+        self.stop_condition = stop_condition
+        self.concurrency = concurrency
+
+    @property
+    def is_single(self):
+        return self.iterations == 1 and self.duration is None and self.stop_condition is None \
+            and self.concurrency <= 1
+
+    def should_continue(self, count, start, result):
+        """
+        Check if the case should run one more iteration
+        :param count: iterations done
+        :param start: time.monotonic() at the first iteration
+        :param result: unittest.TestResult
+        :return:
+        """
+        if result.shouldStop:
+            return False
+        if self.iterations and count >= self.iterations:
+            return False
+        if self.duration is not None and time.monotonic() - start >= self.duration:
+            return False
+        if self.stop_condition is not None and self.stop_condition(result):
+            return False
+        return True
+
+
+def new_case(test):
+    """
+    A fresh instance of the test case, to run one more iteration.
+    Created from the class and method name as unittest.TestLoader does,
+    a TestCase with its own __init__ (may need more args) is shallow copied
+    with the per run state reset: copy a test case which has not run, the
+    attributes set by setUp or the test method would be copied too, and the
+    mutable attributes set by __init__ are shared between the copies.
+    :param test: unittest.TestCase, not run
+    :return:
+    """
+    cls = test.__class__
+    if cls.__init__ is unittest.TestCase.__init__:
+        return cls(test._testMethodName)
+    case = copy.copy(test)
+    case._cleanups = []  # not shared between the copies
+    case._outcome = None
+    return case
+
+
+def new_suite(suite):
+    """
+    A fresh suite with the same structure and fresh test cases, much cheaper
+    than copy.deepcopy(suite), and works with unpicklable attributes
+    :param suite: unittest.TestSuite, which should not have been run
+    :return:
+    """
+    fresh = copy.copy(suite)
+    fresh._tests = []
+    fresh._removed_tests = 0
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            fresh.addTest(new_suite(test))
+        else:
+            fresh.addTest(new_case(test))
+    return fresh
+
+
+def _bad_outcomes(result):
+    if hasattr(result, 'failure_count'):
+        # _TestResult keeps the recent outcomes only, count them
+        return sum([
+            result.failure_count,
+            result.error_count,
+            result.skipped_count,
+            len(result.expectedFailures),
+            len(result.unexpectedSuccesses)]
+        )
+    return sum([
+        len(result.failures),
+        len(result.errors),
+        len(result.skipped),
+        len(result.expectedFailures),
+        len(result.unexpectedSuccesses)]
+    )
+
+
+class LoopSuite(unittest.TestSuite):
+    """
+    A TestSuite that repeats one test case until its CaseLoop expired.
+    Iterations are yielded one by one from __iter__, so unittest.TestSuite.run
+    drives the loop and still handles the class/module fixtures.
+    The loop breaks on the first iteration that did not pass.
+    With concurrency > 1, the class/module fixtures are set up once, then each
+    thread runs its own loop of fresh copies of the test case.
+    """
+
+    _cleanup = False
+
+    def __init__(self, test, case_loop):
+        super(LoopSuite, self).__init__()
+        self._test = test
+        self.case_loop = case_loop
+        self._result = None
+
+    def __repr__(self):
+        return "<%s test=%s>" % (self.__class__.__name__, self._test)
+
+    def __iter__(self):
+        if self._result is None:
+            return iter([self._test])
+        return self._iterate(self._result, reuse=True)
+
+    def _iterate(self, result, reuse=False):
+        """
+        Yield the iterations of the test case
+        :param result: unittest.TestResult
+        :param reuse: run the test case itself as the first iteration
+        :return:
+        """
+        count = 0
+        start = time.monotonic()
+        # copied before the first iteration ran, a copy of self._test would keep its setUp state
+        template = new_case(self._test) if reuse else self._test
+        while True:
+            test = self._test if reuse and not count else new_case(template)
+            bad_outcomes = _bad_outcomes(result)
+            yield test
+            count += 1
+            if _bad_outcomes(result) != bad_outcomes:
+                break
+            if not self.case_loop.should_continue(count, start, result):
+                break
+
+    def countTestCases(self):
+        return self._test.countTestCases()
+
+    def run(self, result, debug=False):
+        if self.case_loop.concurrency > 1 and not debug:
+            return self._run_concurrent(result)
+        self._result = result
+        try:
+            return super(LoopSuite, self).run(result, debug)
+        finally:
+            self._result = None
+
+    def _run_loop(self, result):
+        for test in self._iterate(result):
+            test(result)
+
+    def _run_concurrent(self, result):
+        """Same fixtures handling as unittest.TestSuite.run, with the loop on threads"""
+        top_level = False
+        if getattr(result, '_testRunEntered', False) is False:
+            result._testRunEntered = top_level = True
+
+        test = self._test
+        self._tearDownPreviousClass(test, result)
+        self._handleModuleFixture(test, result)
+        self._handleClassSetUp(test, result)
+        result._previousTestClass = test.__class__
+        if not (getattr(test.__class__, '_classSetupFailed', False) or
+                getattr(result, '_moduleSetUpFailed', False)):
+            threads = []
+            for idx in range(self.case_loop.concurrency):
+                thread = threading.Thread(target=self._run_loop, args=(result,),
+                                          name='{0}-{1}'.format(test.id(), idx + 1))
+                thread.daemon = True
+                threads.append(thread)
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    thread.join()
+            except KeyboardInterrupt:
+                # let the threads exit after their running iteration
+                result.stop()
+                raise
+
+        if top_level:
+            self._tearDownPreviousClass(None, result)
+            self._handleModuleTearDown(result)
+            result._testRunEntered = False
+        return result
+
+
+def loop_suite(suite, case_loop):
+    """
+    Wrap every test case in the suite with a LoopSuite
+    :param suite: unittest.TestSuite
+    :param case_loop: CaseLoop
+    :return: a new suite with the same structure
+    """
+    if case_loop.is_single:
+        return suite
+    # copied as in new_suite, the suite class may need constructor args
+    looped = copy.copy(suite)
+    looped._tests = []
+    looped._removed_tests = 0
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            looped.addTest(loop_suite(test, case_loop))
+        else:
+            looped.addTest(LoopSuite(test, case_loop))
+    return looped
@@ -7,17 +7,22 @@
 """Send email by smtp"""
 
 import os
+import gzip
+import time
+import queue
+import atexit
 import base64
 import smtplib
+import threading
 import mimetypes
-from email import encoders
+import collections
+from concurrent.futures import Future, wait
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from email.mime import multipart
 from email.mime import audio
-from email.mime import base
 from email.mime import image
 from email.mime import text
 
@@ -36,6 +41,352 @@ def is_base64(sb):
         return False
 
 
+# ===================================================================
+# --- Attachments: read and compressed in chunks, the payload bounded by a budget
+# ===================================================================
+# an attachment larger than this (bytes) is cut to its head and tail before compressing
+ATTACHMENT_MAX_SIZE = 8 * 1024 * 1024
+# read/encode chunk, a multiple of 57 bytes - a 76 characters base64 line
+ENCODE_CHUNK_SIZE = 57 * 1024
+# not compressed again, nor truncated
+COMPRESSED_EXTENSIONS = ('.gz', '.tgz', '.zip', '.bz2', '.xz', '.7z', '.png', '.jpg', '.jpeg', '.gif')
+TRUNCATED_LINE = "\n... {0} bytes truncated, full file: {1} ...\n"
+
+
+class _Base64Lines(object):
+    """
+    File-like sink, base64 encode the written bytes into 76 characters lines.
+    The encoded lines are kept in memory: smtplib sends the message as a whole,
+    its size is bounded by the attachment budget, not by the chunk size.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self._pending = b''
+
+    def write(self, data):
+        pending = self._pending + data
+        size = len(pending) // 57 * 57
+        if size:
+            self.lines.append(base64.encodebytes(pending[:size]).decode('ascii'))
+        self._pending = pending[size:]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        if self._pending:
+            self.lines.append(base64.encodebytes(self._pending).decode('ascii'))
+            self._pending = b''
+        return ''.join(self.lines)
+
+
+def _iter_chunks(fp, size, chunk_size=ENCODE_CHUNK_SIZE):
+    while size > 0:
+        chunk = fp.read(min(chunk_size, size))
+        if not chunk:
+            return
+        size -= len(chunk)
+        yield chunk
+
+
+def iter_excerpt(path, max_size=ATTACHMENT_MAX_SIZE):
+    """
+    The content of a file in chunks, cut to the head and tail max_size/2 bytes if larger
+    :param path:
+    :param max_size: bytes, None for no limit
+    :return: iterator of bytes
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fp:
+        if max_size is None or size <= max_size:
+            for chunk in _iter_chunks(fp, size):
+                yield chunk
+            return
+        head = max_size // 2
+        tail = max_size - head
+        for chunk in _iter_chunks(fp, head):
+            yield chunk
+        yield TRUNCATED_LINE.format(size - head - tail, path).encode('UTF-8')
+        fp.seek(size - tail)
+        for chunk in _iter_chunks(fp, tail):
+            yield chunk
+
+
+def attachment_part(path, compress=None, max_size=ATTACHMENT_MAX_SIZE):
+    """
+    A MIME attachment of a file, read and gzip compressed in chunks, never holding the
+    file itself in memory, only its base64 payload, which is encoded once, email does
+    not encode it again
+    :param path:
+    :param compress: gzip it as <name>.gz, default unless the file is compressed already
+    :param max_size: cut a file to compress to its head/tail excerpt above max_size bytes
+    :return: MIMEBase, None if a compressed file is above max_size
+    """
+    name = os.path.basename(path)
+    if compress is None:
+        compress = not name.lower().endswith(COMPRESSED_EXTENSIONS)
+    encoded = _Base64Lines()
+    if compress:
+        with gzip.GzipFile(filename=name, mode='wb', fileobj=encoded) as gz:
+            for chunk in iter_excerpt(path, max_size):
+                gz.write(chunk)
+        maintype, subtype = 'application', 'gzip'
+        name += '.gz'
+    else:
+        if max_size is not None and os.path.getsize(path) > max_size:
+            print('WARNING: Unable to attach %s, larger than %s bytes.' % (path, max_size))
+            return None
+        for chunk in iter_excerpt(path, None):
+            encoded.write(chunk)
+        ctype, encoding = mimetypes.guess_type(path)
+        if ctype is None or encoding is not None:
+            ctype = 'application/octet-stream'
+        maintype, subtype = ctype.split('/', 1)
+
+    part = MIMEBase(maintype, subtype)
+    part.set_payload(encoded.getvalue())
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment', filename=name)
+    return part
+
+
+# ===================================================================
+# --- Transport: pooled SMTP connections + background send queue
+# ===================================================================
+class SmtpTransport(object):
+    """
+    Pool of connected and logged in SMTP connections to one server, the
+    connections are reused by the next mails instead of paying the
+    TCP + TLS + AUTH setup for each one.
+    Use get_transport() for the transport of a server shared in the process.
+    :param host:
+    :param port:
+    :param user: login if not empty
+    :param password:
+    :param tls: STARTTLS after connecting
+    :param pool_size: the max idle connections kept
+    :param timeout: the socket timeout in seconds
+    :param idle_timeout: don't reuse a connection idle for more seconds, servers close them
+    """
+
+    def __init__(self, host='localhost', port=25, user='', password='', tls=False, pool_size=2, timeout=60,
+                 idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.tls = tls
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = collections.deque()  # (smtp, last used, monotonic)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.tls:
+                smtp.starttls()
+                smtp.ehlo()
+                smtp.esmtp_features['auth'] = 'LOGIN DIGEST-MD5 PLAIN'
+            if self.user:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _acquire(self):
+        """:return: (smtp, reused)"""
+        now = time.monotonic()
+        stale = []
+        smtp = None
+        with self._lock:
+            while self._idle:
+                idle, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    smtp = idle
+                    break
+                stale.append(idle)
+        for idle in stale:
+            self._quit(idle)
+        if smtp is not None:
+            return smtp, True
+        return self._connect(), False
+
+    def _release(self, smtp):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((smtp, time.monotonic()))
+                return
+        self._quit(smtp)
+
+    @staticmethod
+    def _quit(smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def send(self, m_from, to_addrs, msg):
+        """
+        Send a mail on a pooled connection
+        :param m_from:
+        :param to_addrs: list of the recipients
+        :param msg: the message, str/bytes or email.message.Message
+        :return: dict of the refused recipients, as smtplib.SMTP.sendmail
+        """
+        if not isinstance(msg, (str, bytes)):
+            msg = msg.as_string()
+        smtp, reused = self._acquire()
+        try:
+            try:
+                refused = smtp.sendmail(m_from, to_addrs, msg)
+            except smtplib.SMTPServerDisconnected:
+                if not reused:
+                    raise
+                # the server closed the idle connection, once more on a new one
+                smtp.close()
+                smtp = self._connect()
+                refused = smtp.sendmail(m_from, to_addrs, msg)
+        except Exception:
+            smtp.close()
+            raise
+        self._release(smtp)
+        return refused
+
+    def close(self):
+        """Quit the idle connections"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for smtp, _ in idle:
+            self._quit(smtp)
+
+
+class MailQueue(object):
+    """
+    Background delivery of the mails, put() returns at once, a failed
+    delivery is retried with an exponential backoff, except the permanent
+    (5xx) SMTP errors.
+    Use get_mail_queue() for the queue of the process, sent out at exit.
+    :param retries: retry a failed delivery N times
+    :param backoff: seconds before the first retry, doubled at each retry
+    :param max_backoff: the max seconds between two retries
+    """
+
+    def __init__(self, retries=3, backoff=1.0, max_backoff=60.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue = queue.Queue()
+        self._pending = set()  # futures not done yet
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, transport, m_from, to_addrs, msg):
+        """
+        Queue a mail
+        :param transport: SmtpTransport
+        :param m_from:
+        :param to_addrs: list of the recipients
+        :param msg: the message, str/bytes or email.message.Message
+        :return: concurrent.futures.Future of the refused recipients dict
+        """
+        future = Future()
+        with self._lock:
+            self._pending.add(future)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='MailQueue')
+                self._thread.daemon = True
+                self._thread.start()
+        future.add_done_callback(self._done)
+        self._queue.put((transport, m_from, to_addrs, msg, future))
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _run(self):
+        while True:
+            transport, m_from, to_addrs, msg, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._deliver(transport, m_from, to_addrs, msg))
+            except Exception as e:
+                print('ERROR: failed to send mail to {0}: {1}'.format(to_addrs, e))
+                future.set_exception(e)
+
+    def _deliver(self, transport, m_from, to_addrs, msg):
+        delay = self.backoff
+        attempt = 0
+        while True:
+            try:
+                return transport.send(m_from, to_addrs, msg)
+            except (smtplib.SMTPException, OSError) as e:
+                permanent = isinstance(e, smtplib.SMTPRecipientsRefused) or \
+                    (isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500)
+                if permanent or attempt >= self.retries:
+                    raise
+                attempt += 1
+                print('WARNING: send mail failed: {0}, retry {1}/{2} in {3}s ...'.format(
+                    e, attempt, self.retries, delay))
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def join(self, timeout=None):
+        """
+        Wait for the queued mails to be sent or given up
+        :param timeout: seconds, None for no limit
+        :return: True if all done
+        """
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = wait(pending, timeout)
+        return not not_done
+
+
+# wait for the queued mails at exit, at most seconds
+MAIL_EXIT_TIMEOUT = 120
+
+_transports = {}  # (host, port, user, password, tls) -> SmtpTransport
+_mail_queue = None
+_lock = threading.Lock()
+
+
+def get_transport(host='localhost', port=25, user='', password='', tls=False):
+    """The SmtpTransport of a server, shared in the process"""
+    key = (host, port, user, password, tls)
+    with _lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = _transports[key] = SmtpTransport(host, port, user, password, tls)
+    return transport
+
+
+def get_mail_queue():
+    """The MailQueue of the process"""
+    global _mail_queue
+    with _lock:
+        if _mail_queue is None:
+            _mail_queue = MailQueue()
+    return _mail_queue
+
+
+def _close_all():
+    if _mail_queue is not None and not _mail_queue.join(MAIL_EXIT_TIMEOUT):
+        print('WARNING: gave up the mails not sent in {0}s'.format(MAIL_EXIT_TIMEOUT))
+    for transport in list(_transports.values()):
+        transport.close()
+
+
+atexit.register(_close_all)
+
+
 # ===================================================================
 # --- Solution 1: SmtpServer + Mail
 # ===================================================================
@@ -44,7 +395,6 @@ class SmtpServer(object):
 
     def __init__(self, host='localhost', user='', password='', port=25, tls=False):
         self.port = port
-        self.smtp = smtplib.SMTP(host=host)
         self.host = host
         self.user = user
         self.password = password  # base64.b64decode(password).decode('UTF-8') if is_base64(password) else
@@ -53,22 +403,19 @@ class SmtpServer(object):
             self.is_gmail = True
             self.port = 587
         self.tls = tls
+        # connected at the first mail, the connection is kept for the next ones
+        self.transport = get_transport(self.host, self.port, self.user, self.password, self.tls or self.is_gmail)
 
-    def sendmail(self, mail):
+    def sendmail(self, mail, block=True):
         """
         Send Mail()
         :param mail:
-        :return:
+        :param block: False to queue the mail and return at once, sent in the background
+        :return: dict of the refused recipients, a Future of it if not block
         """
-        self.smtp.connect(self.host, self.port)
-        if self.tls or self.is_gmail:
-            self.smtp.starttls()
-            self.smtp.ehlo()
-            self.smtp.esmtp_features['auth'] = 'LOGIN DIGEST-MD5 PLAIN'
-        if self.user:
-            self.smtp.login(self.user, self.password)
-        self.smtp.sendmail(mail.m_from, mail.m_to.split(';'), mail.body.as_string())
-        self.smtp.quit()
+        if block:
+            return self.transport.send(mail.m_from, mail.m_to.split(';'), mail.body)
+        return get_mail_queue().put(self.transport, mail.m_from, mail.m_to.split(';'), mail.body)
 
 
 class Mail(object):
@@ -91,34 +438,25 @@ class Mail(object):
         self.alternative.attach(self.content)
         self.body.attach(self.alternative)
 
-    def attach(self, attachments):
+    def attach(self, attachments, compress=None, max_size=ATTACHMENT_MAX_SIZE):
         """
-        attach files
+        attach files, gzip compressed and base64 encoded, see attachment_part
         :param attachments: list
+        :param compress: gzip the files, default unless compressed already
+        :param max_size: cut a file to its head/tail excerpt above max_size bytes
         :return:
         """
         for attachment in attachments:
             if not os.path.isfile(attachment):
                 print('WARNING: Unable to attach %s because it is not a file.' % attachment)
                 continue
-
-            ctype, encoding = mimetypes.guess_type(attachment)
-            if ctype is None or encoding is not None:
-                ctype = 'application/octet-stream'
-            # maintype, subtype = ctype.split('/', 1)
-
-            fp = open(attachment, 'rb')
-            attachment_mime = MIMEBase("application", "octet-stream")
-            attachment_mime.set_payload(fp.read())
-            fp.close()
-
-            encoders.encode_base64(attachment_mime)
-            attachment_mime.add_header('Content-Disposition', 'attachment', filename=os.path.split(attachment)[1])
-            self.body.attach(attachment_mime)
+            attachment_mime = attachment_part(attachment, compress, max_size)
+            if attachment_mime is not None:
+                self.body.attach(attachment_mime)
 
 
 def send_mail(subject, content, m_from, m_to, host, user,
-              password, port, tls, attachments=None):
+              password, port, tls, attachments=None, block=True, max_size=ATTACHMENT_MAX_SIZE):
     """
     Send mail
     :param subject:
@@ -131,7 +469,9 @@ def send_mail(subject, content, m_from, m_to, host, user,
     :param port: 465
     :param tls: True
     :param attachments:
-    :return:
+    :param block: False to queue the mail and return at once, sent in the background with retries
+    :param max_size: cut an attachment to its head/tail excerpt above max_size bytes
+    :return: None, a concurrent.futures.Future of the delivery if not block
     """
 
     if attachments is None:
@@ -140,10 +480,13 @@ def send_mail(subject, content, m_from, m_to, host, user,
         print('preparing mail...')
         mail = Mail(subject, content, m_from, m_to)
         print('preparing attachments...')
-        mail.attach(attachments)
+        mail.attach(attachments, max_size=max_size)
 
         print('preparing SMTP server...')
         smtp = SmtpServer(host, user, password, port, tls)
+        if not block:
+            print('queue mail to {0}...'.format(m_to))
+            return smtp.sendmail(mail, block=False)
         print('sending mail to {0}...'.format(m_to))
         smtp.sendmail(mail)
         print(">> Send mail done.")
@@ -242,11 +585,7 @@ class SmtpMailer(object):
                 ctype = 'application/octet-stream'
             maintype, subtype = ctype.split('/', 1)
             try:
-                if maintype == 'text':
-                    with open(attached, 'rb') as fhandle:
-                        # Note: we should handle calculating the charset
-                        msg = text.MIMEText(fhandle.read().decode('utf-8'), _subtype=subtype)
-                elif maintype == 'image':
+                if maintype == 'image':
                     with open(attached, 'rb') as fhandle:
                         imgid = os.path.basename(attached)
                         msg = image.MIMEImage(
@@ -257,16 +596,15 @@ class SmtpMailer(object):
                     with open(attached, 'rb') as fhandle:
                         msg = audio.MIMEAudio(fhandle.read(), _subtype=subtype)
                 else:
-                    with open(attached, 'rb') as fhandle:
-                        msg = base.MIMEBase(maintype, subtype)
-                        msg.set_payload(fhandle.read())
-                    # Encode the payload using Base64
-                    encoders.encode_base64(msg)
-                    # Set the filename parameter
-                msg.add_header(
-                    'Content-Disposition', 'attachment',
-                    filename=os.path.basename(attached)
-                )
+                    # text, logs and the others: compressed, encoded in chunks
+                    msg = attachment_part(attached)
+                if msg is None:
+                    continue
+                if msg.get_filename() is None:
+                    msg.add_header(
+                        'Content-Disposition', 'attachment',
+                        filename=os.path.basename(attached)
+                    )
                 outer.attach(msg)
             # pylint: disable=W0703
             except Exception as exception:
@@ -291,7 +629,6 @@ class SmtpMailer(object):
         :return:
             return (True, None) on success, return (False, error_msg) otherwise
         """
-        errmsg = None
         # self._check_type(recipients, [str, list])
         # self._check_type(subject, [str])
         toaddrs = []
@@ -333,13 +670,10 @@ class SmtpMailer(object):
         # handle attachments
         composed = outer.as_string()
         ret = (False, 'failed to send email')
+        user, password = self._login_params or ('', '')
         try:
-            smtp = smtplib.SMTP(self._server, self._port)
-            if self._login_params is not None:
-                smtp.login(self._login_params[0], self._login_params[1])
-            smtp.sendmail(self._sender, toaddrs, composed)
-            smtp.quit()
+            get_transport(self._server, self._port, user, password).send(self._sender, toaddrs, composed)
             ret = (True, None)
-        except smtplib.SMTPException as smtperr:
-            ret = (False, str(errmsg))
+        except (smtplib.SMTPException, OSError) as smtperr:
+            ret = (False, str(smtperr))
         return ret
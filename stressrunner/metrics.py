@@ -0,0 +1,189 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Live metrics of a running stress test.
+LiveMetrics is fed by _TestResult with every finished record, logs a summary
+line periodically, and optionally serves the metrics in the Prometheus text
+format on a local HTTP endpoint, e.g. http://127.0.0.1:9100/metrics
+"""
+
+import time
+import threading
+import collections
+
+from stressrunner.stats import LatencyStats
+
+STATUS_NAMES = ('pass', 'fail', 'error', 'skip', 'canceled')
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class LiveMetrics(object):
+    """
+    Counts, rates and latency of the test case iterations, overall and in a rolling window
+    :param window: seconds of the rolling rates/percentiles
+    :param max_samples: max latency samples kept in the window
+    """
+
+    def __init__(self, window=60, max_samples=10000):
+        self.window = window
+        self.start_time = time.monotonic()
+        self.counts = [0] * len(STATUS_NAMES)
+        self.case_counts = collections.OrderedDict()  # test id -> counts of each status
+        self.latency = LatencyStats()  # of each test id, since the start
+        self._recent = collections.deque(maxlen=max_samples)  # (monotonic time, status, elapsed ns)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reporter = None
+        self._server = None
+
+    def add(self, status, test_id, elapsed_time):
+        """
+        Called by _TestResult for every record
+        :param status: 0-pass 1-fail 2-error 3-skip 4-canceled
+        :param test_id:
+        :param elapsed_time: ns
+        :return:
+        """
+        with self._lock:
+            self.counts[status] += 1
+            case_counts = self.case_counts.get(test_id)
+            if case_counts is None:
+                case_counts = self.case_counts[test_id] = [0] * len(STATUS_NAMES)
+            case_counts[status] += 1
+            if status in (0, 1, 2):
+                self.latency.add(test_id, elapsed_time)
+            self._recent.append((time.monotonic(), status, elapsed_time))
+
+    def _rolling(self):
+        """Iterations/s, failure ratio and latency quantiles (ns) of the window"""
+        now = time.monotonic()
+        since = now - self.window
+        recent = [(status, elapsed) for t, status, elapsed in self._recent if t >= since]
+        span = min(self.window, now - self.start_time) or 1
+        if recent and len(recent) == self._recent.maxlen:
+            # the window is truncated to the last max_samples records
+            span = max(now - self._recent[0][0], 1e-9)
+        done = [elapsed for status, elapsed in recent if status in (0, 1, 2)]
+        failed = sum(1 for status, _ in recent if status in (1, 2))
+        done.sort()
+        quantiles = [done[min(int(q * len(done)), len(done) - 1)] if done else None for q in QUANTILES]
+        return len(recent) / span, (failed / float(len(done)) if done else 0.0), quantiles
+
+    def summary_line(self):
+        with self._lock:
+            total = sum(self.counts)
+            elapsed = time.monotonic() - self.start_time
+            rate, failure_ratio, quantiles = self._rolling()
+            counts = ', '.join('{0} {1}'.format(name, count) for name, count in zip(STATUS_NAMES, self.counts)
+                               if count)
+        latency = '/'.join('-' if q is None else '{0:.3f}'.format(q / 1e6) for q in quantiles)
+        return "[METRIC] Iterations: {0} ({1}) --Rate: {2:.1f}/s (avg {3:.1f}/s) --FailureRate: {4:.2%} " \
+               "--Latency p50/p90/p99: {5} ms (last {6}s)".format(
+                   total, counts or '-', rate, total / elapsed if elapsed else 0, failure_ratio,
+                   latency, self.window)
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            rate, failure_ratio, quantiles = self._rolling()
+            lines.append('# HELP stressrunner_iterations_total Finished test case iterations.')
+            lines.append('# TYPE stressrunner_iterations_total counter')
+            for name, count in zip(STATUS_NAMES, self.counts):
+                lines.append('stressrunner_iterations_total{{status="{0}"}} {1}'.format(name, count))
+            lines.append('# HELP stressrunner_case_iterations_total Finished iterations of each test case.')
+            lines.append('# TYPE stressrunner_case_iterations_total counter')
+            for test_id, counts in self.case_counts.items():
+                for name, count in zip(STATUS_NAMES, counts):
+                    if count:
+                        lines.append('stressrunner_case_iterations_total{{case="{0}",status="{1}"}} {2}'.format(
+                            _label(test_id), name, count))
+            lines.append('# HELP stressrunner_iterations_per_second Iterations per second in the rolling window.')
+            lines.append('# TYPE stressrunner_iterations_per_second gauge')
+            lines.append('stressrunner_iterations_per_second {0:.6f}'.format(rate))
+            lines.append('# HELP stressrunner_failure_ratio Failed/error ratio in the rolling window.')
+            lines.append('# TYPE stressrunner_failure_ratio gauge')
+            lines.append('stressrunner_failure_ratio {0:.6f}'.format(failure_ratio))
+            lines.append('# HELP stressrunner_latency_seconds Latency quantiles in the rolling window.')
+            lines.append('# TYPE stressrunner_latency_seconds gauge')
+            for q, value in zip(QUANTILES, quantiles):
+                if value is not None:
+                    lines.append('stressrunner_latency_seconds{{quantile="{0}"}} {1:.9f}'.format(q, value / 1e9))
+            lines.append('# HELP stressrunner_case_latency_seconds Latency of each test case since the start.')
+            lines.append('# TYPE stressrunner_case_latency_seconds summary')
+            for test_id, histogram in self.latency.items():
+                case = _label(test_id)
+                for q in QUANTILES:
+                    lines.append('stressrunner_case_latency_seconds{{case="{0}",quantile="{1}"}} {2:.9f}'.format(
+                        case, q, histogram.percentile(q * 100) / 1e9))
+                lines.append('stressrunner_case_latency_seconds_sum{{case="{0}"}} {1:.9f}'.format(
+                    case, histogram.mean * histogram.count / 1e9))
+                lines.append('stressrunner_case_latency_seconds_count{{case="{0}"}} {1}'.format(
+                    case, histogram.count))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def start(self, logger=None, interval=None, port=None, host='127.0.0.1'):
+        """
+        :param logger: log the summary line every interval seconds
+        :param interval: seconds, None for no summary line
+        :param port: serve /metrics on this port, None for no HTTP endpoint, 0 for any free port
+        :param host: the HTTP endpoint address
+        :return:
+        """
+        if logger is not None and interval:
+            self._reporter = threading.Thread(target=self._report, args=(logger, interval), name='LiveMetrics')
+            self._reporter.daemon = True
+            self._reporter.start()
+        if port is not None:
+            self._serve(host, port)
+
+    def _report(self, logger, interval):
+        while not self._stop.wait(interval):
+            logger.info(self.summary_line())
+
+    def _serve(self, host, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('UTF-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name='LiveMetricsHTTP')
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def address(self):
+        """(host, port) of the HTTP endpoint, None if not serving"""
+        return self._server.server_address if self._server is not None else None
+
+    def stop(self):
+        self._stop.set()
+        if self._reporter is not None:
+            self._reporter.join()
+            self._reporter = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
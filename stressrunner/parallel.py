@@ -0,0 +1,148 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Run test cases in a pool of worker processes.
+Each task runs one test case (with its CaseLoop) in a worker process, which
+captures its own stdout/stderr and streams every finished record back to the
+parent, where it is merged into the one _TestResult used for the report.
+Not multiprocessing.Pool: its terminate() may hang if a worker is killed
+while holding a lock of the pool queues, and we stop the workers at ^C.
+"""
+
+import copy
+import queue
+import signal
+import traceback
+import multiprocessing
+import unittest
+
+from stressrunner.loop import loop_suite, new_case
+from stressrunner.runner import _TestResult
+
+
+def iter_cases(suite):
+    """
+    Flatten a suite into its test cases
+    :param suite: unittest.TestSuite
+    :return:
+    """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for case in iter_cases(test):
+                yield case
+        else:
+            yield test
+
+
+def _context():
+    """fork if possible, so the workers inherit the test cases without pickling"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+class _WorkerResult(_TestResult):
+    """_TestResult in a worker process, send each record to the parent"""
+
+    def __init__(self, index, messages, logger, verbosity=2, fail_exit=True, **capture):
+        super(_WorkerResult, self).__init__(logger, verbosity=verbosity, fail_exit=fail_exit, **capture)
+        self._index = index
+        self._messages = messages
+
+    def _add_record(self, record):
+        sn, _, output, stack_trace, elapsed_time, loop = record
+        self._messages.put(('record', self._index, sn, output, stack_trace, elapsed_time, loop))
+
+
+def _worker_main(tests, case_loop, deepcopy, tasks, messages, logger, verbosity, fail_exit, capture):
+    """
+    Loop of a worker process: run the test case of each task, until terminated
+    Messages to the parent, in order for each worker:
+        ('record', index, status, output, stack_trace, elapsed_time, loop)
+        ('done', index, error)
+    """
+    # ^C is handled by the parent, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        index, ts_loop = tasks.get()
+        error = None
+        try:
+            result = _WorkerResult(index, messages, logger, verbosity, fail_exit, **capture)
+            result.ts_loop = ts_loop
+            test = copy.deepcopy(tests[index]) if deepcopy else new_case(tests[index])
+            loop_suite(unittest.TestSuite([test]), case_loop)(result)
+        except Exception:
+            error = traceback.format_exc()
+        messages.put(('done', index, error))
+
+
+class WorkerPool(object):
+    """
+    A pool of worker processes to run the test cases of a suite
+    :param workers: the number of worker processes
+    :param suite: unittest.TestSuite
+    :param case_loop: CaseLoop for each test case
+    :param result: the parent _TestResult, supply logger/verbosity/fail_exit
+    :param deepcopy: copy.deepcopy the test case for each task, instead of creating a fresh one
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, workers, suite, case_loop, result, deepcopy=False):
+        ctx = _context()
+        self.tests = list(iter_cases(suite))
+        self._tasks = ctx.SimpleQueue()
+        self._messages = ctx.Queue()
+        self._workers = []
+        for _ in range(workers):
+            worker = ctx.Process(
+                target=_worker_main,
+                args=(self.tests, case_loop, deepcopy, self._tasks, self._messages,
+                      result.logger, result.verbosity, result.fail_exit,
+                      dict(capture_head=result.capture_head, capture_tail=result.capture_tail,
+                           capture_dir=result.capture_dir, capture_fd=result.capture_fd))
+            )
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _check_workers(self):
+        for worker in self._workers:
+            if worker.exitcode is not None:
+                raise Exception('Worker process {0} exited unexpectedly, exitcode: {1}'.format(
+                    worker.pid, worker.exitcode))
+
+    def run(self, result):
+        """
+        Run all the test cases once (one suite loop), merge the records into result
+        :param result: _TestResult
+        :return:
+        """
+        for index in range(len(self.tests)):
+            self._tasks.put((index, result.ts_loop))
+
+        pending = len(self.tests)
+        while pending and not result.shouldStop:
+            try:
+                message = self._messages.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if message[0] == 'record':
+                _, index, sn, output, stack_trace, elapsed_time, loop = message
+                result.merge_record((sn, self.tests[index], output, stack_trace, elapsed_time, loop))
+            else:
+                _, index, error = message
+                pending -= 1
+                if error:
+                    raise Exception('Error in worker for {0}:\n{1}'.format(self.tests[index], error))
+
+    def close(self):
+        """Stop the workers, the running tasks are abandoned"""
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
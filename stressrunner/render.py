@@ -0,0 +1,832 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Report rendering.
+A run is described once by a ReportModel (attributes, counts and the
+aggregates kept during the run), the emitters render it into their formats:
+html, JUnit XML, JSON, NDJSON, Markdown, CSV and the mail digest. The records are
+fed to all the emitters in a single pass over the result store, the output
+and stack trace of a record are read once for all of them.
+The %(name)s templates of stressrunner.report are compiled once, into their
+literal parts and fields.
+The NDJSON records can also be exported during the run by RecordExporter.
+"""
+
+import re
+import os
+import csv
+import json
+import time
+import platform
+import collections
+from xml.sax import saxutils
+
+from stressrunner.stats import ns_to_ms
+from stressrunner.runner import STATUS, REPORT_BUFFER_SIZE, __author__, ns_to_string, ns_to_seconds
+
+DIGEST_TOP_FAILURES = 5  # test cases with the most failures in the mail digest
+DIGEST_TOP_LATENCY = 10  # test cases with the highest p99 latency in the mail digest
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%%')
+
+
+class Template(object):
+    """
+    A %(name)s template compiled once into its literal parts and fields,
+    rendered into a stream. The value of a field is a string, or an iterable
+    of strings written one by one, e.g. the rows of a table.
+    :param source: the template, '%%' for a literal '%'
+    """
+
+    def __init__(self, source=None, parts=None):
+        self.parts = parts or []  # (literal, field name or None)
+        self._splits = {}
+        if source is None:
+            return
+        literal = []
+        pos = 0
+        for match in _PLACEHOLDER.finditer(source):
+            literal.append(source[pos:match.start()])
+            pos = match.end()
+            if match.group(1) is None:
+                literal.append('%')
+            else:
+                self.parts.append((''.join(literal), match.group(1)))
+                literal = []
+        literal.append(source[pos:])
+        self.parts.append((''.join(literal), None))
+
+    @property
+    def fields(self):
+        return [field for _, field in self.parts if field is not None]
+
+    def split(self, field):
+        """
+        Split the template around a field, e.g. to write a table row by row between the two parts
+        :param field:
+        :return: (head Template, tail Template)
+        """
+        if field not in self._splits:
+            for idx, (literal, name) in enumerate(self.parts):
+                if name == field:
+                    head = Template(parts=self.parts[:idx] + [(literal, None)])
+                    self._splits[field] = (head, Template(parts=self.parts[idx + 1:]))
+                    break
+            else:
+                raise KeyError(field)
+        return self._splits[field]
+
+    def render(self, fp, values):
+        """
+        :param fp: the stream to write into
+        :param values: dict of the field values
+        :return:
+        """
+        for literal, field in self.parts:
+            fp.write(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if isinstance(value, str):
+                fp.write(value)
+            else:
+                for chunk in value:
+                    fp.write(chunk)
+
+    def substitute(self, values):
+        chunks = []
+        self.render(_ChunkList(chunks), values)
+        return ''.join(chunks)
+
+
+class _ChunkList(object):
+    def __init__(self, chunks):
+        self.write = chunks.append
+
+
+_compiled = {}
+
+
+def get_template(name):
+    """The template of stressrunner.report by name, compiled at the first use"""
+    template = _compiled.get(name)
+    if template is None:
+        from stressrunner import report
+        template = _compiled[name] = Template(getattr(report, name))
+    return template
+
+
+def local_node(hostname, ip):
+    """The node running the tests, first in the nodes table"""
+    return {
+        "Name": hostname,
+        "Status": "Ready",
+        "IPAddress": ip,
+        "Roles": "Executor",
+        "User": "root",
+        "Password": "********",
+        "OS": platform.system(),
+    }
+
+
+class ReportModel(object):
+    """
+    The run described once for all the emitters
+    :param runner: StressRunner
+    :param result: _TestResult
+    :param title: default runner.report_title
+    """
+
+    def __init__(self, runner, result, title=None):
+        self.result = result
+        self.title = title or runner.report_title
+        self.failed = STATUS[1] in self.title or STATUS[2] in self.title
+        self.attributes = runner._get_attributes(result)  # sets runner.summary and passrate
+        self.summary = runner.summary
+        self.passrate = runner.passrate
+        self.hostname = runner.local_hostname
+        self.ip = runner.local_ip
+        self.location = '{0}({1})'.format(self.hostname, self.ip)
+        self.nodes = [local_node(self.hostname, self.ip)] + list(runner.test_nodes)
+        self.start_time = runner.start_time
+        self.stop_time = runner.stop_time
+        self.elapsed_time = runner.elapsedtime  # ns
+        self.report_html = runner.report_html
+        self.report_detail_html = runner.report_detail_html
+        self.result_log = runner.result_log
+        self.result_ndjson = runner.result_ndjson if 'ndjson' in runner.report_formats else None
+        self.status = runner.test_status
+        self.tester = runner.tester
+        self.version = runner.test_version
+        self.description = runner.test_desc
+        self.environment = runner.test_env
+        self.counts = collections.OrderedDict([
+            ('Pass', result.success_count),
+            ('Fail', result.failure_count),
+            ('Error', result.error_count),
+            ('Skip', result.skipped_count),
+            ('Cancel', result.canceled_count),
+        ])
+        self.cases = result.all.summarize(runner.failure_samples)  # CaseSummary of each test case
+        self.latency = result.latency  # LatencyStats of each test id
+
+    @property
+    def total(self):
+        """The executed and skipped test cases, the html report total"""
+        return sum(self.counts.values()) - self.counts['Cancel']
+
+    def case_status(self, summary):
+        """:return: (status number, html class) of a test case from its counts"""
+        np, nf, ne, ns, nc = summary.counts
+        if ne:
+            return 2, 'errorCase'
+        if nf:
+            return 1, 'failCase'
+        if ns and not (np or nc):
+            return 3, 'skipCase'
+        if nc and not np:
+            return 4, 'passCase'
+        return 0, 'passCase'
+
+
+def case_description(case):
+    name = case.test_id.split('.')[-1]
+    doc = case.doc or ""
+    return doc and ('%s: %s' % (name, doc)) or name
+
+
+class Emitter(object):
+    """
+    An output format, rendered by render(): start(model), then
+    add_record(record, output, stack_trace) for every record grouped by
+    class if records is True, then finish(model)
+    :param path: the output file
+    """
+
+    records = False  # fed with the records, else rendered from the aggregates only
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = None
+
+    def _open(self, newline=None):
+        path_dir = os.path.dirname(self.path)
+        if path_dir and not os.path.isdir(path_dir):
+            os.makedirs(path_dir)
+        self._fp = open(self.path, 'w', encoding='UTF-8', buffering=REPORT_BUFFER_SIZE, newline=newline)
+        return self._fp
+
+    def start(self, model):
+        pass
+
+    def add_record(self, record, output, stack_trace):
+        pass
+
+    def finish(self, model):
+        pass
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+def render(model, emitters):
+    """
+    Render the emitters, the records are read once for all of them
+    :param model: ReportModel
+    :param emitters: list of Emitter
+    :return:
+    """
+    try:
+        for emitter in emitters:
+            emitter.start(model)
+        fed = [emitter for emitter in emitters if emitter.records]
+        if fed:
+            for record in model.result.all.iter_grouped():
+                output, stack_trace = record.output, record.stack_trace
+                for emitter in fed:
+                    emitter.add_record(record, output, stack_trace)
+        for emitter in emitters:
+            emitter.finish(model)
+    finally:
+        for emitter in emitters:
+            emitter.close()
+
+
+# ===================================================================
+# --- html
+# ===================================================================
+def attributes_rows(attributes):
+    att_template = """
+        <tr id='attr_%d' class='attr'>
+            <td colspan='1' align='left' width='15%%'>%s</td>
+            <td colspan='1' align='left'>%s</td>
+        </tr>
+        """
+    return ''.join(att_template % (idx + 1, k, v) for idx, (k, v) in enumerate(attributes.items()) if v)
+
+
+def nodes_rows(nodes):
+    html_template = """
+        <tr id='node_%d' class='nodes'>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+        </tr>
+        """
+    keys = ("Name", "Status", "IPAddress", "Roles", "User", "Password", "OS")
+    return ''.join(html_template % ((idx,) + tuple(node.get(key, '') for key in keys))
+                   for idx, node in enumerate(nodes))
+
+
+def latency_rows(latency):
+    html_template = """
+        <tr id='latency_%d' class='latency'>
+            <td colspan='1' align='left'>%s</td>
+            <td colspan='1' align='center'>%d</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+        </tr>
+        """
+    rows = []
+    for idx, (test_id, histogram) in enumerate(latency.items()):
+        summary = histogram.summary()
+        rows.append(html_template % (
+            idx, saxutils.escape(test_id), summary['count'], ns_to_ms(summary['min']),
+            ns_to_ms(summary['mean']), ns_to_ms(summary['stddev']), ns_to_ms(summary['p50']),
+            ns_to_ms(summary['p90']), ns_to_ms(summary['p99']), ns_to_ms(summary['p99.9']),
+            ns_to_ms(summary['max'])))
+    return ''.join(rows)
+
+
+class HtmlEmitter(Emitter):
+    """
+    The html report of REPORT_TEMPLATE
+    :param path:
+    :param aggregate: one row per test case with the first/last failures, else one row per record
+    :param detail_path: the drill-down report of the records, linked by the aggregated one
+    """
+
+    row_template = """
+        <tr id='result_%d' class='%s'>
+            <td colspan='1' align='left'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%d</td>
+        </tr>
+        """
+
+    msg_template = """
+        <tr id='msg_%d' class='%s'>
+            <td colspan='1' align='left'>Message</td>
+            <td colspan='3' align='left'><pre>%s</pre></td>
+        </tr>
+        """
+
+    aggregate_row_template = """
+        <tr id='result_%d' class='%s'>
+            <td colspan='1' align='left'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%d</td>
+            <td colspan='1' align='center'>%d</td>
+            <td colspan='1' align='center'>%d</td>
+            <td colspan='1' align='center'>%d</td>
+            <td colspan='1' align='center'>%d</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%s</td>
+            <td colspan='1' align='center'>%d</td>
+        </tr>
+        """
+
+    aggregate_msg_template = """
+        <tr id='msg_%d' class='%s'>
+            <td colspan='1' align='left'>Message</td>
+            <td colspan='10' align='left'><pre>%s</pre></td>
+        </tr>
+        """
+
+    sample_template = "--- Loop: {0} - {1} ---\n{2}"
+
+    def __init__(self, path, aggregate=False, detail_path=None):
+        super(HtmlEmitter, self).__init__(path)
+        self.aggregate = aggregate
+        self.records = not aggregate
+        self.detail_path = detail_path
+        self._values = None
+        self._class_name = None
+        self._class_idx = -1
+        self._record_idx = 0
+
+    def start(self, model):
+        from stressrunner.report import RESULT_HEADER, AGGREGATE_RESULT_HEADER
+        self._values = dict(
+            Title=model.title,
+            TitleColor="h_red" if model.failed else "h_green",
+            Generator=__author__,
+            Environment=attributes_rows(model.attributes),
+            Nodes=nodes_rows(model.nodes),
+            Total=str(model.total),
+            Pass=str(model.counts['Pass']),
+            Fail=str(model.counts['Fail']),
+            Error=str(model.counts['Error']),
+            Skip=str(model.counts['Skip']),
+            Cancel=str(model.counts['Cancel']),
+            Passrate=model.passrate,
+            Latency=latency_rows(model.latency),
+            ResultHeader=AGGREGATE_RESULT_HEADER if self.aggregate else RESULT_HEADER,
+        )
+        head, _ = get_template('REPORT_TEMPLATE').split('Results')
+        head.render(self._open(), self._values)
+
+    def add_record(self, record, output, stack_trace):
+        for row in self.record_rows(record, output, stack_trace):
+            self._fp.write(row)
+
+    def record_rows(self, record, output, stack_trace):
+        """The row of a record and its message row, the records are grouped by class"""
+        case = record.case
+        if case.class_name != self._class_name:
+            self._class_name = case.class_name
+            self._class_idx += 1
+            self._record_idx = 0
+        n = record.status
+        style = ('passCase', 'failCase', 'errorCase', 'skipCase', 'passCase')[n] if n in STATUS else 'none'
+        cid = int("{0}{1}".format(self._class_idx, self._record_idx))
+        self._record_idx += 1
+        yield self.row_template % (cid, style, case_description(case), STATUS[n],
+                                   ns_to_string(record.elapsed_time), record.loop)
+        if output or stack_trace:
+            yield self.msg_template % (cid, style, saxutils.escape(output + stack_trace))
+
+    def _aggregate_rows(self, model):
+        detail_link = os.path.basename(self.detail_path or '')
+        for cid, summary in enumerate(model.cases):
+            np, nf, ne, ns, nc = summary.counts
+            n, style = model.case_status(summary)
+            histogram = model.latency.histograms.get(summary.case.test_id)
+            if histogram is not None:
+                mean, p99, max_ = histogram.mean, histogram.percentile(99), histogram.max
+            else:
+                mean = p99 = max_ = None
+            yield self.aggregate_row_template % (
+                cid, style, case_description(summary.case), STATUS[n], summary.iterations, np + nc, nf, ne, ns,
+                ns_to_ms(mean), ns_to_ms(p99), ns_to_ms(max_), summary.last_loop)
+
+            first, last, omitted = summary.failure_samples()
+            samples = [self.sample_template.format(r.loop, STATUS[r.status], r.output + r.stack_trace)
+                       for r in first]
+            if omitted:
+                samples.append("--- {0} more failures, see {1} ---".format(omitted, detail_link))
+            samples.extend(self.sample_template.format(r.loop, STATUS[r.status], r.output + r.stack_trace)
+                           for r in last)
+            if samples:
+                yield self.aggregate_msg_template % (cid, style, saxutils.escape('\n'.join(samples)))
+
+    def finish(self, model):
+        if self.aggregate:
+            for row in self._aggregate_rows(model):
+                self._fp.write(row)
+        _, tail = get_template('REPORT_TEMPLATE').split('Results')
+        tail.render(self._fp, self._values)
+
+
+class DigestEmitter(Emitter):
+    """The mail digest of DIGEST_TEMPLATE: status, counts, the top failures and latency"""
+
+    failure_template = "<tr><td>%s</td><td>%d</td><td>%d</td><td>%s</td></tr>"
+    latency_template = "<tr><td style='text-align: left;'>%s</td><td>%d</td>" \
+                       "<td>%s</td><td>%s</td><td>%s</td><td>%s</td></tr>"
+
+    def finish(self, model):
+        summaries = [summary for summary in model.cases if summary.failure_count]
+        summaries.sort(key=lambda summary: summary.failure_count, reverse=True)
+        failures = []
+        for summary in summaries[:DIGEST_TOP_FAILURES]:
+            first, _, _ = summary.failure_samples()
+            message = first[0].stack_trace.strip('\n').split('\n')[-1] if first else ''
+            failures.append(self.failure_template % (
+                saxutils.escape(summary.case.test_id), summary.failure_count, summary.iterations,
+                saxutils.escape(message)))
+        if len(summaries) > DIGEST_TOP_FAILURES:
+            failures.append("<tr><td colspan='4'>... {0} more failed test cases</td></tr>".format(
+                len(summaries) - DIGEST_TOP_FAILURES))
+
+        histograms = sorted(model.latency.items(), key=lambda item: item[1].percentile(99), reverse=True)
+        latency = []
+        for test_id, histogram in histograms[:DIGEST_TOP_LATENCY]:
+            latency.append(self.latency_template % (
+                saxutils.escape(test_id), histogram.count, ns_to_ms(histogram.percentile(50)),
+                ns_to_ms(histogram.percentile(90)), ns_to_ms(histogram.percentile(99)), ns_to_ms(histogram.max)))
+        if len(histograms) > DIGEST_TOP_LATENCY:
+            latency.append("<tr><td colspan='6' style='text-align: left;'>... {0} more test cases</td></tr>".format(
+                len(histograms) - DIGEST_TOP_LATENCY))
+
+        get_template('DIGEST_TEMPLATE').render(self._open(), dict(
+            Title=saxutils.escape(model.title),
+            TitleColor='#FF0000' if model.failed else '#66CC66',
+            Summary=saxutils.escape(model.summary),
+            Start=model.attributes['Start'],
+            End=model.attributes['End'],
+            Elapsed=model.attributes['Elapsed'],
+            Location=saxutils.escape(model.location),
+            Report=saxutils.escape(model.report_html),
+            ResultLog=saxutils.escape(model.result_log),
+            Total=str(model.total),
+            Pass=str(model.counts['Pass']),
+            Fail=str(model.counts['Fail']),
+            Error=str(model.counts['Error']),
+            Skip=str(model.counts['Skip']),
+            Cancel=str(model.counts['Cancel']),
+            Passrate=model.passrate,
+            Failures=''.join(failures) or "<tr><td colspan='4'>None</td></tr>",
+            Latency=''.join(latency),
+        ))
+
+
+# ===================================================================
+# --- JUnit XML
+# ===================================================================
+def testsuite_attrs(model, fixed_width=False):
+    """
+    The testsuite attributes
+    :param model:
+    :param fixed_width: zero padded numbers, the same length at each checkpoint
+    :return:
+    """
+    count = '{0:012d}'.format if fixed_width else str
+    elapsed = ns_to_seconds(model.elapsed_time)
+    return collections.OrderedDict([
+        ('name', 'test'),
+        ('errors', count(model.counts['Error'])),
+        ('failures', count(model.counts['Fail'])),
+        ('skipped', count(model.counts['Skip'])),
+        ('success', count(model.counts['Pass'])),
+        ('canceled', count(model.counts['Cancel'])),
+        ('tests', count(sum(model.counts.values()))),
+        ('time', '{0:0>22}'.format(elapsed) if fixed_width else elapsed),
+        ('timestamp', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))),
+        ('hostname', model.location),
+    ])
+
+
+def latency_properties(model):
+    """The latency statistics of each test id, in seconds, as (name, value)"""
+    for test_id, histogram in model.latency.items():
+        for key, value in histogram.summary().items():
+            if value is None:
+                continue
+            yield ('{0}.latency.{1}'.format(test_id, key),
+                   str(value) if key == 'count' else '{0:.9f}'.format(value / 1e9))
+
+
+def junit_testcase(record, output, stack_trace):
+    """
+    The testcase element of a record
+    :param record: Record
+    :param output:
+    :param stack_trace:
+    :return: (attrs, kwargs of JUnitXmlWriter.add_testcase)
+    """
+    tc_attrs = collections.OrderedDict([
+        ('classname', record.case.class_name),
+        ('name', record.case.method_name),
+        ('time', ns_to_seconds(record.elapsed_time)),
+    ])
+    skipped = failure = error = None
+    if record.status == 3:  # skipped
+        skipped = stack_trace  # reason
+    elif record.status in [1, 2]:  # Fail, Error
+        err_failure = stack_trace.strip('\n')
+        detail = (err_failure.split("\n")[-1], STATUS[record.status].capitalize(), err_failure)
+        if record.status == 1:
+            failure = detail
+        else:
+            error = detail
+    return tc_attrs, dict(skipped=skipped, failure=failure, error=error, system_out=output)
+
+
+class JUnitXmlEmitter(Emitter):
+    """The JUnit XML, a testcase per record"""
+
+    records = True
+
+    def __init__(self, path):
+        super(JUnitXmlEmitter, self).__init__(path)
+        self._writer = None
+
+    def start(self, model):
+        from stressrunner.writers import JUnitXmlWriter
+        self._writer = JUnitXmlWriter(self.path)
+        self._writer.start_suite(testsuite_attrs(model))
+        self._writer.add_properties(latency_properties(model))
+
+    def add_record(self, record, output, stack_trace):
+        tc_attrs, kwargs = junit_testcase(record, output, stack_trace)
+        self._writer.add_testcase(tc_attrs, **kwargs)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+# ===================================================================
+# --- JSON, Markdown, CSV
+# ===================================================================
+def case_dict(model, summary):
+    """A test case aggregate as a dict"""
+    n, _ = model.case_status(summary)
+    histogram = model.latency.histograms.get(summary.case.test_id)
+    return collections.OrderedDict([
+        ('id', summary.case.test_id),
+        ('class_name', summary.case.class_name),
+        ('method_name', summary.case.method_name),
+        ('doc', summary.case.doc),
+        ('status', STATUS[n]),
+        ('iterations', summary.iterations),
+        ('counts', collections.OrderedDict(zip(model.counts, summary.counts))),
+        ('last_loop', summary.last_loop),
+        ('latency_ns', histogram.summary() if histogram is not None else None),
+    ])
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else (value or None)
+
+
+class JsonEmitter(Emitter):
+    """
+    The run summary as a JSON document, from the aggregates: environment, nodes,
+    counts, timings and the latency percentiles of each test case, the records
+    are in the NDJSON file
+    """
+
+    def finish(self, model):
+        document = collections.OrderedDict([
+            ('title', model.title),
+            ('status', model.status),
+            ('summary', model.summary),
+            ('passrate', model.passrate),
+            ('tester', model.tester),
+            ('version', model.version),
+            ('description', model.description),
+            ('hostname', model.hostname),
+            ('ip', model.ip),
+            ('environment', model.environment),
+            ('attributes', model.attributes),
+            ('nodes', model.nodes),
+            ('counts', collections.OrderedDict(model.counts, Total=sum(model.counts.values()))),
+            ('start_time', _isoformat(model.start_time)),
+            ('stop_time', _isoformat(model.stop_time)),
+            ('elapsed_time_ns', model.elapsed_time),
+            ('records', collections.OrderedDict([
+                ('path', model.result_ndjson),
+                ('count', len(model.result.all)),
+                ('fields', RECORD_FIELDS),
+            ])),
+            ('cases', [case_dict(model, summary) for summary in model.cases]),
+        ])
+        json.dump(document, self._open(), ensure_ascii=False, indent=2, default=str)
+
+
+# the keys of each NDJSON record, in this order, flat for a columnar load
+RECORD_FIELDS = ('time', 'test_id', 'class_name', 'method_name', 'status', 'status_code',
+                 'elapsed_time_ns', 'loop', 'message', 'output', 'stack_trace')
+
+
+def record_row(case, status, elapsed_time, loop, output, stack_trace, timestamp=None):
+    """
+    A record as a flat dict of RECORD_FIELDS
+    :param case: CaseInfo
+    :param status: 0-pass 1-fail 2-error 3-skip 4-canceled
+    :param elapsed_time: ns
+    :param loop:
+    :param output:
+    :param stack_trace:
+    :param timestamp: the epoch seconds the record finished, None if unknown
+    :return:
+    """
+    return collections.OrderedDict([
+        ('time', timestamp),
+        ('test_id', case.test_id),
+        ('class_name', case.class_name),
+        ('method_name', case.method_name),
+        ('status', STATUS[status]),
+        ('status_code', status),
+        ('elapsed_time_ns', elapsed_time or 0),
+        ('loop', loop),
+        ('message', stack_trace.strip('\n').split('\n')[-1] if stack_trace else ''),
+        ('output', output or ''),
+        ('stack_trace', stack_trace or ''),
+    ])
+
+
+class NdjsonEmitter(Emitter):
+    """A JSON line per record, RECORD_FIELDS"""
+
+    records = True
+
+    def __init__(self, path):
+        super(NdjsonEmitter, self).__init__(path)
+        self._writer = None
+
+    def start(self, model):
+        from stressrunner.writers import NdjsonWriter
+        self._writer = NdjsonWriter(self.path)
+
+    def add_record(self, record, output, stack_trace):
+        self._writer.write(record_row(record.case, record.status, record.elapsed_time, record.loop,
+                                      output, stack_trace))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class RecordExporter(object):
+    """
+    Write the NDJSON records during the run, as they are added to the result
+    :param path:
+    """
+
+    def __init__(self, path):
+        from stressrunner.writers import NdjsonWriter
+        self.path = path
+        self._writer = NdjsonWriter(path)
+
+    def rewrite(self, store):
+        """Write the records already in the store, e.g. reloaded to resume a run"""
+        for record in store:
+            self._writer.write(record_row(record.case, record.status, record.elapsed_time, record.loop,
+                                          record.output, record.stack_trace))
+
+    def add(self, case, record):
+        """
+        :param case: CaseInfo
+        :param record: (status, test, output, stack_trace, elapsed_time(ns), loop)
+        :return:
+        """
+        sn, _, output, stack_trace, elapsed_time, loop = record
+        self._writer.write(record_row(case, sn, elapsed_time, loop, output, stack_trace, time.time()))
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+
+def _md(value):
+    return str(value).replace('|', '\\|').replace('\n', ' ')
+
+
+class MarkdownEmitter(Emitter):
+    """The run summary as Markdown tables, from the aggregates"""
+
+    def finish(self, model):
+        fp = self._open()
+        fp.write('# {0}\n\n{1}\n\n'.format(_md(model.title), _md(model.summary)))
+        fp.write('| Attribute | Value |\n| --- | --- |\n')
+        for key, value in model.attributes.items():
+            if value:
+                fp.write('| {0} | {1} |\n'.format(_md(key), _md(value)))
+        fp.write('\n## Summary\n\n| Total | {0} | Passing Rate |\n'.format(' | '.join(model.counts)))
+        fp.write('|{0}\n'.format(' --- |' * (len(model.counts) + 2)))
+        fp.write('| {0} | {1} | {2} |\n'.format(
+            model.total, ' | '.join(str(count) for count in model.counts.values()), model.passrate))
+        fp.write('\n## Results\n\n| Test Case | Status | Iterations | Pass | Fail | Error | Skip '
+                 '| Mean (ms) | P99 (ms) | Max (ms) | Loop |\n')
+        fp.write('|{0}\n'.format(' --- |' * 11))
+        for summary in model.cases:
+            np, nf, ne, ns, nc = summary.counts
+            n, _ = model.case_status(summary)
+            histogram = model.latency.histograms.get(summary.case.test_id)
+            if histogram is not None:
+                mean, p99, max_ = histogram.mean, histogram.percentile(99), histogram.max
+            else:
+                mean = p99 = max_ = None
+            fp.write('| {0} | {1} | {2} | {3} | {4} | {5} | {6} | {7} | {8} | {9} | {10} |\n'.format(
+                _md(summary.case.test_id), STATUS[n], summary.iterations, np + nc, nf, ne, ns,
+                ns_to_ms(mean), ns_to_ms(p99), ns_to_ms(max_), summary.last_loop))
+
+
+class CsvEmitter(Emitter):
+    """A row per record: the test case, status, elapsed time, loop and the last line of the message"""
+
+    records = True
+    header = ('class_name', 'method_name', 'test_id', 'status', 'elapsed_time_ns', 'loop', 'message')
+
+    def start(self, model):
+        self._writer = csv.writer(self._open(newline=''))
+        self._writer.writerow(self.header)
+
+    def add_record(self, record, output, stack_trace):
+        case = record.case
+        message = stack_trace.strip('\n').split('\n')[-1] if stack_trace else ''
+        self._writer.writerow((case.class_name, case.method_name, case.test_id, STATUS[record.status],
+                               record.elapsed_time, record.loop, message))
+
+
+# ===================================================================
+# --- formats
+# ===================================================================
+def _html_emitters(runner):
+    if runner.report_mode == 'aggregate':
+        return [HtmlEmitter(runner.report_detail_html),
+                HtmlEmitter(runner.report_html, aggregate=True, detail_path=runner.report_detail_html)]
+    return [HtmlEmitter(runner.report_html)]
+
+
+def _report_path(runner, extension):
+    return os.path.splitext(runner.report_html)[0] + extension
+
+
+# format name -> callable(runner) returning the emitters of the format
+EMITTERS = collections.OrderedDict([
+    ('html', _html_emitters),
+    ('digest', lambda runner: [DigestEmitter(runner.report_digest_html)]),
+    ('xml', lambda runner: [JUnitXmlEmitter(runner.result_xml)]),
+    ('json', lambda runner: [JsonEmitter(runner.result_json)]),
+    ('ndjson', lambda runner: [NdjsonEmitter(runner.result_ndjson)]),
+    ('markdown', lambda runner: [MarkdownEmitter(_report_path(runner, '.md'))]),
+    ('csv', lambda runner: [CsvEmitter(_report_path(runner, '.csv'))]),
+])
+
+
+def register_emitter(name, factory):
+    """
+    Plug in an output format
+    :param name: the format name, in StressRunner(report_formats=...)
+    :param factory: callable(runner) returning a list of Emitter
+    :return:
+    """
+    EMITTERS[name] = factory
+
+
+def create_emitters(runner, formats):
+    """
+    :param runner: StressRunner
+    :param formats: the format names
+    :return: list of Emitter
+    """
+    unknown = [name for name in formats if name not in EMITTERS]
+    if unknown:
+        raise ValueError("unknown report formats {0}, expected some of {1}".format(unknown, list(EMITTERS)))
+    emitters = []
+    for name in formats:
+        emitters.extend(EMITTERS[name](runner))
+    return emitters
@@ -93,6 +93,12 @@ REPORT_TEMPLATE = r"""
             border: 1px solid #777;
         }
 
+        #latency_table {
+            width: 80%%;
+            border-collapse: collapse;
+            border: 1px solid #777;
+        }
+
         #result_table {
             width: 80%%;
             border-collapse: collapse;
@@ -120,6 +126,11 @@ REPORT_TEMPLATE = r"""
             padding: 2px;
         }
 
+        #latency_table td {
+            border: 1px solid #777;
+            padding: 2px;
+        }
+
         #result_table td {
             border: 1px solid #777;
             padding: 2px;
@@ -249,27 +260,125 @@ REPORT_TEMPLATE = r"""
     </table>
     </br>
 
+    <!-- latency_table -->
+    <b> <span lang="EN-US" style="font-size:14.0pt">Latency (ms):</span> </b>
+    <table id='latency_table' class="table table-condensed table-bordered table-hover">
+        <tr id='latency_table_header' class="text-center success" style="font-weight: bold;font-size: 14px;">
+            <td align='center'>Test Case</td>
+            <td align='center'>Count</td>
+            <td align='center'>Min</td>
+            <td align='center'>Mean</td>
+            <td align='center'>StdDev</td>
+            <td align='center'>P50</td>
+            <td align='center'>P90</td>
+            <td align='center'>P99</td>
+            <td align='center'>P99.9</td>
+            <td align='center'>Max</td>
+        </tr>
+        <!-- latency of each test case -->
+        %(Latency)s
+    </table>
+    </br>
+
     <!-- case_results_table -->
     <b> <span lang="EN-US" style="font-size:14.0pt">Results:</span> </b>
     <table id='result_table' class="table table-condensed table-bordered table-hover">
-        <colgroup>
+        %(ResultHeader)s
+        <!-- test case list -->
+        %(Results)s
+    </table>
+</body>
+
+</html>
+"""
+
+# header of the result table, one row per iteration, with the columns of its colgroup
+RESULT_HEADER = r"""<colgroup>
             <col align='left' />
             <col align='right' />
             <col align='right' />
             <col align='right' />
+        </colgroup>
+        <tr id='case_table_header' class="text-center success" style="font-weight: bold;font-size: 14px;">
+            <td align='center'>Test Group/Case</td>
+            <td align='center'>Status</td>
+            <td align='center'>Elapsed Time</td>
+            <td align='center'>Loop</td>
+        </tr>"""
+
+# header of the aggregated result table, one row per test case, with the columns of its colgroup
+AGGREGATE_RESULT_HEADER = r"""<colgroup>
+            <col align='left' />
+            <col align='right' />
+            <col align='right' />
+            <col align='right' />
+            <col align='right' />
+            <col align='right' />
+            <col align='right' />
+            <col align='right' />
+            <col align='right' />
             <col align='right' />
             <col align='right' />
         </colgroup>
         <tr id='case_table_header' class="text-center success" style="font-weight: bold;font-size: 14px;">
             <td align='center'>Test Group/Case</td>
             <td align='center'>Status</td>
-            <td align='center'>Elapsed Time</td>
+            <td align='center'>Iterations</td>
+            <td align='center'>Pass</td>
+            <td align='center'>Fail</td>
+            <td align='center'>Error</td>
+            <td align='center'>Skip</td>
+            <td align='center'>Mean (ms)</td>
+            <td align='center'>P99 (ms)</td>
+            <td align='center'>Max (ms)</td>
             <td align='center'>Loop</td>
+        </tr>"""
+
+# the mail body: a compact digest of the run, the full report is attached
+DIGEST_TEMPLATE = r"""<!DOCTYPE html>
+<html>
+<head>
+    <meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+    <title>%(Title)s</title>
+</head>
+<body style="font-family: verdana, arial, helvetica, sans-serif; font-size: 13px;">
+    <h2 style="color: %(TitleColor)s;">%(Title)s</h2>
+    <p>%(Summary)s</p>
+    <table cellpadding="3" style="border-collapse: collapse;">
+        <tr><td><b>Start</b></td><td>%(Start)s</td></tr>
+        <tr><td><b>End</b></td><td>%(End)s</td></tr>
+        <tr><td><b>Elapsed</b></td><td>%(Elapsed)s</td></tr>
+        <tr><td><b>Location</b></td><td>%(Location)s</td></tr>
+        <tr><td><b>Report</b></td><td>%(Report)s</td></tr>
+        <tr><td><b>Result Log</b></td><td>%(ResultLog)s</td></tr>
+    </table>
+
+    <h3>Summary</h3>
+    <table border="1" cellpadding="4" style="border-collapse: collapse; text-align: center;">
+        <tr style="font-weight: bold;">
+            <td>Total</td><td>Pass</td><td>Fail</td><td>Error</td><td>Skip</td><td>Cancel</td><td>Passing Rate</td>
+        </tr>
+        <tr>
+            <td>%(Total)s</td><td>%(Pass)s</td><td>%(Fail)s</td><td>%(Error)s</td><td>%(Skip)s</td>
+            <td>%(Cancel)s</td><td>%(Passrate)s</td>
         </tr>
-        <!-- test case list -->
-        %(Results)s
     </table>
-</body>
 
+    <h3>Top Failures</h3>
+    <table border="1" cellpadding="4" style="border-collapse: collapse;">
+        <tr style="font-weight: bold;">
+            <td>Test Case</td><td>Failures</td><td>Iterations</td><td>First Failure</td>
+        </tr>
+        %(Failures)s
+    </table>
+
+    <h3>Latency (ms)</h3>
+    <table border="1" cellpadding="4" style="border-collapse: collapse; text-align: right;">
+        <tr style="font-weight: bold; text-align: center;">
+            <td>Test Case</td><td>Count</td><td>P50</td><td>P90</td><td>P99</td><td>Max</td>
+        </tr>
+        %(Latency)s
+    </table>
+</body>
 </html>
-"""
\ No newline at end of file
+"""
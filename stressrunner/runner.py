@@ -11,7 +11,7 @@
 # |____/ \__|_|  \___||___/___/ |_| \_\\__,_|_| |_|_| |_|\___|_|
 
 """StressRunner
-Require: python3+
+Require: python3.7+
 
 Description and Quick Start:
 A TestRunner for use with the Python unit testing framework. It
@@ -30,24 +30,27 @@ StressRunner is a counterpart to unittest's TextTestRunner. E.g.
     )
 """
 
-import logging
-import coloredlogs
+import collections
 import copy
+import functools
+import threading
 import re
 import os
 import sys
 import platform
 import time
 import datetime
-import io
 import socket
 import traceback
-from xml.sax import saxutils
-from xml.dom import minidom
 import unittest
 
-from stressrunner import mail
-from stressrunner.report import REPORT_TEMPLATE
+# the mail, report template and xml modules are imported when used,
+# keeps the import of stressrunner fast, e.g. for the worker processes
+from stressrunner.loop import CaseLoop, loop_suite, new_suite
+from stressrunner.store import ResultStore
+from stressrunner.capture import CaptureBuffer, SPILL_SUFFIXES, spill_file_name, remove_spill_files, fd_capture
+from stressrunner.stats import LatencyStats
+from stressrunner.logs import get_default_logger, enable_async_logging
 
 # =============================
 # --- Global
@@ -61,6 +64,9 @@ PY2 = sys.version_info[0] == 2
 
 TESTER = __author__
 REPORT_TITLE = "Test Report"
+REPORT_BUFFER_SIZE = 1024 * 1024  # chunk size of the report writes
+REPORT_FORMATS = ('html', 'digest', 'xml')  # the default reports, see render.EMITTERS
+RECENT_RESULTS = 100  # (test, message) kept in each outcome list of _TestResult, all the records are in the store
 STATUS = {
     0: 'PASS',
     1: 'FAIL',
@@ -87,20 +93,77 @@ class MailInfo(object):
         self.attachments = attachments or []
 
 
-def get_local_ip():
+HOST_LOOKUP_TIMEOUT = 2  # seconds of the DNS lookup of the local ip
+_local_host = {}  # cached host identity: hostname, ip
+
+
+def _call_with_timeout(func, timeout, *args):
+    """Call func in a daemon thread, None if it raised or did not return in time"""
+    result = []
+
+    def target():
+        try:
+            result.append(func(*args))
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=target, name='host-lookup')
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    return result[0] if result else None
+
+
+def _udp_local_ip():
+    """The ip of the default route interface, connect() a UDP socket sends no packet"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(('10.255.255.255', 1))
+        return sock.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+def get_local_ip(timeout=HOST_LOOKUP_TIMEOUT):
     """
     Get the local ip address --linux/windows
+    Resolved at the first call then cached: $STRESSRUNNER_IP if set, else the
+    DNS lookup of the hostname within timeout, else the UDP connect fallback.
+    :param timeout: seconds to wait for the DNS lookup
     :return:(char) local_ip
     """
-    return socket.gethostbyname(socket.gethostname())
+    if 'ip' not in _local_host:
+        ip = os.environ.get('STRESSRUNNER_IP') or \
+            _call_with_timeout(socket.gethostbyname, timeout, get_local_hostname()) or \
+            _udp_local_ip() or '127.0.0.1'
+        _local_host['ip'] = ip
+    return _local_host['ip']
 
 
 def get_local_hostname():
     """
-    Get the local ip address --linux/windows
+    Get the local hostname --linux/windows
+    Cached, $STRESSRUNNER_HOSTNAME if set
     :return:
     """
-    return socket.gethostname()
+    if 'hostname' not in _local_host:
+        _local_host['hostname'] = os.environ.get('STRESSRUNNER_HOSTNAME') or socket.gethostname()
+    return _local_host['hostname']
+
+
+class _LazyHostAttribute(object):
+    """
+    Class attribute computed at the first access instead of at import,
+    can be overridden by setting it on the instance
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __get__(self, instance, owner):
+        return self.func()
 
 
 def seconds_to_string(seconds):
@@ -108,6 +171,26 @@ def seconds_to_string(seconds):
     return "{:0>8}".format(str(datetime.timedelta(seconds=seconds)))
 
 
+def ns_to_string(ns):
+    """
+    Nanoseconds to string, e.g. 00:00:01.002003004
+    :param ns: int
+    :return:
+    """
+    seconds, ns = divmod(int(ns), 1000000000)
+    return "{0}.{1:09d}".format(seconds_to_string(seconds), ns)
+
+
+def ns_to_seconds(ns):
+    """
+    Nanoseconds to the decimal seconds string, without float rounding, e.g. 1.002003004
+    :param ns: int
+    :return:
+    """
+    seconds, ns = divmod(int(ns), 1000000000)
+    return "{0}.{1:09d}".format(seconds, ns)
+
+
 def escape(value):
     """
     Escape a single value of a URL string or a query parameter. If it is a list
@@ -157,35 +240,56 @@ def escape(value):
 
 
 class OutputRedirector(object):
-    """ Wrapper to redirect stdout or stderr """
+    """
+    Wrapper to redirect stdout or stderr.
+    fp is per thread, so concurrent test cases capture their own output,
+    threads never set fp (e.g. started by a test case) use the last one set.
+    fp is a text buffer (CaptureBuffer), the output is kept as str and
+    copied into it as is, no per write encoding.
+    :param fp: the text stream to capture into
+    :param filtered: True - capture only the 'ERROR:'/'DESCRIBE:' lines without
+                     the color codes, False - capture everything without filtering
+    """
 
-    def __init__(self, fp):
-        self.fp = fp
+    def __init__(self, fp, filtered=True):
+        self._fp = fp
+        self._local = threading.local()
         self.__console__ = sys.stdout
+        self.filtered = filtered
+        # decided once for the platform
+        if WINDOWS:
+            self._error_pattern = re.compile(r'[^a]\W\d+[m]')
+        elif POSIX:
+            self._error_pattern = re.compile(r'[^a]\W\d+[m]\W?')
+        else:
+            self._error_pattern = None
+        self._describe_pattern = re.compile(r'.+DESCRIBE:\W+\d+[m]\s')
+
+    @property
+    def fp(self):
+        return getattr(self._local, 'fp', self._fp)
+
+    @fp.setter
+    def fp(self, fp):
+        self._fp = fp
+        self._local.fp = fp
 
     def write(self, s):
-        if 'ERROR:' in s:
-            if WINDOWS:
-                pattern = re.compile(r'[^a]\W\d+[m]')
-            elif POSIX:
-                pattern = re.compile(r'[^a]\W\d+[m]\W?')
-            else:
-                pattern = re.compile(r'')
-            s_mesg = pattern.sub('', s + "\n")
-            s_mesg = s_mesg.encode(encoding="utf-8")
-            self.fp.write(s_mesg)
-
-        if 'DESCRIBE:' in s:
-            pattern = re.compile(r'.+DESCRIBE:\W+\d+[m]\s')
-            s_mesg = pattern.sub('', s + "\n")
-            s_mesg = s_mesg.encode(encoding="utf-8")
-            self.fp.write(s_mesg)
-        self.__console__.write(str(s))
+        if not self.filtered:
+            self.fp.write(s)
+        else:
+            if 'ERROR:' in s:
+                if self._error_pattern is None:
+                    self.fp.write(s + "\n")
+                else:
+                    self.fp.write(self._error_pattern.sub('', s + "\n"))
+            if 'DESCRIBE:' in s:
+                self.fp.write(self._describe_pattern.sub('', s + "\n"))
+        self.__console__.write(s)
 
     def writelines(self, lines):
-        if 'ERROR' in lines:
-            self.fp.writelines(lines)
-        self.__console__.write(str(lines))
+        for line in lines:
+            self.write(line)
 
     def flush(self):
         self.fp.flush()
@@ -198,6 +302,28 @@ STDOUT_LINE = '\nStdout:\n%s'
 STDERR_LINE = '\nStderr:\n%s'
 
 
+def synchronized(func):
+    """Run the method with self._lock held"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class _CaseState(threading.local):
+    """State of the running test case, one per thread"""
+
+    def __init__(self):
+        super(_CaseState, self).__init__()
+        self.tc_loop = 0  # passed iterations of the running test case
+        self.tc_id = None  # id of the running test case
+        self.running_test = None  # the test case between startTest and add*
+        self.tc_start_ns = time.perf_counter_ns()  # test case start, monotonic
+        self.stdout_buffer = None
+        self.stderr_buffer = None
+
+
 class _TestResult(unittest.TestResult):
     """
     note: _TestResult is a pure representation of results.
@@ -207,19 +333,26 @@ class _TestResult(unittest.TestResult):
 
     msg = "[{0:^6}] {1} --Loop: {2} --ElapsedTime: {3}"
 
-    def __init__(self, logger, descriptions=None, verbosity=2, fail_exit=True):
+    def __init__(self, logger, descriptions=None, verbosity=2, fail_exit=True, store=None,
+                 capture_head=65536, capture_tail=65536, capture_dir=None, capture_fd=False):
         """
         _TestResult inherit from unittest TestResult
         :param logger: default is logging.get_logger()
         :param verbosity: 1-dots, 2-showStatus, 3-showAll
         :param fail_exit: exit all test if any tc failed/error/canceled
+        :param store: ResultStore to save the records, default a temporary one
+        :param capture_head: characters kept from the start of each test case output
+        :param capture_tail: characters kept from the end of each test case output
+        :param capture_dir: spill the full output exceeding head + tail to a file per test case
+                            in this dir, None to drop it
+        :param capture_fd: capture the file descriptors 1 and 2 instead of sys.stdout/sys.stderr,
+                           including the output of subprocesses and C extensions, not filtered
         """
         super(_TestResult, self).__init__()
         self.logger = logger
         self.descriptions = descriptions
         self.verbosity = verbosity
         self.fail_exit = fail_exit
-        self.tc_loop_limit = 1
 
         self.showAll = verbosity >= 3
         self.showStatus = verbosity == 2
@@ -227,16 +360,29 @@ class _TestResult(unittest.TestResult):
 
         self.stdout0 = None
         self.stderr0 = None
-        self._stdout_buffer = None
-        self._stderr_buffer = None
+        self._capturing = 0  # test cases capturing output now
+        self.capture_head = capture_head
+        self.capture_tail = capture_tail
+        self.capture_dir = capture_dir
+        self.capture_fd = capture_fd
         self._original_stdout = sys.stdout
         self._original_stderr = sys.stderr
         self.outputBuffer = ''
 
         # extend more results
-        self.successes = []
-        self.canceled = []
-        self.all = []  # (status, test, output, stack_trace, elapsed_time, loop)
+        # the recent outcomes only, may loop forever: count with the *_count attributes
+        self.successes = collections.deque(maxlen=RECENT_RESULTS)
+        self.failures = collections.deque(maxlen=RECENT_RESULTS)
+        self.errors = collections.deque(maxlen=RECENT_RESULTS)
+        self.skipped = collections.deque(maxlen=RECENT_RESULTS)
+        self.canceled = collections.deque(maxlen=RECENT_RESULTS)
+        # (status, test, output, stack_trace, elapsed_time, loop), streamed to disk
+        self.all = store if store is not None else ResultStore()
+        # latency histogram of each test id, the passed/failed/error iterations
+        self.latency = LatencyStats()
+        self.metrics = None  # LiveMetrics fed with every record
+        self.checkpoint = None  # callable(result) after every record
+        self.exporter = None  # RecordExporter writing every record to NDJSON
         self.success_count = 0
         self.failure_count = 0
         self.error_count = 0
@@ -244,38 +390,89 @@ class _TestResult(unittest.TestResult):
         self.canceled_count = 0
 
         self.ts_loop = 1
-        self.tc_loop = 0
-        self.tc_start_time = datetime.datetime.now()  # test case start time
-        self.ts_start_time = datetime.datetime.now()  # test suite start time
+        self.ts_start_ns = time.perf_counter_ns()  # test suite start, monotonic
+        # the test case state is per thread, test cases could run concurrently
+        self._case = _CaseState()
+        self._lock = threading.RLock()
+
+    @property
+    def tc_loop(self):
+        return self._case.tc_loop
+
+    @tc_loop.setter
+    def tc_loop(self, value):
+        self._case.tc_loop = value
+
+    @property
+    def running_test(self):
+        return self._case.running_test
+
+    @running_test.setter
+    def running_test(self, test):
+        self._case.running_test = test
+
+    @property
+    def tc_start_ns(self):
+        return self._case.tc_start_ns
+
+    @tc_start_ns.setter
+    def tc_start_ns(self, value):
+        self._case.tc_start_ns = value
 
     @staticmethod
     def get_description(test):
         return test.shortDescription() or str(test)
 
-    def _setup_output(self):
-        if self._stderr_buffer is None:
-            self._stderr_buffer = io.BytesIO()
-            self._stdout_buffer = io.BytesIO()
-            self._stdout_buffer.seek(0)
-            self._stdout_buffer.truncate()
-            self._stderr_buffer.seek(0)
-            self._stderr_buffer.truncate()
-        stdout_redirector.fp = self._stdout_buffer
-        stderr_redirector.fp = self._stderr_buffer
-        sys.stdout = stdout_redirector
-        sys.stderr = stderr_redirector
-
-    def _restore_output(self, test):
+    def _setup_output(self, test):
+        case = self._case
+        if case.stderr_buffer is None:
+            case.stderr_buffer = CaptureBuffer(self.capture_head, self.capture_tail)
+            case.stdout_buffer = CaptureBuffer(self.capture_head, self.capture_tail)
+        if self.capture_dir is not None:
+            # one file per test case, and per thread looping it concurrently
+            thread = threading.current_thread()
+            name = spill_file_name(test.id() if thread is threading.main_thread() else thread.name)
+            case.stdout_buffer.spill_path = os.path.join(self.capture_dir, name + SPILL_SUFFIXES[0])
+            case.stderr_buffer.spill_path = os.path.join(self.capture_dir, name + SPILL_SUFFIXES[1])
+        if self.capture_fd:
+            # the fds are process wide, the output goes to the last started test case
+            for fd, buffer in ((1, case.stdout_buffer), (2, case.stderr_buffer)):
+                capture = fd_capture(fd)
+                capture.start()
+                capture.set_target(buffer)
+            return
+        stdout_redirector.fp = case.stdout_buffer
+        stderr_redirector.fp = case.stderr_buffer
+        with self._lock:
+            self._capturing += 1
+            sys.stdout = stdout_redirector
+            sys.stderr = stderr_redirector
+
+    def _restore_output(self, test, failed=False):
         """
         Disconnect output redirection and return buffer.
         Safe to call multiple times.
+        :param failed: the test case failed or errored, end the output with its name
+        :return: output, test case elapsed ns, test suite elapsed ns
         """
-        # remove the running record
-        if len(self.all) > 0:
-            self.all.pop(-1)
-
-        output = sys.stdout.fp.getvalue().decode('UTF-8')
-        error = sys.stderr.fp.getvalue().decode('UTF-8')
+        case = self._case
+        if case.running_test is None:
+            # already restored, e.g. after a failed subtest, or a fixture error without startTest
+            tc_stop_ns = time.perf_counter_ns()
+            output_info = "{test_info}:".format(test_info=test) if failed else ''
+            return output_info, tc_stop_ns - case.tc_start_ns, tc_stop_ns - self.ts_start_ns
+        case.running_test = None
+        if self.capture_fd:
+            out_fp, err_fp = case.stdout_buffer, case.stderr_buffer
+            self._original_stdout.flush()
+            self._original_stderr.flush()
+            for fd in (1, 2):
+                fd_capture(fd).sync()
+                fd_capture(fd).set_target(None)
+        else:
+            out_fp, err_fp = stdout_redirector.fp, stderr_redirector.fp
+        output = out_fp.getvalue()
+        error = err_fp.getvalue()
         output_info = ''
         if output:
             if not output.endswith('\n'):
@@ -287,28 +484,35 @@ class _TestResult(unittest.TestResult):
                 error += '\n'
             output_info += error
             # self._original_stderr.write(STDERR_LINE % error)
-        sys.stdout = self._original_stdout
-        sys.stderr = self._original_stderr
-        self._stdout_buffer.seek(0)
-        self._stdout_buffer.truncate()
-        self._stderr_buffer.seek(0)
-        self._stderr_buffer.truncate()
-
-        tc_stop_time = datetime.datetime.now()
-        tc_elapsedtime = (tc_stop_time - self.tc_start_time).seconds
-        ts_elapsedtime = (tc_stop_time - self.ts_start_time).seconds
-        for test_item, err in (self.errors + self.failures):
-            if test_item == test:
-                output_info += "{test_info}:".format(test_info=test)
+        if not self.capture_fd:
+            with self._lock:
+                # keep redirecting until the last concurrent test case finished
+                self._capturing = max(self._capturing - 1, 0)
+                if self._capturing == 0:
+                    sys.stdout = self._original_stdout
+                    sys.stderr = self._original_stderr
+        out_fp.clear()
+        err_fp.clear()
+
+        tc_stop_ns = time.perf_counter_ns()
+        tc_elapsedtime = tc_stop_ns - case.tc_start_ns
+        ts_elapsedtime = tc_stop_ns - self.ts_start_ns
+        if failed:
+            output_info += "{test_info}:".format(test_info=test)
 
         return output_info, tc_elapsedtime, ts_elapsedtime
 
+    @synchronized
     def startTest(self, test):
+        case = self._case
+        if test.id() != case.tc_id:
+            case.tc_id = test.id()
+            case.tc_loop = 0
         self.logger.info("[START ] {0} -- Loop: {1}".format(str(test), self.ts_loop))
-        self.all.append((4, test, '', '', '', self.ts_loop))
-        self.tc_start_time = datetime.datetime.now()
+        case.running_test = test
+        case.tc_start_ns = time.perf_counter_ns()
         unittest.TestResult.startTest(self, test)
-        self._setup_output()
+        self._setup_output(test)
 
     def stopTest(self, test):
         """
@@ -325,6 +529,7 @@ class _TestResult(unittest.TestResult):
         # unittest.TestResult.stopTest(self, test)
         # self.complete_output(test)
 
+    @synchronized
     def addSuccess(self, test):
         sn = 0
         status = STATUS[sn]
@@ -334,10 +539,10 @@ class _TestResult(unittest.TestResult):
         unittest.TestResult.addSuccess(self, test)
 
         output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test)
-        self.all.append((sn, test, output, '', tc_elapsedtime, self.ts_loop))
+        self._add_record((sn, test, output, '', tc_elapsedtime, self.ts_loop))
         if self.showAll:
-            self.logger.info(self.msg.format(status, str(test), self.ts_loop, tc_elapsedtime))
-            self.logger.info("Total Elapsedtime: {0}".format(ts_elapsedtime))
+            self.logger.info(self.msg.format(status, str(test), self.ts_loop, ns_to_string(tc_elapsedtime)))
+            self.logger.info("Total Elapsedtime: {0}".format(ns_to_string(ts_elapsedtime)))
         elif self.showStatus:
             self.logger.info(status)
         elif self.dots:
@@ -345,31 +550,18 @@ class _TestResult(unittest.TestResult):
         else:
             pass
 
-        # calculate retry or not
-        if (self.tc_loop_limit == 0) or (self.tc_loop_limit > self.tc_loop):
-            retry_flag = True
-        else:
-            retry_flag = False
-
-        # recursive retry test
-        if retry_flag:
-            test = copy.copy(test)
-            self.tc_start_time = datetime.datetime.now()
-            test(self)
-        else:
-            self.tc_loop = 0  # update for next test case loop=0
-
+    @synchronized
     def addError(self, test, err):
         sn = 2
         status = STATUS[sn]
-        self.failure_count += 1
+        self.error_count += 1
         unittest.TestResult.addError(self, test, err)
         _, str_e = self.errors[-1]
-        output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test)
-        self.all.append((sn, test, output, str_e, tc_elapsedtime, self.ts_loop))
+        output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test, failed=True)
+        self._add_record((sn, test, output, str_e, tc_elapsedtime, self.ts_loop))
         if self.showAll:
-            self.logger.critical(self.msg.format(status, str(test), self.ts_loop, tc_elapsedtime))
-            self.logger.info("Total Elapsedtime: {0}".format(ts_elapsedtime))
+            self.logger.critical(self.msg.format(status, str(test), self.ts_loop, ns_to_string(tc_elapsedtime)))
+            self.logger.info("Total Elapsedtime: {0}".format(ns_to_string(ts_elapsedtime)))
         elif self.showStatus:
             self.logger.critical(status)
         else:
@@ -379,17 +571,18 @@ class _TestResult(unittest.TestResult):
             self.logger.warning("Stop all test because test {} meet Error ...".format(test))
             self.stop()
 
+    @synchronized
     def addFailure(self, test, err):
         sn = 1
         status = STATUS[sn]
         self.failure_count += 1
         unittest.TestResult.addFailure(self, test, err)
         _, str_e = self.failures[-1]
-        output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test)
-        self.all.append((sn, test, output, str_e, tc_elapsedtime, self.ts_loop))
+        output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test, failed=True)
+        self._add_record((sn, test, output, str_e, tc_elapsedtime, self.ts_loop))
         if self.showAll:
-            self.logger.critical(self.msg.format(status, str(test), self.ts_loop, tc_elapsedtime))
-            self.logger.info("Total Elapsedtime: {0}".format(ts_elapsedtime))
+            self.logger.critical(self.msg.format(status, str(test), self.ts_loop, ns_to_string(tc_elapsedtime)))
+            self.logger.info("Total Elapsedtime: {0}".format(ns_to_string(ts_elapsedtime)))
         elif self.showStatus:
             self.logger.critical(status)
         else:
@@ -399,38 +592,54 @@ class _TestResult(unittest.TestResult):
             self.logger.warning("Stop all test because test {} FAILED ...".format(test))
             self.stop()
 
+    def addSubTest(self, test, subtest, err):
+        """
+        A failed subtest fails its test case, unittest does not call addSuccess then:
+        record each failed subtest as a failure/error of the test case
+        """
+        if err is None:
+            return
+        if issubclass(err[0], test.failureException):
+            self.addFailure(test, err)
+        else:
+            self.addError(test, err)
+
+    @synchronized
     def addSkip(self, test, reason):
         sn = 3
         status = STATUS[3]
         self.skipped_count += 1
         unittest.TestResult.addSkip(self, test, reason)
         output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test)
-        self.all.append((sn, test, output, reason, tc_elapsedtime, self.ts_loop))
+        self._add_record((sn, test, output, reason, tc_elapsedtime, self.ts_loop))
         if self.showAll:
-            self.logger.warning(self.msg.format(status, str(test), self.ts_loop, tc_elapsedtime))
-            self.logger.info("Total Elapsedtime: {0}".format(ts_elapsedtime))
+            self.logger.warning(self.msg.format(status, str(test), self.ts_loop, ns_to_string(tc_elapsedtime)))
+            self.logger.info("Total Elapsedtime: {0}".format(ns_to_string(ts_elapsedtime)))
         elif self.showStatus:
             self.logger.warning(status)
         else:
             self.logger.warning("\nS")
         self.tc_loop = 0
 
+    @synchronized
     def add_canceled(self):
         sn = 4
         status = STATUS[sn]
         self.canceled_count += 1
-        if len(self.all) > 0:
-            test = self.all[-1][1]
-        else:
-            test = ''
-        self.all.pop(-1)
+        test = self.running_test
+        if test is None:
+            # nothing running here, e.g. canceled between worker tasks
+            self.logger.info(self.msg.format(status, '', self.ts_loop, 0))
+            if self.fail_exit:
+                self.stop()
+            return
         self.canceled.append((test, 'Canceled'))
 
         output, tc_elapsedtime, ts_elapsedtime = self._restore_output(test)
-        self.all.append((sn, test, output, '', tc_elapsedtime, self.ts_loop))
+        self._add_record((sn, test, output, '', tc_elapsedtime, self.ts_loop))
         if self.showAll:
-            self.logger.info(self.msg.format(status, str(test), self.ts_loop, tc_elapsedtime))
-            self.logger.info("Total Elapsedtime: {0}".format(ts_elapsedtime))
+            self.logger.info(self.msg.format(status, str(test), self.ts_loop, ns_to_string(tc_elapsedtime)))
+            self.logger.info("Total Elapsedtime: {0}".format(ns_to_string(ts_elapsedtime)))
         elif self.showStatus:
             self.logger.info(status)
         elif self.dots:
@@ -442,6 +651,91 @@ class _TestResult(unittest.TestResult):
             self.logger.warning("Stop all test because test {} CANCELED ...".format(test))
             self.stop()
 
+    def _add_record(self, record):
+        """
+        Save a finished record
+        :param record: (status, test, output, stack_trace, elapsed_time(ns), loop)
+        :return:
+        """
+        sn, test, _, _, elapsed_time, _ = record
+        if sn in (0, 1, 2):
+            self.latency.add(test.id(), elapsed_time or 0)
+        if self.metrics is not None:
+            self.metrics.add(sn, test.id(), elapsed_time or 0)
+        self.all.append(record)
+        if self.exporter is not None:
+            self.exporter.add(self.all.case_info(test), record)
+        if self.checkpoint is not None:
+            self.checkpoint(self)
+
+    @synchronized
+    def merge_record(self, record):
+        """
+        Merge a record finished outside this result, e.g. in a worker process
+        :param record: (status, test, output, stack_trace, elapsed_time, loop)
+        :return:
+        """
+        sn, test, _, stack_trace, _, _ = record
+        self.testsRun += 1
+        if sn == 0:
+            self.success_count += 1
+            self.successes.append((test, ''))
+        elif sn == 1:
+            self.failure_count += 1
+            self.failures.append((test, stack_trace))
+        elif sn == 2:
+            self.error_count += 1
+            self.errors.append((test, stack_trace))
+        elif sn == 3:
+            self.skipped_count += 1
+            self.skipped.append((test, stack_trace))
+        else:
+            self.canceled_count += 1
+            self.canceled.append((test, 'Canceled'))
+        self._add_record(record)
+        if sn in (1, 2) and self.fail_exit:
+            self.logger.warning("Stop all test because test {} {} ...".format(test, STATUS[sn]))
+            self.stop()
+
+    def restore(self):
+        """Count the records reloaded into the store, resuming an interrupted run"""
+        for res in self.all:
+            sn = res.status
+            self.testsRun += 1
+            if sn == 0:
+                self.success_count += 1
+            elif sn == 1:
+                self.failure_count += 1
+                self.failures.append((res.case, res.stack_trace))
+            elif sn == 2:
+                self.error_count += 1
+                self.errors.append((res.case, res.stack_trace))
+            elif sn == 3:
+                self.skipped_count += 1
+                self.skipped.append((res.case, res.stack_trace))
+            else:
+                self.canceled_count += 1
+                self.canceled.append((res.case, 'Canceled'))
+            if sn in (0, 1, 2):
+                self.latency.add(res.case.test_id, res.elapsed_time)
+
+    def wasSuccessful(self):
+        """The outcome lists keep the recent ones only, check the counters"""
+        return self.failure_count == self.error_count == 0 and not self.unexpectedSuccesses
+
+    def __repr__(self):
+        return "<%s.%s run=%i errors=%i failures=%i>" % (
+            self.__class__.__module__, self.__class__.__qualname__,
+            self.testsRun, self.error_count, self.failure_count)
+
+    def stop_capture(self):
+        """Restore the file descriptors captured with capture_fd"""
+        if self.capture_fd:
+            self._original_stdout.flush()
+            self._original_stderr.flush()
+            for fd in (1, 2):
+                fd_capture(fd).stop()
+
     def print_error_list(self, flavour, errors):
         for test, err in errors:
             self.logger.error("{0}: {1}\n{2}".format(flavour, self.get_description(test), err))
@@ -458,21 +752,59 @@ class StressRunner(object):
     stress stressrunner
     """
 
-    local_hostname = get_local_hostname()
-    local_ip = get_local_ip()
+    local_hostname = _LazyHostAttribute(get_local_hostname)
+    local_ip = _LazyHostAttribute(get_local_ip)
     separator1 = '=' * 70
     separator2 = '-' * 70
 
-    def __init__(self, report_html=None, result_xml=None, logger=None, loop=1, verbosity=2,
+    def __init__(self, report_html=None, result_xml=None, result_log=None, logger=None, loop=1, verbosity=2,
                  tester=TESTER, test_version=None, description=None, report_title=REPORT_TITLE,
-                 test_env=None, test_nodes=None):
+                 test_env=None, test_nodes=None, tc_loop=1, tc_duration=None, tc_stop=None,
+                 tc_concurrency=1, workers=1, deepcopy=False, report_mode='aggregate', failure_samples=3,
+                 output_filter=True, capture_head=65536, capture_tail=65536, capture_dir=None,
+                 capture_fd=False, async_logging=False, metrics_interval=None, metrics_port=None,
+                 checkpoint_records=None, checkpoint_interval=None, resume=False, report_formats=REPORT_FORMATS):
         """
         Stress runner
         Args:
             report_html: default ./report.html
+            result_log: the records log (JSON lines), default ./report.jsonl
             logger:
             loop: the max test loop
             verbosity: 2: show All
+            :param tc_loop: the max loop of each test case, 0 means no limit
+            :param tc_duration: the max seconds to loop each test case, None means no limit
+            :param tc_stop: callable(result) -> bool, stop looping the test case once it returns True
+            :param tc_concurrency: loop each test case on N threads concurrently
+            :param workers: run the test cases in a pool of N worker processes, 1 means run in this process
+            :param deepcopy: copy.deepcopy the suite for each loop, instead of creating fresh test cases
+            :param report_mode: 'aggregate' - one row per test case in report_html, with every
+                                iteration in the drill-down report <report_html>_detail.html,
+                                'detail' - one row per iteration in report_html
+            :param failure_samples: the first/last N failure messages of each case in the aggregated report
+            :param output_filter: capture only the 'ERROR:'/'DESCRIBE:' lines of the test case output,
+                                  False to capture all the output
+            :param capture_head: characters kept from the start of each test case output
+            :param capture_tail: characters kept from the end of each test case output
+            :param capture_dir: the dir of the full test case output exceeding head + tail,
+                                default <report_html>_output
+            :param capture_fd: capture the file descriptors 1/2 with os.dup2 instead of sys.stdout/sys.stderr,
+                               including the output of subprocesses and C extensions, not filtered
+            :param async_logging: emit the log records in a listener thread (QueueHandler/QueueListener),
+                                  the test cases never wait on the log I/O
+            :param metrics_interval: log a live metrics line (rate, failure rate, latency) every N seconds
+            :param metrics_port: serve the live metrics in the Prometheus text format at
+                                 http://127.0.0.1:<port>/metrics, 0 for any free port
+            :param checkpoint_records: rewrite the aggregated report_html and append to result_xml
+                                       every N records, so a killed run still leaves a report
+            :param checkpoint_interval: checkpoint at the first record after N seconds since the last one
+            :param resume: continue an interrupted run from the last completed loop journaled in result_log,
+                           the old and new records are merged in one report
+            :param report_formats: the reports rendered in one pass over the records, some of
+                                   'html', 'digest', 'xml', 'json', 'ndjson', 'markdown', 'csv' or the
+                                   formats plugged in with render.register_emitter. 'ndjson' - a JSON line
+                                   per record in <report_html>.ndjson, written during the run, 'json' - the
+                                   summary, rewritten at each checkpoint too
             :param tester:
             :param test_version:
             :param description:
@@ -487,8 +819,40 @@ class StressRunner(object):
             test_env = {}
         self.report_html = report_html or self.default_report_html
         self.result_xml = result_xml or self.default_result_xml
-        self.logger = logger or self.default_logger
+        self.result_log = result_log or os.path.splitext(self.report_html)[0] + '.jsonl'
+        self.report_detail_html = os.path.splitext(self.report_html)[0] + '_detail.html'
+        self.report_digest_html = os.path.splitext(self.report_html)[0] + '_digest.html'
+        self.result_json = os.path.splitext(self.report_html)[0] + '.json'
+        self.result_ndjson = os.path.splitext(self.report_html)[0] + '.ndjson'
+        if report_mode not in ('aggregate', 'detail'):
+            raise ValueError("report_mode should be 'aggregate' or 'detail', got {0!r}".format(report_mode))
+        self.report_mode = report_mode
+        self.failure_samples = failure_samples
+        self.output_filter = output_filter
+        self.capture_head = capture_head
+        self.capture_tail = capture_tail
+        self.capture_dir = capture_dir or os.path.splitext(self.report_html)[0] + '_output'
+        self.capture_fd = capture_fd
+        self.metrics_interval = metrics_interval
+        self.metrics_port = metrics_port
+        self.metrics = None
+        self.checkpoint_records = checkpoint_records
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoint_xml = None  # JUnitXmlCheckpoint
+        self._checkpoint_pending = 0  # records since the last checkpoint
+        self._checkpoint_time = time.monotonic()
+        self._checkpoint_xml_count = 0  # records in the XML checkpoint
+        self.resume = resume
+        self.report_formats = report_formats
+        if logger is None:
+            logger = get_default_logger(async_logging)
+        elif async_logging:
+            enable_async_logging(logger)
+        self.logger = logger
         self.loop = loop
+        self.case_loop = CaseLoop(tc_loop, tc_duration, tc_stop, tc_concurrency)
+        self.workers = workers
+        self.deepcopy = deepcopy
         self.verbosity = verbosity
         self.save_last_result = True
 
@@ -504,17 +868,17 @@ class StressRunner(object):
 
         # --------------- test status ---------------
         self.start_time = datetime.datetime.now()
+        self.start_ns = time.perf_counter_ns()  # monotonic, for the elapsed time
         self.stop_time = ''
-        self.elapsedtime = ''
+        self.test_status = 'RUNNING'
+        self.elapsedtime = 0  # ns
         self.passrate = ''
         self.summary = ''  # eg: "ALL 1, PASS 1, Passing rate: 100%"
 
     @property
     def default_logger(self):
-        log_format = '%(asctime)s %(name)s %(levelname)s: %(message)s'
-        sr_logger = logging.getLogger('StressRunner')
-        coloredlogs.install(logger=sr_logger, level=logging.DEBUG, fmt=log_format)
-        return sr_logger
+        """The StressRunner logger, set up once per process"""
+        return get_default_logger()
 
     @property
     def default_report_html(self):
@@ -524,45 +888,108 @@ class StressRunner(object):
     def default_result_xml(self):
         return os.path.join(os.getcwd(), 'result.xml')
 
-    def send_mail(self, m_from, m_to, host, user, password, port, tls):
+    def send_mail(self, m_from, m_to, host, user, password, port, tls, max_size=None):
+        """
+        Mail the digest of the report, with the report and the log attached,
+        queued and sent in the background on a pooled SMTP connection,
+        the pending mails are sent out at exit
+        :param max_size: the budget of each attachment in bytes, default mail.ATTACHMENT_MAX_SIZE
+        """
         if not m_to:
             return True
         self.logger.info("> Send mail to {} ...".format(m_to))
 
-        with open(self.report_html, 'rb') as f:
+        body_path = self.report_digest_html if os.path.isfile(self.report_digest_html) else self.report_html
+        with open(body_path, 'r', encoding='UTF-8') as f:
             content = f.read()
 
-        attachments = []
+        # gzip compressed, cut to a head/tail excerpt above max_size
+        attachments = [self.report_html]
         log_path = self.report_html.replace('.html', '.log')
-        if os.path.getsize(log_path) < 2048 * 1000:
+        if os.path.isfile(log_path):
             attachments.append(log_path)
-        # attachments.append(self.report_path)
 
-        mail.send_mail(self.report_title, content, m_from, m_to, host, user, password, port, tls, attachments)
+        from stressrunner import mail
+        if max_size is None:
+            max_size = mail.ATTACHMENT_MAX_SIZE
+        future = mail.send_mail(self.report_title, content, m_from, m_to, host, user, password, port, tls,
+                                attachments, block=False, max_size=max_size)
+        future.add_done_callback(self._mail_sent)
         return True
 
+    def _mail_sent(self, future):
+        if future.exception() is not None:
+            self.logger.error("Send mail failed: {0}".format(future.exception()))
+        else:
+            self.logger.info("Send mail done.")
+
     def run(self, test):
         """
         Run the given test case or test suite
         :param test: unittest.testSuite
         :return:
         """
-        _result = _TestResult(self.logger, self.verbosity)
+        from stressrunner.render import create_emitters
+        create_emitters(self, self.report_formats)  # check the formats before the run
+        _result = _TestResult(self.logger, self.verbosity,
+                              store=ResultStore(self.result_log, samples=self.failure_samples),
+                              capture_head=self.capture_head, capture_tail=self.capture_tail,
+                              capture_dir=self.capture_dir, capture_fd=self.capture_fd)
+        stdout_redirector.filtered = stderr_redirector.filtered = self.output_filter
+        if self.resume:
+            self._resume(_result)
+        else:
+            # the spill files are appended during the run, at stable paths
+            remove_spill_files(self.capture_dir)
+        formats = list(self.report_formats)
+        if 'ndjson' in formats:
+            # written during the run instead of at the end
+            from stressrunner.render import RecordExporter
+            formats.remove('ndjson')
+            _result.exporter = RecordExporter(self.result_ndjson)
+            _result.exporter.rewrite(_result.all)
+        if self.metrics_interval or self.metrics_port is not None:
+            from stressrunner.metrics import LiveMetrics
+            self.metrics = _result.metrics = LiveMetrics()
+            self.metrics.start(self.logger, self.metrics_interval, self.metrics_port)
+            if self.metrics.address is not None:
+                self.logger.info("Live metrics: http://{0}:{1}/metrics".format(*self.metrics.address))
+        if self.checkpoint_records or self.checkpoint_interval:
+            self._checkpoint_time = time.monotonic()
+            _result.checkpoint = self._maybe_checkpoint
         test_status = STATUS[2]  # 'ERROR'
         retry_flag = True
+        if self.loop and _result.ts_loop > self.loop:
+            # resumed a completed run, only write the reports
+            retry_flag = False
+            test_status = STATUS[1] if _result.failure_count + _result.error_count > 0 else STATUS[0]
+        pool = None
         try:
+            if self.workers > 1:
+                from stressrunner.parallel import WorkerPool
+                pool = WorkerPool(self.workers, test, self.case_loop, _result, self.deepcopy)
             while retry_flag:
                 # retry test suite by Loop
-                running_test = copy.deepcopy(test)
                 self.logger.info("Test Case List:")
-                for _test in running_test._tests:
+                for _test in test._tests:
                     self.logger.info(_test)
 
-                running_test(_result)
+                if pool is not None:
+                    pool.run(_result)
+                else:
+                    running_test = copy.deepcopy(test) if self.deepcopy else new_suite(test)
+                    running_test = loop_suite(running_test, self.case_loop)
+                    running_test(_result)
+                    del running_test
+                if not _result.shouldStop:
+                    _result.all.mark_loop(_result.ts_loop, start_time=self.start_time.isoformat(),
+                                          elapsed_time=time.perf_counter_ns() - self.start_ns)
+                    if _result.exporter is not None:
+                        # the records of the completed loops are readable after a crash
+                        _result.exporter.flush()
                 _result.ts_loop += 1
                 fail_count = _result.failure_count + _result.error_count
                 test_status = STATUS[1] if fail_count > 0 else STATUS[0] # 0-'PASSED', 1-'FAILED'
-                del running_test
 
                 if fail_count > 0:
                     retry_flag = False
@@ -582,20 +1009,30 @@ class StressRunner(object):
         except Exception as e:
             self.logger.error(e)
             self.logger.error('{err}'.format(err=traceback.format_exc()))
-            failed_elapsed_time = (datetime.datetime.now() - _result.tc_start_time).seconds
-            sn, t, o, e, d, lp = _result.all[-1]
-            if sn == 4:
-                _result.all.pop(-1)
-                _result.all.append((2, t, o, e, failed_elapsed_time, lp))
+            if _result.running_test is not None:
+                # the test case running when the runner crashed, counted and reported as an error
+                _result.addError(_result.running_test, sys.exc_info())
         finally:
+            if pool is not None:
+                pool.close()
+            if self.metrics is not None:
+                self.metrics.stop()
+            _result.stop_capture()
+            _result.checkpoint = None
+            if _result.exporter is not None:
+                _result.exporter.close()
+                _result.exporter = None
+            if self._checkpoint_xml is not None:
+                self._checkpoint_xml.close()
+                self._checkpoint_xml = None
             self.logger.info(_result)
             if _result.testsRun < 1:
                 return _result
             self.stop_time = datetime.datetime.now()
-            self.elapsedtime = (self.stop_time - self.start_time).seconds
+            self.elapsedtime = time.perf_counter_ns() - self.start_ns
+            self.test_status = test_status
             self.report_title = test_status + ": " + self.report_title
-            self.generate_report(_result)
-            self.generate_xml(_result)
+            self.generate_reports(_result, formats)
 
             if _result.all:
                 self._print_result(_result)
@@ -603,39 +1040,42 @@ class StressRunner(object):
                 for _test in test._tests:
                     self.logger.info(_test)
 
+            _result.all.close()
             return _result, test_status
 
-    @staticmethod
-    def _sort_result(result_list):
+    def _resume(self, result):
         """
-        unittest does not seems to run in any particular order.
-        Here at least we want to group them together by class.
-
-        :param result_list:
+        Reload the records of the interrupted run from result_log, continue from its last completed loop
+        :param result:
         :return:
         """
-
-        rmap = {}
-        classes = []
-        for n, t, o, e, d, l in result_list:
-            cls = t.__class__
-            if cls not in rmap:
-                rmap[cls] = []
-                classes.append(cls)
-            rmap[cls].append((n, t, o, e, d, l))
-        r = [(cls, rmap[cls]) for cls in classes]
-        return r
+        marker = result.all.resume()
+        if marker is None:
+            self.logger.info("Nothing to resume in {0}, start from loop 1".format(self.result_log))
+            return
+        result.restore()
+        result.ts_loop = marker['loop_done'] + 1
+        self.start_time = datetime.datetime.fromisoformat(marker['start_time'])
+        self.start_ns = time.perf_counter_ns() - marker['elapsed_time']
+        self.logger.info("Resume from loop {0}, {1} records reloaded from {2}".format(
+            result.ts_loop, marker['records'], self.result_log))
 
     def _print_result(self, result):
         self.logger.info(self.separator1)
         # result.print_errors()
-        for res in result.all:
-            msg = "{stat} - {tc} - Loop: {loop} - Elapsed: {elapsed}" \
-                .format(stat=STATUS[res[0]], tc=res[1], loop=res[5], elapsed=seconds_to_string(res[4]))
+        # one line per test case, and its first/last failed records, whatever the number of loops
+        for summary in result.all.summarize():
+            counts = ', '.join('{0}: {1}'.format(STATUS[sn], count) for sn, count in enumerate(summary.counts) if count)
+            msg = "{tc} - Iterations: {iterations} - {counts} - Last Loop: {loop}" \
+                .format(tc=summary.case, iterations=summary.iterations, counts=counts, loop=summary.last_loop)
             self.logger.info(msg)
-            err_failure = res[3].strip('\n')
-            if err_failure:
-                self.logger.error(err_failure)
+            first, last, omitted = summary.failure_samples()
+            for idx, res in enumerate(first + last):
+                if omitted and idx == len(first):
+                    self.logger.error("... {0} failed records omitted".format(omitted))
+                err_failure = res.stack_trace.strip('\n')
+                self.logger.error("{stat} - Loop: {loop}\n{err}".format(stat=STATUS[res.status], loop=res.loop,
+                                                                       err=err_failure))
         self.logger.info(self.separator2)
         total_count = sum([
             result.success_count,
@@ -649,7 +1089,7 @@ class StressRunner(object):
         self.logger.info("Skipped: {0}".format(result.skipped_count))
         self.logger.info("Canceled: {0}".format(result.canceled_count))
         self.logger.info("Total: {0}".format(total_count))
-        self.logger.info('Time Elapsed: {0}'.format(seconds_to_string(self.elapsedtime)))
+        self.logger.info('Time Elapsed: {0}'.format(ns_to_string(self.elapsedtime)))
         self.logger.info('JunitXml Path: {0}'.format(self.result_xml))
         self.logger.info('ReportHtml Path: {0}'.format(self.report_html))
         self.logger.info('Test Location: {0}({1})'.format(self.local_hostname, self.local_ip))
@@ -699,11 +1139,12 @@ class StressRunner(object):
             'Version': self.test_version,
             'Start': str(self.start_time).split('.')[0],
             'End': str(self.stop_time).split('.')[0],
-            'Elapsed': seconds_to_string(self.elapsedtime),
+            'Elapsed': ns_to_string(self.elapsedtime),
             'Summary': self.summary,
             'Location': '{0}({1})'.format(self.local_hostname, self.local_ip),
             'Workspace': os.getcwd(),
             'Report': self.report_html,
+            'Detail': self.report_detail_html if self.report_mode == 'aggregate' else '',
             'Command': 'python ' + ' '.join(sys.argv),
             'Python': platform.python_version(),
         }
@@ -712,231 +1153,101 @@ class StressRunner(object):
 
         return dict(attr, **self.test_env)
 
+    # the html tables, rendered by the emitters of stressrunner.render, kept for subclasses
     def _get_attributes_table_string(self, result):
-        """
-        get attributes table_string
-        """
-        att_template = """
-        <tr id='attr_%d' class='attr'>
-            <td colspan='1' align='left' width='15%%'>%s</td>
-            <td colspan='1' align='left'>%s</td>
-        </tr>
-        """
-        tr = ""
-        attr = self._get_attributes(result)
-        for idx, (k, v) in enumerate(attr.items()):
-            idx += 1
-            if v:
-                tr += att_template % (idx, k, v)
-        return tr
+        from stressrunner.render import attributes_rows
+        return attributes_rows(self._get_attributes(result))
 
     def _get_nodes_table_string(self, nodes_info=None):
-        """
-        nodes_info [
-            {
-                Name:''
-                Status:''
-                IPAddress:''
-                Roles:''
-                User:''
-                Password:''
-            }
-        ]
-        """
-        if nodes_info is None:
-            nodes_info = []
-        nodes_info.insert(0, {
-            "Name": self.local_hostname,
-            "Status": "Ready",
-            "IPAddress": self.local_ip,
-            "Roles": "Executor",
-            "User": "root",
-            "Password": "********",
-            "OS": platform.system(),
-        })
-        html_template = """
-        <tr id='node_%d' class='nodes'>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-        </tr>
-        """
-        tr = ""
-        for idx, node in enumerate(nodes_info):
-            tr += html_template % (idx, node["Name"], node["Status"], node["IPAddress"],
-                                   node["Roles"], node["User"], node["Password"], node["OS"])
-        return tr
+        from stressrunner.render import local_node, nodes_rows
+        return nodes_rows([local_node(self.local_hostname, self.local_ip)] + list(nodes_info or []))
 
     def _get_result_table_string(self, result):
-        html_template = """
-        <tr id='result_%d' class='%s'>
-            <td colspan='1' align='left'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%s</td>
-            <td colspan='1' align='center'>%d</td>
-        </tr>
-        """
-
-        msg_template = """
-        <tr id='msg_%d' class='%s'>
-            <td colspan='1' align='left'>Message</td>
-            <td colspan='3' align='left'><pre>%s</pre></td>
-        </tr>
-        """
-
-        tr = ""
-        sorted_result = self._sort_result(result.all)
-        for cid_1, (cls, cls_results) in enumerate(sorted_result):
-            np = nf = ne = ns = 0
-            for cid_2, (n, t, o, e, d, l) in enumerate(cls_results):
-                name = t.id().split('.')[-1]
-                doc = t.shortDescription() or ""
-                desc = doc and ('%s: %s' % (name, doc)) or name
-                output = saxutils.escape(o + e)
-                if n == 0:
-                    np += 1
-                    style = 'passCase'
-                elif n == 1:
-                    nf += 1
-                    style = 'failCase'
-                elif n == 2:
-                    ne += 1
-                    style = 'errorCase'
-                elif n == 3:
-                    ns += 1
-                    style = 'skipCase'
-                elif n == 4:
-                    np += 1
-                    style = 'passCase'
-                else:
-                    style = 'none'
-                cid = int("{0}{1}".format(cid_1, cid_2))
-                tr += html_template % (cid, style, desc, STATUS[n], seconds_to_string(d), l)
-                if output:
-                    tr += msg_template % (cid, style, output)
-        return tr
-
-    def generate_report(self, result):
-        total_count = sum([
-            result.success_count,
-            result.failure_count,
-            result.error_count,
-            result.skipped_count]
-        )
-        attr = self._get_attributes_table_string(result)
-        results = self._get_result_table_string(result)
-        nodes = self._get_nodes_table_string(self.test_nodes)
-        title_color = "h_red" if STATUS[1] in self.report_title or STATUS[2] in self.report_title else "h_green"
-        output = REPORT_TEMPLATE % dict(
-            Title=self.report_title,
-            TitleColor=title_color,
-            Generator=__author__,
-            Environment=attr,
-            Nodes=nodes,
-            Total=str(total_count),
-            Pass=str(result.success_count),
-            Fail=str(result.failure_count),
-            Error=str(result.error_count),
-            Skip=str(result.skipped_count),
-            Cancel=str(result.canceled_count),
-            Passrate=self.passrate,
-            Results=results
-        )
+        """The rows of the result table, a row per record"""
+        from stressrunner.render import HtmlEmitter
+        emitter = HtmlEmitter(None)
+        return ''.join(row for record in result.all.iter_grouped()
+                       for row in emitter.record_rows(record, record.output, record.stack_trace))
 
-        report_path_dir = os.path.dirname(self.report_html)
-        if not os.path.isdir(report_path_dir):
+    @staticmethod
+    def _get_latency_table_string(result):
+        from stressrunner.render import latency_rows
+        return latency_rows(result.latency)
+
+    def _maybe_checkpoint(self, result):
+        """Called after every record, checkpoint every checkpoint_records records or checkpoint_interval seconds"""
+        self._checkpoint_pending += 1
+        if (self.checkpoint_records and self._checkpoint_pending >= self.checkpoint_records) or \
+                (self.checkpoint_interval and time.monotonic() - self._checkpoint_time >= self.checkpoint_interval):
             try:
-                os.makedirs(report_path_dir)
-            except OSError as e:
-                raise Exception(e)
-        with open(self.report_html, 'wb') as f:
-            f.write(output.encode('UTF-8'))
+                self.write_checkpoint(result)
+            except Exception as e:
+                self.logger.warning("Checkpoint failed: {0}".format(e))
 
+    def write_checkpoint(self, result):
+        """
+        Write the reports of a running test from the incrementally kept aggregates:
+        the aggregated html report and the JSON summary are rewritten (a row per test case,
+        not per record), the new test cases are appended to the JUnit XML in place.
+        The drill-down detail report is written at the end of the run only.
+        Only the reports of self.report_formats are written.
+        :param result:
+        :return:
+        """
+        self._checkpoint_pending = 0
+        self._checkpoint_time = time.monotonic()
+        self.stop_time = datetime.datetime.now()
+        self.elapsedtime = time.perf_counter_ns() - self.start_ns
+        result.all.flush()
+
+        from stressrunner.render import ReportModel, HtmlEmitter, testsuite_attrs, junit_testcase, render
+        model = ReportModel(self, result, title="RUNNING: " + self.report_title)
+        if 'html' in self.report_formats:
+            tmp_path = self.report_html + '.tmp'
+            render(model, [HtmlEmitter(tmp_path, aggregate=True, detail_path=self.report_detail_html)])
+            os.replace(tmp_path, self.report_html)
+        if result.exporter is not None:
+            result.exporter.flush()
+        if 'json' in self.report_formats:
+            from stressrunner.render import JsonEmitter
+            render(model, [JsonEmitter(self.result_json + '.tmp')])
+            os.replace(self.result_json + '.tmp', self.result_json)
+
+        if 'xml' in self.report_formats:
+            if self._checkpoint_xml is None:
+                from stressrunner.writers import JUnitXmlCheckpoint
+                self._checkpoint_xml = JUnitXmlCheckpoint(self.result_xml)
+                self._checkpoint_xml_count = 0
+            start, self._checkpoint_xml_count = self._checkpoint_xml_count, len(result.all)
+            self._checkpoint_xml.checkpoint(
+                testsuite_attrs(model, fixed_width=True),
+                (junit_testcase(res, res.output, res.stack_trace) for res in result.all.iter_records(start=start)))
         return True
 
-    def generate_xml(self, result):
-        total_count = sum([
-            result.success_count,
-            result.failure_count,
-            result.error_count,
-            result.skipped_count,
-            result.canceled_count])
-        impl = minidom.getDOMImplementation()
-        doc = impl.createDocument(None, 'testsuites', None)
-        rootElement = doc.documentElement
-        # rootElement = doc.createElement('testsuites')
-        ts_element = doc.createElement('testsuite')
-        ts_element.setAttribute('name', 'test')
-        ts_element.setAttribute('errors', str(result.error_count))
-        ts_element.setAttribute('failures', str(result.failure_count))
-        ts_element.setAttribute('skipped', str(result.skipped_count))
-        ts_element.setAttribute('success', str(result.success_count))
-        ts_element.setAttribute('canceled', str(result.canceled_count))
-        ts_element.setAttribute('tests', str(total_count))
-        ts_element.setAttribute('time', str(self.elapsedtime))
-        # ts_element.setAttribute('timestamp', str(time.strftime("%Y-%m-%d%H%:M%:S", time.localtime())))
-        ts_element.setAttribute('timestamp', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())))
-        ts_element.setAttribute('hostname', '{0}({1})'.format(self.local_hostname, self.local_ip))
-        # ts_element.appendChild(doc.createTextNode(''))
-        for res in result.all:
-            # self.logger.debug(res)
-            tc_element = doc.createElement('testcase')
-            tc_element.setAttribute('classname', "%s.%s" % (res[1].__class__.__module__, res[1].__class__.__qualname__))
-            tc_element.setAttribute('name', str(res[1]._testMethodName))
-            tc_element.setAttribute('time', str(res[4]))
-            # tc_element.appendChild(doc.createTextNode(''))
-
-            if res[0] == 3:  # skiped
-                skiped_element = doc.createElement('skiped')
-                skiped_element.setAttribute('message', res[3])  # reason
-                # skiped_element.appendChild(doc.createTextNode(''))
-                tc_element.appendChild(skiped_element)
-            '''
-            if res[2] != "":  # has system output
-                output_element = doc.createElement('system-output')
-                output_element.appendChild(doc.createTextNode(res[2]))
-                tc_element.appendChild(output_element)
-            '''
-
-            if res[0] in [1, 2]:  # Error, Fail
-                err_failure = res[3].strip('\n')
-                failure_element = doc.createElement('failure')
-                failure_element.setAttribute('message', err_failure.split("\n")[-1])
-                failure_element.setAttribute('type',  "Error")
-                # failure_element.appendChild(doc.createTextNode(err_failure))
-                tc_element.appendChild(failure_element)
-
-            ts_element.appendChild(tc_element)
-        rootElement.appendChild(ts_element)
-
-        with open(self.result_xml, 'w') as f:
-            doc.writexml(f, addindent='  ', newl='\n', encoding='utf-8')
-
+    def generate_reports(self, result, formats=None):
+        """
+        Render the reports in a single pass over the records
+        :param result:
+        :param formats: default self.report_formats
+        :return:
+        """
+        from stressrunner.render import ReportModel, create_emitters, render
+        formats = self.report_formats if formats is None else formats
+        render(ReportModel(self, result), create_emitters(self, formats))
         return True
 
+    def generate_report(self, result):
+        """
+        Write the html report, the drill-down detail report in the aggregate mode, and the mail digest
+        :param result:
+        :return:
+        """
+        return self.generate_reports(result, ('html', 'digest'))
 
-# Facilities for running tests from the command line
-class SRTestProgram(unittest.TestProgram):
-    """
-    A variation of the unittest.TestProgram. Please refer to the base
-    class for command line parameters.
-
-    Pick StressRunner as the default test runner.
-    base class's testRunner parameter is not useful because it means
-    we have to instantiate StressRunner before we know self.verbosity.
-    """
-    def __init__(self):
-        super(SRTestProgram, self).__init__(module=None)
-        self.testRunner = StressRunner()
-
-    def runTests(self):
-        unittest.TestProgram.runTests(self)
-
-
-# Executing this module from the command line
-if __name__ == "__main__":
-    SRTestProgram()
+    def generate_xml(self, result):
+        """
+        Write the JUnit XML, the test cases are streamed from the result store
+        :param result:
+        :return:
+        """
+        return self.generate_reports(result, ('xml',))
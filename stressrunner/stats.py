@@ -0,0 +1,138 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Latency statistics of the test cases across loops.
+Each test id keeps a log-bucketed histogram of its elapsed times (HDR style:
+every power of 2 is split into linear sub-buckets), so the memory is bounded
+whatever the iterations, and percentiles are within the sub-bucket precision.
+"""
+
+import math
+import array
+import collections
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of latencies in nanoseconds, with exact count/min/max/mean/stddev
+    :param sub_bits: 2**sub_bits sub-buckets per power of 2, the relative error
+                     of the percentiles is less than 1/2**sub_bits
+    """
+
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self._sub_count = 1 << sub_bits
+        self._counts = array.array('Q')  # grows up to (64 - sub_bits) * 2**sub_bits buckets
+        self.count = 0
+        self.min = None
+        self.max = None
+        # Welford's online mean/variance
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bits - 1
+        if shift <= 0:
+            return value
+        return (shift + 1) * self._sub_count + (value >> shift) - self._sub_count
+
+    def _bounds(self, index):
+        """The lowest and highest value of the bucket"""
+        if index < 2 * self._sub_count:
+            return index, index
+        shift = index // self._sub_count - 1
+        sub = index % self._sub_count + self._sub_count
+        return sub << shift, ((sub + 1) << shift) - 1
+
+    def add(self, value):
+        """
+        :param value: latency in nanoseconds
+        :return:
+        """
+        value = max(int(value), 0)
+        index = self._index(value)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+
+    @property
+    def mean(self):
+        return self._mean if self.count else None
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+        return math.sqrt(self._m2 / self.count)
+
+    def percentile(self, percent):
+        """
+        :param percent: 0-100
+        :return: the latency in nanoseconds, None if empty
+        """
+        if not self.count:
+            return None
+        rank = max(int(math.ceil(percent / 100.0 * self.count)), 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                low, high = self._bounds(index)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """count, min, max, mean, stddev and the PERCENTILES as a dict"""
+        summary = collections.OrderedDict([
+            ('count', self.count),
+            ('min', self.min),
+            ('max', self.max),
+            ('mean', self.mean),
+            ('stddev', self.stddev),
+        ])
+        for percent in PERCENTILES:
+            summary['p{0:g}'.format(percent)] = self.percentile(percent)
+        return summary
+
+
+class LatencyStats(object):
+    """LatencyHistogram of each test id, in the order of the first record"""
+
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self.histograms = collections.OrderedDict()
+
+    def add(self, test_id, value):
+        histogram = self.histograms.get(test_id)
+        if histogram is None:
+            histogram = self.histograms[test_id] = LatencyHistogram(self.sub_bits)
+        histogram.add(value)
+
+    def __len__(self):
+        return len(self.histograms)
+
+    def items(self):
+        return self.histograms.items()
+
+
+def ns_to_ms(ns):
+    """
+    Nanoseconds to milliseconds string, e.g. 1.234
+    :param ns: int or float, None as '-'
+    :return:
+    """
+    if ns is None:
+        return '-'
+    return '{0:.3f}'.format(ns / 1000000.0)
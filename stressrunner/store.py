@@ -0,0 +1,426 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Result store: keep the records compact in memory as array columns, with the
+output/stack trace spilled to a file and referenced by offset, and journal
+each record to an append-only JSON lines log on disk.
+The log is also the run journal: a marker line is written at the end of each
+test suite loop, an interrupted run is resumed from the last one.
+"""
+
+import os
+import json
+import array
+import collections
+
+
+class CaseInfo(object):
+    """Identity of a test case, saved instead of keeping the TestCase alive"""
+
+    __slots__ = ('test_id', 'class_name', 'method_name', 'name', 'doc')
+
+    def __init__(self, test_id, class_name, method_name, name, doc):
+        self.test_id = test_id
+        self.class_name = class_name
+        self.method_name = method_name
+        self.name = name
+        self.doc = doc
+
+    @classmethod
+    def from_test(cls, test):
+        """
+        :param test: unittest.TestCase, or unittest's _ErrorHolder for fixtures errors
+        :return:
+        """
+        test_cls = test.__class__
+        return cls(
+            test_id=test.id() if hasattr(test, 'id') else str(test),
+            class_name="%s.%s" % (test_cls.__module__, test_cls.__qualname__),
+            method_name=str(getattr(test, '_testMethodName', test)),
+            name=str(test),
+            doc=test.shortDescription() if hasattr(test, 'shortDescription') else None,
+        )
+
+    def id(self):
+        return self.test_id
+
+    def shortDescription(self):
+        return self.doc
+
+    def __str__(self):
+        return self.name
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class Record(object):
+    """
+    One result record, output and stack_trace are read from the spill file on access.
+    Unpacks as (status, case, output, stack_trace, elapsed_time, loop).
+    """
+
+    __slots__ = ('status', 'case', 'elapsed_time', 'loop', '_store', '_offset', '_output_size', '_trace_size')
+
+    def __init__(self, store, status, case, elapsed_time, loop, offset, output_size, trace_size):
+        self._store = store
+        self.status = status
+        self.case = case
+        self.elapsed_time = elapsed_time
+        self.loop = loop
+        self._offset = offset
+        self._output_size = output_size
+        self._trace_size = trace_size
+
+    @property
+    def output(self):
+        return self._store.read_spill(self._offset, self._output_size)
+
+    @property
+    def stack_trace(self):
+        return self._store.read_spill(self._offset + self._output_size, self._trace_size)
+
+    def __iter__(self):
+        return iter((self.status, self.case, self.output, self.stack_trace, self.elapsed_time, self.loop))
+
+
+class CaseSummary(object):
+    """
+    The records of one test case, aggregated
+    :param case: CaseInfo
+    :param samples: keep the first and the last N failed/error records
+    """
+
+    __slots__ = ('case', 'counts', 'last_loop', 'first_failures', 'last_failures', 'failure_count')
+
+    def __init__(self, case, samples=3):
+        self.case = case
+        self.counts = [0] * 5  # records of each status, pass/fail/error/skip/canceled
+        self.last_loop = 0
+        self.first_failures = []
+        self.last_failures = collections.deque(maxlen=samples)
+        self.failure_count = 0
+
+    @property
+    def iterations(self):
+        return sum(self.counts)
+
+    def add(self, status, loop, record=None):
+        """
+        :param status: the record status
+        :param loop: the test suite loop of the record
+        :param record: Record, required for the failed/error ones
+        :return:
+        """
+        self.counts[status] += 1
+        self.last_loop = max(self.last_loop, loop)
+        if status in (1, 2):
+            self.failure_count += 1
+            if len(self.first_failures) < self.last_failures.maxlen:
+                self.first_failures.append(record)
+            else:
+                self.last_failures.append(record)
+
+    def failure_samples(self):
+        """The first and the last N failed/error records, and the number of the omitted ones"""
+        omitted = self.failure_count - len(self.first_failures) - len(self.last_failures)
+        return self.first_failures, list(self.last_failures), omitted
+
+
+class ResultStore(object):
+    """
+    Append-only store of the records (status, test, output, stack_trace, elapsed_time, loop),
+    elapsed_time in nanoseconds.
+    Columns in memory: status, case index, elapsed time, loop and the spill
+    offset/sizes, about 33 bytes per record whatever the output size.
+    Iterating the store yields Record, whose case is an interned CaseInfo.
+    :param path: the JSON lines log path, the spill file is <path>.out,
+                 None for temporary files removed at close()
+    :param window: the number of recent records kept in memory
+    :param samples: the first/last N failed records of each case kept by the CaseSummary
+    """
+
+    def __init__(self, path=None, window=100, samples=3):
+        self.path = path
+        self.spill_path = None
+        self._is_temp = path is None
+        self._fp = None
+        self._spill = None
+        self._spill_reader = None
+        self._spill_offset = 0
+        self._spill_dirty = False
+
+        self.cases = {}  # test id -> CaseInfo
+        self.classes = []  # class names in the order of the first record
+        self._case_list = []  # case index -> CaseInfo
+        self._case_index = {}  # test id -> case index
+        self.recent = collections.deque(maxlen=window)
+        self.samples = samples
+        self._summaries = []  # case index -> CaseSummary, updated at each append
+        self._clear()
+
+    def _clear(self):
+        # columns
+        self._status = array.array('B')
+        self._case = array.array('I')
+        self._elapsed = array.array('Q')  # ns
+        self._loop = array.array('I')
+        self._offset = array.array('Q')
+        self._output_size = array.array('I')
+        self._trace_size = array.array('I')
+
+    def _open(self, resume=False):
+        if resume:
+            # keep the log and spill file, truncated to the last loop marker by the caller
+            self._fp = open(self.path, 'a', encoding='utf-8')
+            self.spill_path = self.path + '.out'
+            self._spill = open(self.spill_path, 'ab')
+            return
+        if self._is_temp:
+            import tempfile
+            fd, self.path = tempfile.mkstemp(prefix='stressrunner_', suffix='.jsonl')
+            self._fp = os.fdopen(fd, 'w', encoding='utf-8')
+        else:
+            log_dir = os.path.dirname(self.path)
+            if log_dir and not os.path.isdir(log_dir):
+                os.makedirs(log_dir)
+            self._fp = open(self.path, 'w', encoding='utf-8')
+        self.spill_path = self.path + '.out'
+        self._spill = open(self.spill_path, 'wb')
+
+    def _write(self, line):
+        self._fp.write(json.dumps(line, ensure_ascii=False))
+        self._fp.write('\n')
+
+    def case_info(self, test):
+        """The interned CaseInfo of test, log it at the first time"""
+        return self._case_list[self._intern(test)]
+
+    def _intern(self, test, log=True):
+        if isinstance(test, CaseInfo):
+            test_id = test.test_id
+        else:
+            test_id = test.id() if hasattr(test, 'id') else str(test)
+        index = self._case_index.get(test_id)
+        if index is None:
+            case = test if isinstance(test, CaseInfo) else CaseInfo.from_test(test)
+            index = len(self._case_list)
+            self._case_list.append(case)
+            self._summaries.append(CaseSummary(case, self.samples))
+            self._case_index[test_id] = index
+            self.cases[test_id] = case
+            if case.class_name not in self.classes:
+                self.classes.append(case.class_name)
+            if log:
+                self._write({'case': case.to_dict()})
+        return index
+
+    def append(self, record):
+        """
+        :param record: (status, test, output, stack_trace, elapsed_time, loop)
+        :return:
+        """
+        if self._fp is None:
+            self._open()
+        sn, test, output, stack_trace, elapsed_time, loop = record
+        index = self._intern(test)
+        output = (output or '').encode('UTF-8')
+        stack_trace = (stack_trace or '').encode('UTF-8')
+        offset = self._spill_offset
+        self._spill.write(output)
+        self._spill.write(stack_trace)
+        self._spill_offset += len(output) + len(stack_trace)
+        self._spill_dirty = True
+        elapsed_time = elapsed_time or 0
+        self._add_columns(index, sn, elapsed_time, loop, offset, len(output), len(stack_trace))
+        self._write({
+            'id': self._case_list[index].test_id,
+            'status': sn,
+            'offset': offset,
+            'output_size': len(output),
+            'trace_size': len(stack_trace),
+            'elapsed_time': elapsed_time,
+            'loop': loop,
+        })
+
+    def _add_columns(self, index, sn, elapsed_time, loop, offset, output_size, trace_size):
+        self._status.append(sn)
+        self._case.append(index)
+        self._elapsed.append(elapsed_time)
+        self._loop.append(loop)
+        self._offset.append(offset)
+        self._output_size.append(output_size)
+        self._trace_size.append(trace_size)
+        record = self._record(len(self._status) - 1)
+        self.recent.append(record)
+        self._summaries[index].add(sn, loop, record)
+
+    def mark_loop(self, loop, **info):
+        """
+        Journal the end of a test suite loop, the records so far are synced to disk
+        :param loop: the completed test suite loop
+        :param info: saved in the marker, e.g. elapsed_time, start_time
+        :return:
+        """
+        if self._fp is None:
+            self._open()
+        marker = collections.OrderedDict([('loop_done', loop), ('records', len(self._status))])
+        marker.update(info)
+        self._write(marker)
+        self.flush()
+        for fp in (self._spill, self._fp):
+            os.fsync(fp.fileno())
+
+    def resume(self):
+        """
+        Reload the records of the completed loops from the log of an interrupted run,
+        the records of the unfinished loop are dropped and the new records are appended
+        :return: the last loop marker, e.g. {'loop_done': 3, 'records': 120, 'elapsed_time': ns},
+                 None if there is nothing to resume
+        """
+        if self._is_temp or self._fp is not None or not os.path.isfile(self.path):
+            return None
+        marker, end, pos = None, 0, 0
+        with open(self.path, 'rb') as fp:
+            for line in fp:
+                pos += len(line)
+                if line.startswith(b'{"loop_done"'):
+                    marker, end = line, pos
+        if marker is None:
+            return None
+
+        spill_end = 0
+        with open(self.path, 'rb') as fp:
+            pos = 0
+            for line in fp:
+                pos += len(line)
+                if pos > end:
+                    break
+                entry = json.loads(line.decode('UTF-8'))
+                if 'case' in entry:
+                    self._intern(CaseInfo(**entry['case']), log=False)
+                elif 'id' in entry:
+                    self._add_columns(self._case_index[entry['id']], entry['status'], entry['elapsed_time'],
+                                      entry['loop'], entry['offset'], entry['output_size'], entry['trace_size'])
+                    spill_end = entry['offset'] + entry['output_size'] + entry['trace_size']
+
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(end)
+        spill_path = self.path + '.out'
+        with open(spill_path, 'ab') as fp:
+            fp.truncate(spill_end)
+        self._open(resume=True)
+        self._spill_offset = spill_end
+        return json.loads(marker.decode('UTF-8'))
+
+    def _record(self, idx):
+        return Record(self, self._status[idx], self._case_list[self._case[idx]], self._elapsed[idx],
+                      self._loop[idx], self._offset[idx], self._output_size[idx], self._trace_size[idx])
+
+    def read_spill(self, offset, size):
+        if not size:
+            return ''
+        if self._spill_dirty:
+            self._spill.flush()
+            self._spill_dirty = False
+        if self._spill_reader is None:
+            self._spill_reader = open(self.spill_path, 'rb')
+        self._spill_reader.seek(offset)
+        return self._spill_reader.read(size).decode('UTF-8')
+
+    def __len__(self):
+        return len(self._status)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self._status)
+        if not 0 <= idx < len(self._status):
+            raise IndexError('record index out of range')
+        return self._record(idx)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self, class_name=None, start=0):
+        """
+        Scan the records
+        :param class_name: only the records of test cases in this class
+        :param start: from the record index, e.g. the new records since the last scan
+        :return:
+        """
+        if class_name is None:
+            for idx in range(start, len(self._status)):
+                yield self._record(idx)
+            return
+        indexes = set(idx for idx, case in enumerate(self._case_list) if case.class_name == class_name)
+        for idx in range(start, len(self._case)):
+            if self._case[idx] in indexes:
+                yield self._record(idx)
+
+    def iter_grouped(self):
+        """
+        Scan the records once, grouped by class in the order of self.classes,
+        in the order of append in a class
+        :return:
+        """
+        rank = {class_name: idx for idx, class_name in enumerate(self.classes)}
+        case_rank = [rank[case.class_name] for case in self._case_list]
+        # counting sort of the record indexes by class rank
+        starts = [0] * (len(self.classes) + 1)
+        for case_idx in self._case:
+            starts[case_rank[case_idx] + 1] += 1
+        for idx in range(1, len(starts)):
+            starts[idx] += starts[idx - 1]
+        order = array.array('Q', bytes(8 * len(self._case)))
+        for idx, case_idx in enumerate(self._case):
+            position = case_rank[case_idx]
+            order[starts[position]] = idx
+            starts[position] += 1
+        for idx in order:
+            yield self._record(idx)
+
+    def summarize(self, samples=None):
+        """
+        Aggregate the records by test case, in the order of classes then the first record.
+        The summaries are kept up to date at each append, only a different number
+        of samples needs a scan of the records.
+        :param samples: keep the first and the last N failed/error records of each case,
+                        default self.samples
+        :return: list of CaseSummary
+        """
+        if samples is None or samples == self.samples:
+            summaries = self._summaries
+        else:
+            summaries = [CaseSummary(case, samples) for case in self._case_list]
+            for idx, (status, case_idx) in enumerate(zip(self._status, self._case)):
+                summary = summaries[case_idx]
+                if status in (1, 2):
+                    summary.add(status, self._loop[idx], self._record(idx))
+                else:
+                    summary.add(status, self._loop[idx])
+        order = {class_name: idx for idx, class_name in enumerate(self.classes)}
+        return sorted((summary for summary in summaries if summary.iterations),
+                      key=lambda summary: order[summary.case.class_name])
+
+    def flush(self):
+        for fp in (self._fp, self._spill):
+            if fp is not None and not fp.closed:
+                fp.flush()
+        self._spill_dirty = False
+
+    def close(self):
+        """Close the files, the records are still readable unless in temporary files"""
+        if self._fp is None or self._fp.closed:
+            return
+        self._fp.close()
+        self._spill.close()
+        self._spill_dirty = False
+        if self._is_temp:
+            if self._spill_reader is not None:
+                self._spill_reader.close()
+            os.remove(self.path)
+            os.remove(self.spill_path)
+            self.recent.clear()
+            self._summaries = [CaseSummary(case, self.samples) for case in self._case_list]
+            self._clear()
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : bench_import.py
+Import time benchmark of stressrunner with `python -X importtime`.
+Usage: python bench_import.py [--top N] [--repeat N]
+"""
+
+import sys
+import argparse
+import subprocess
+
+STATEMENTS = [
+    'import stressrunner',
+    'from stressrunner import StressRunner',
+    'from stressrunner import StressRunner, send_mail',
+]
+
+
+def import_time(statement):
+    """
+    Run the statement in a new interpreter with -X importtime
+    :param statement:
+    :return: [(cumulative us, self us, module)] of the top level imports and all the modules
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        modules.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='stressrunner import time benchmark')
+    parser.add_argument('--top', type=int, default=10, help='show the N slowest modules')
+    parser.add_argument('--repeat', type=int, default=5, help='take the best of N runs')
+    args = parser.parse_args()
+
+    for statement in STATEMENTS:
+        runs = [import_time(statement) for _ in range(args.repeat)]
+        # top level modules are not indented
+        totals = [sum(c for c, _, m in modules if not m.startswith('  ')) for modules in runs]
+        best = runs[totals.index(min(totals))]
+        print('{0}: {1:.1f} ms (best of {2}), {3} modules'.format(
+            statement, min(totals) / 1000.0, args.repeat, len(best)))
+        for cumulative_us, self_us, module in sorted(best, reverse=True)[:args.top]:
+            print('  {0:>8.1f} ms  {1}'.format(cumulative_us / 1000.0, module.strip()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_capture.py
+Tests of the output capture: the redirectors filtering the output into the
+buffer of the test case running in each thread, the buffers keeping the head
+and the tail of the output and spilling the full output to disk, and the
+file descriptors captured through a pipe then restored.
+"""
+
+import io
+import os
+import sys
+import stat
+import shutil
+import logging
+import tempfile
+import unittest
+import threading
+import subprocess
+
+from stressrunner.loop import CaseLoop, LoopSuite
+from stressrunner.runner import OutputRedirector, _TestResult
+from stressrunner.capture import CaptureBuffer, OMITTED_LINE, SPILLED_LINE, remove_spill_files, spill_file_name
+from stressrunner.capture import FdCapture
+
+
+def quiet_logger():
+    logger = logging.getLogger('stressrunner.test')
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+class TestOutputRedirector(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = io.StringIO()
+        self.console = io.StringIO()
+        self.redirector = OutputRedirector(self.buffer)
+        self.redirector.__console__ = self.console
+
+    def test_filtered(self):
+        for s in ('plain line\n', 'ERROR: failed', 'ERROR: \x1b[31mred', 'x DESCRIBE: \x1b[1m step'):
+            self.redirector.write(s)
+        self.assertEqual(self.buffer.getvalue(), 'ERROR: failed\nERROR: red\nstep\n')
+        # the console gets everything as is
+        self.assertEqual(self.console.getvalue(),
+                         'plain line\nERROR: failedERROR: \x1b[31mredx DESCRIBE: \x1b[1m step')
+
+    def test_not_filtered(self):
+        self.redirector.filtered = False
+        self.redirector.writelines(['plain line\n', 'ERROR: \x1b[31mred\n'])
+        self.assertEqual(self.buffer.getvalue(), 'plain line\nERROR: \x1b[31mred\n')
+        self.assertEqual(self.console.getvalue(), self.buffer.getvalue())
+
+    def test_fp_per_thread(self):
+        self.redirector.filtered = False
+        buffers = {}
+
+        def target(name):
+            buffers[name] = self.redirector.fp = io.StringIO()
+            self.redirector.write(name)
+
+        threads = [threading.Thread(target=target, args=('t{0}'.format(idx),)) for idx in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({name: fp.getvalue() for name, fp in buffers.items()}, {'t0': 't0', 't1': 't1', 't2': 't2'})
+        # this thread never set its fp: the last one set by any thread
+        self.assertIn(self.redirector.fp, buffers.values())
+
+    def test_concurrent_records(self):
+        class Case(unittest.TestCase):
+            def test_a(self):
+                print('ERROR: {0}'.format(threading.current_thread().name))
+
+        result = _TestResult(quiet_logger(), fail_exit=False)
+        LoopSuite(Case('test_a'), CaseLoop(iterations=20, concurrency=3))(result)
+        self.assertEqual(len(result.all), 60)
+        # the output of each iteration is in its own record, never in the one of another thread
+        names = set()
+        for res in result.all:
+            line, = res.output.splitlines()
+            names.add(line)
+        self.assertEqual(names, {'ERROR: {0}-{1}'.format(Case('test_a').id(), idx) for idx in range(1, 4)})
+        result.all.close()
+
+
+class TestCaptureBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.spill_path = os.path.join(self.tmp_dir, 'spill', 'mod.Case.test_a.stdout.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_small(self):
+        buffer = CaptureBuffer(10, 10, self.spill_path)
+        self.assertEqual(buffer.write('a' * 15), 15)
+        buffer.writelines(['b', 'c' * 4])
+        self.assertEqual((buffer.getvalue(), buffer.omitted), ('a' * 15 + 'bcccc', 0))
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_head_tail(self):
+        buffer = CaptureBuffer(10, 10)
+        buffer.write('a' * 12)
+        for _ in range(100):
+            buffer.write('b')
+        buffer.write('c' * 8)
+        self.assertEqual(buffer.omitted, 100)
+        self.assertEqual(buffer.getvalue(), 'a' * 10 + OMITTED_LINE.format(100) + 'bb' + 'c' * 8)
+        buffer.clear()
+        self.assertEqual((buffer.getvalue(), buffer.omitted), ('', 0))
+
+    def test_spill(self):
+        buffer = CaptureBuffer(4, 4, self.spill_path)
+        output = 'head' + '\u00e9' * 10 + 'tail'
+        for char in output:
+            buffer.write(char)
+        self.assertEqual(buffer.getvalue(), 'head' + SPILLED_LINE.format(10, self.spill_path, 0, 28) + 'tail')
+        with open(self.spill_path, encoding='UTF-8') as fp:
+            self.assertEqual(fp.read(), output)
+        buffer.clear()
+
+        # the next records of the test case are appended after it
+        buffer.write('0123456789')
+        self.assertIn(SPILLED_LINE.format(2, self.spill_path, 28, 10), buffer.getvalue())
+        buffer.clear()
+        self.assertEqual(os.path.getsize(self.spill_path), 38)
+
+    def test_remove_spill_files(self):
+        spill_dir = os.path.dirname(self.spill_path)
+        remove_spill_files(spill_dir)  # not created yet
+        os.makedirs(spill_dir)
+        for name in ('a.stdout.log', 'a.stderr.log', 'notes.txt'):
+            with open(os.path.join(spill_dir, name), 'w') as fp:
+                fp.write(name)
+        remove_spill_files(spill_dir)
+        self.assertEqual(os.listdir(spill_dir), ['notes.txt'])
+
+    def test_result_spill(self):
+        class Case(unittest.TestCase):
+            def test_a(self):
+                print('ERROR: ' + 'x' * 100)
+
+        spill_dir = os.path.dirname(self.spill_path)
+        result = _TestResult(quiet_logger(), fail_exit=False, capture_head=20, capture_tail=20,
+                             capture_dir=spill_dir)
+        LoopSuite(Case('test_a'), CaseLoop(iterations=3))(result)
+        spill_path = os.path.join(spill_dir, spill_file_name(Case('test_a').id()) + '.stdout.log')
+        self.assertEqual(os.listdir(spill_dir), [os.path.basename(spill_path)])
+        self.assertEqual(os.path.getsize(spill_path), 3 * 108)
+        for idx, res in enumerate(result.all):
+            self.assertTrue(res.output.startswith('ERROR: xxxxxxxxxxxxx\n... 68 characters omitted'))
+            self.assertIn('(offset {0}, 108 bytes)'.format(idx * 108), res.output)
+        result.all.close()
+
+
+class TestFdCapture(unittest.TestCase):
+    """Capture a fd open on a file, instead of the fds 1 and 2 of the test runner"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.path = os.path.join(self.tmp_dir, 'fd.log')
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        self.inode = os.fstat(self.fd).st_ino
+        self.capture = FdCapture(self.fd)
+
+    def tearDown(self):
+        self.capture.stop()
+        os.close(self.fd)
+        shutil.rmtree(self.tmp_dir)
+
+    def read_file(self):
+        with open(self.path, 'rb') as fp:
+            return fp.read()
+
+    def test_capture_restore(self):
+        buffer = CaptureBuffer()
+        self.capture.start()
+        self.assertTrue(stat.S_ISFIFO(os.fstat(self.fd).st_mode))
+        self.capture.set_target(buffer)
+        os.write(self.fd, b'captured\n')
+        subprocess.check_call([sys.executable, '-c', 'import os; os.write({0}, b"subprocess\\n")'.format(self.fd)],
+                              pass_fds=(self.fd,))
+        self.capture.sync()
+        self.assertEqual(buffer.getvalue(), 'captured\nsubprocess\n')
+        self.capture.set_target(None)
+        os.write(self.fd, b'echoed only\n')
+        self.capture.stop()
+        self.assertFalse(self.capture.started)
+
+        # the fd is back on the file, the captured output was echoed to it, without the sync markers
+        self.assertEqual(os.fstat(self.fd).st_ino, self.inode)
+        os.write(self.fd, b'restored\n')
+        self.assertEqual(self.read_file(), b'captured\nsubprocess\nechoed only\nrestored\n')
+        self.assertEqual(buffer.getvalue(), 'captured\nsubprocess\n')
+
+    def test_no_echo(self):
+        self.capture.echo = False
+        buffer = CaptureBuffer()
+        self.capture.start()
+        self.capture.set_target(buffer)
+        # a character split between two writes
+        encoded = '\u00e9t\u00e9\n'.encode('UTF-8')
+        os.write(self.fd, encoded[:1])
+        os.write(self.fd, encoded[1:])
+        self.capture.sync()
+        self.capture.stop()
+        self.assertEqual(buffer.getvalue(), '\u00e9t\u00e9\n')
+        self.assertEqual(self.read_file(), b'')
+
+    def test_restart(self):
+        for idx in range(3):
+            buffer = CaptureBuffer()
+            self.capture.start()
+            self.capture.set_target(buffer)
+            os.write(self.fd, 'run {0}\n'.format(idx).encode())
+            self.capture.stop()
+            self.assertEqual(buffer.getvalue(), 'run {0}\n'.format(idx))
+            self.assertEqual(os.fstat(self.fd).st_ino, self.inode)
+        self.assertEqual(self.read_file(), b'run 0\nrun 1\nrun 2\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_checkpoint.py
+Tests of the checkpoints and the resume of an interrupted run: the JUnit XML
+updated in place is valid after each checkpoint, a run killed in a loop
+leaves parsable reports and is resumed from its last completed loop.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+import subprocess
+import collections
+from xml.etree import ElementTree
+
+from stressrunner.writers import JUnitXmlCheckpoint
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# a run of 5 loops, hanging in loop 3 unless resumed,
+# 'export': the NDJSON records only, without checkpoints
+RUN_SCRIPT = '''
+import sys
+import time
+import unittest
+from stressrunner import StressRunner
+
+RESUME = sys.argv[2] == 'resume'
+EXPORT = sys.argv[2] == 'export'
+calls = 0
+
+
+class Case(unittest.TestCase):
+
+    def test_a(self):
+        print('ERROR: a')
+
+    def test_b(self):
+        global calls
+        calls += 1
+        if calls == 3 and not RESUME:
+            time.sleep(120)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(Case)
+if EXPORT:
+    options = dict(report_formats=('ndjson',))
+else:
+    options = dict(checkpoint_records=1, resume=RESUME, report_formats=('html', 'xml', 'json'))
+runner = StressRunner(report_html=sys.argv[1] + '/report.html', result_xml=sys.argv[1] + '/result.xml',
+                      loop=5, **options)
+runner.run(suite)
+'''
+
+
+def case_attrs(idx):
+    return {'classname': 'mod.Case', 'name': 'test_{0}'.format(idx), 'time': '0.001'}
+
+
+class TestJUnitXmlCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.path = os.path.join(self.tmp_dir, 'result.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_checkpoints(self):
+        checkpoint = JUnitXmlCheckpoint(self.path)
+        total = 0
+        for new in (2, 0, 3, 1):
+            testcases = []
+            for idx in range(total, total + new):
+                kwargs = {'failure': ('failed <&> "{0}"'.format(idx), 'Fail', 'trace')} if idx % 2 else {}
+                testcases.append((case_attrs(idx), kwargs))
+            total += new
+            checkpoint.checkpoint({'name': 'test', 'tests': '{0:08d}'.format(total)}, testcases)
+            # valid after each checkpoint, without closing the file
+            root = ElementTree.parse(self.path).getroot()
+            suite = root.find('testsuite')
+            self.assertEqual(int(suite.get('tests')), total)
+            self.assertEqual([testcase.get('name') for testcase in suite.findall('testcase')],
+                             ['test_{0}'.format(idx) for idx in range(total)])
+        self.assertEqual(suite.findall('testcase')[5].find('failure').get('message'), 'failed <&> "5"')
+        with self.assertRaises(ValueError):
+            checkpoint.checkpoint({'name': 'test', 'tests': '7'}, [])
+        checkpoint.close()
+        self.assertEqual(len(ElementTree.parse(self.path).getroot().find('testsuite')), 6)
+
+
+class TestCheckpointResume(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.report_dir = os.path.join(self.tmp_dir, 'reports')
+        self.script = os.path.join(self.tmp_dir, 'run.py')
+        with open(self.script, 'w') as fp:
+            fp.write(RUN_SCRIPT)
+        self.env = dict(os.environ, PYTHONPATH=PACKAGE_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def start(self, mode):
+        return subprocess.Popen([sys.executable, self.script, self.report_dir, mode], env=self.env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_for(self, proc, condition, timeout=60):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                self.fail('condition not met, exitcode: {0}'.format(proc.returncode))
+            time.sleep(0.05)
+
+    def loop_markers(self):
+        path = os.path.join(self.report_dir, 'report.jsonl')
+        if not os.path.isfile(path):
+            return 0
+        with open(path, 'rb') as fp:
+            return sum(1 for line in fp if line.startswith(b'{"loop_done"'))
+
+    def xml_testcases(self):
+        root = ElementTree.parse(os.path.join(self.report_dir, 'result.xml')).getroot()
+        return root.find('testsuite')
+
+    def checkpointed(self):
+        """The testcases in the checkpoint, None while it is written"""
+        try:
+            return len(self.xml_testcases())
+        except (OSError, ElementTree.ParseError):
+            return None
+
+    def test_kill_resume(self):
+        proc = self.start('run')
+        # loops 1-2 completed, test_a of loop 3 checkpointed, test_b of loop 3 hanging
+        self.wait_for(proc, lambda: self.loop_markers() == 2 and self.checkpointed() == 5)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+
+        suite = self.xml_testcases()
+        self.assertEqual(int(suite.get('tests')), 5)
+        self.assertEqual(int(suite.get('success')), 5)
+        with open(os.path.join(self.report_dir, 'report.html'), encoding='UTF-8') as fp:
+            self.assertIn('RUNNING: ', fp.read())
+
+        proc = self.start('resume')
+        self.assertEqual(proc.wait(timeout=120), 0)
+        suite = self.xml_testcases()
+        self.assertEqual((int(suite.get('tests')), int(suite.get('success'))), (10, 10))
+        self.assertEqual(self.loop_markers(), 5)
+        # the records of the killed loop 3 were dropped, not merged twice
+        with open(os.path.join(self.report_dir, 'report.jsonl'), encoding='UTF-8') as fp:
+            loops = collections.Counter(json.loads(line).get('loop') for line in fp if line.startswith('{"id"'))
+        self.assertEqual(loops, {loop: 2 for loop in range(1, 6)})
+        with open(os.path.join(self.report_dir, 'report.html'), encoding='UTF-8') as fp:
+            self.assertNotIn('RUNNING: ', fp.read())
+
+    def test_kill_export(self):
+        proc = self.start('export')
+        self.wait_for(proc, lambda: self.loop_markers() == 2)
+        time.sleep(0.2)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+        # the records of the completed loops were flushed at the loop markers
+        with open(os.path.join(self.report_dir, 'report.ndjson'), encoding='UTF-8') as fp:
+            rows = [json.loads(line) for line in fp]
+        self.assertGreaterEqual(len(rows), 4)
+        self.assertEqual([row['loop'] for row in rows[:4]], [1, 1, 2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_host.py
+Tests of the local host identity: resolved at the first access instead of at
+import, the DNS lookup given up after its timeout, and cached.
+"""
+
+import os
+import time
+import unittest
+from unittest import mock
+
+from stressrunner import runner
+from stressrunner.runner import _LazyHostAttribute, _call_with_timeout, get_local_ip, get_local_hostname
+
+
+def slow_lookup(hostname):
+    time.sleep(5)
+    return '10.0.0.1'
+
+
+class TestCallWithTimeout(unittest.TestCase):
+
+    def test_return(self):
+        self.assertEqual(_call_with_timeout(lambda a, b: a + b, 1, 2, 3), 5)
+
+    def test_raise(self):
+        self.assertIsNone(_call_with_timeout(lambda: 1 / 0, 1))
+
+    def test_timeout(self):
+        start = time.monotonic()
+        self.assertIsNone(_call_with_timeout(slow_lookup, 0.1, 'host'))
+        self.assertLess(time.monotonic() - start, 2)
+
+
+class TestLocalHost(unittest.TestCase):
+
+    def setUp(self):
+        for patcher in (mock.patch.dict(runner._local_host, clear=True), mock.patch.dict(os.environ)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('STRESSRUNNER_IP', None)
+        os.environ.pop('STRESSRUNNER_HOSTNAME', None)
+
+    def test_environ(self):
+        os.environ['STRESSRUNNER_IP'] = '192.0.2.10'
+        os.environ['STRESSRUNNER_HOSTNAME'] = 'stress-1'
+        with mock.patch('socket.gethostbyname') as gethostbyname:
+            self.assertEqual((get_local_hostname(), get_local_ip()), ('stress-1', '192.0.2.10'))
+        self.assertFalse(gethostbyname.called)
+
+    def test_lookup_cached(self):
+        os.environ['STRESSRUNNER_HOSTNAME'] = 'stress-1'
+        with mock.patch('socket.gethostbyname', return_value='192.0.2.11') as gethostbyname:
+            self.assertEqual(get_local_ip(), '192.0.2.11')
+            self.assertEqual(get_local_ip(), '192.0.2.11')
+        gethostbyname.assert_called_once_with('stress-1')
+
+    def test_lookup_timeout(self):
+        start = time.monotonic()
+        with mock.patch('socket.gethostbyname', side_effect=slow_lookup), \
+                mock.patch.object(runner, '_udp_local_ip', return_value='192.0.2.12'):
+            self.assertEqual(get_local_ip(timeout=0.1), '192.0.2.12')
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_fallback(self):
+        with mock.patch('socket.gethostbyname', side_effect=OSError), \
+                mock.patch.object(runner, '_udp_local_ip', return_value=None):
+            self.assertEqual(get_local_ip(), '127.0.0.1')
+
+
+class TestLazyHostAttribute(unittest.TestCase):
+
+    def test_lazy(self):
+        func = mock.Mock(return_value='stress-1')
+
+        class Runner(object):
+            local_hostname = _LazyHostAttribute(func)
+
+        self.assertFalse(func.called)
+        first, second = Runner(), Runner()
+        self.assertEqual(first.local_hostname, 'stress-1')
+        self.assertEqual(Runner.local_hostname, 'stress-1')
+        # set on an instance, not computed for it anymore
+        second.local_hostname = 'node-2'
+        self.assertEqual((first.local_hostname, second.local_hostname), ('stress-1', 'node-2'))
+        self.assertEqual(func.call_count, 3)
+
+    def test_runner(self):
+        self.assertIsInstance(runner.StressRunner.__dict__['local_ip'], _LazyHostAttribute)
+        self.assertIsInstance(runner.StressRunner.__dict__['local_hostname'], _LazyHostAttribute)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_logs.py
+Tests of the logger setup: the default logger installed once per process,
+the asynchronous logging emitting the records in a listener thread, and its
+listener restarted in a forked child.
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import unittest
+import threading
+
+from stressrunner import logs
+from stressrunner.logs import get_default_logger, enable_async_logging, disable_async_logging
+
+
+class RecordingHandler(logging.Handler):
+    """Keep the messages and the thread which emitted them, slowly if delay"""
+
+    def __init__(self, delay=0):
+        super(RecordingHandler, self).__init__()
+        self.delay = delay
+        self.records = []
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.records.append((record.getMessage(), threading.current_thread().name))
+
+
+class FileLineHandler(logging.Handler):
+    """Append each message to a file, opened for each record: usable across a fork"""
+
+    def __init__(self, path):
+        super(FileLineHandler, self).__init__()
+        self.path = path
+
+    def emit(self, record):
+        with open(self.path, 'a') as fp:
+            fp.write(record.getMessage() + '\n')
+
+
+class TestAsyncLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('stressrunner.test.{0}'.format(self._testMethodName))
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        disable_async_logging(self.logger)
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def test_default_logger_once(self):
+        name = 'stressrunner.test.default'
+        logger = get_default_logger(name=name)
+        handlers = list(logger.handlers)
+        self.assertTrue(handlers)
+        self.assertIs(get_default_logger(name=name), logger)
+        self.assertEqual(logger.handlers, handlers)
+        for handler in handlers:
+            logger.removeHandler(handler)
+
+    def test_async(self):
+        handler = RecordingHandler(delay=0.2)
+        self.logger.addHandler(handler)
+        self.assertIs(enable_async_logging(self.logger), self.logger)
+        self.assertIs(enable_async_logging(self.logger), self.logger)
+        async_handler, = self.logger.handlers
+        self.assertIsInstance(async_handler, logs._AsyncHandler)
+        self.assertEqual(async_handler.handlers, [handler])
+
+        start = time.monotonic()
+        for idx in range(5):
+            self.logger.info('line %d', idx)
+        # queued, the caller does not wait on the slow handler
+        self.assertLess(time.monotonic() - start, 0.2)
+
+        # the queued records are emitted before the handlers are given back
+        disable_async_logging(self.logger)
+        self.assertEqual(self.logger.handlers, [handler])
+        self.assertEqual([message for message, _ in handler.records], ['line {0}'.format(idx) for idx in range(5)])
+        self.assertNotIn(threading.current_thread().name, set(thread for _, thread in handler.records))
+
+    def test_no_handlers(self):
+        enable_async_logging(self.logger)
+        self.assertEqual(self.logger.handlers, [])
+        self.assertNotIn(self.logger.name, logs._async_handlers)
+
+    @unittest.skipUnless(hasattr(os, 'fork') and hasattr(os, 'register_at_fork'), 'needs os.fork')
+    def test_after_fork(self):
+        tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'child.log')
+        self.logger.addHandler(FileLineHandler(path))
+        enable_async_logging(self.logger)
+        async_handler = self.logger.handlers[0]
+        parent_queue = async_handler.queue
+        self.logger.info('parent')
+
+        pid = os.fork()
+        if pid == 0:
+            # the child has its own queue and a running listener
+            code = 1
+            try:
+                if async_handler.queue is not parent_queue and async_handler.listener is not None:
+                    self.logger.info('child')
+                    async_handler.stop()
+                    code = 0
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        disable_async_logging(self.logger)
+        with open(path) as fp:
+            self.assertEqual(sorted(fp.read().split()), ['child', 'parent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
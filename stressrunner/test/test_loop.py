@@ -0,0 +1,245 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_loop.py
+Tests of the per test case loop: the flat scheduler limited by iterations,
+duration and stop condition, breaking on the first iteration not passed,
+the loop on N concurrent threads, and a fresh test case instance for each
+iteration.
+"""
+
+import time
+import logging
+import unittest
+import threading
+import traceback
+import collections
+
+from stressrunner.loop import CaseLoop, LoopSuite, new_case, loop_suite
+from stressrunner.runner import _TestResult
+
+
+def quiet_logger():
+    logger = logging.getLogger('stressrunner.test')
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+class ArgsSuite(unittest.TestSuite):
+    """A TestSuite whose constructor takes more args"""
+
+    def __init__(self, name, tests=()):
+        super().__init__(tests)
+        self.name = name
+
+
+class TestLoopSuite(unittest.TestCase):
+
+    class Case(unittest.TestCase):
+        calls = []
+        set_up_class = 0
+        fail_at = None
+
+        @classmethod
+        def setUpClass(cls):
+            cls.set_up_class += 1
+
+        def test_a(self):
+            self.calls.append(len(traceback.extract_stack()))
+            if len(self.calls) == self.fail_at:
+                self.fail('iteration {0}'.format(len(self.calls)))
+
+        def test_subtest(self):
+            self.calls.append(len(traceback.extract_stack()))
+            for idx in range(2):
+                with self.subTest(idx=idx):
+                    self.assertNotEqual(len(self.calls) + idx, self.fail_at)
+
+    def setUp(self):
+        self.Case.calls = []
+        self.Case.set_up_class = 0
+        self.Case.fail_at = None
+
+    def run_loop(self, case_loop, method='test_a', result=None):
+        result = result if result is not None else unittest.TestResult()
+        LoopSuite(self.Case(method), case_loop)(result)
+        return result
+
+    def test_iterations(self):
+        result = self.run_loop(CaseLoop(iterations=200))
+        self.assertEqual((result.testsRun, len(self.Case.calls)), (200, 200))
+        self.assertTrue(result.wasSuccessful())
+        # a flat loop: the same stack depth for every iteration
+        self.assertEqual(len(set(self.Case.calls)), 1)
+        self.assertEqual(self.Case.set_up_class, 1)
+
+    def test_duration(self):
+        start = time.monotonic()
+        result = self.run_loop(CaseLoop(iterations=0, duration=0.2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertGreater(result.testsRun, 1)
+
+    def test_stop_condition(self):
+        result = self.run_loop(CaseLoop(iterations=0, stop_condition=lambda res: res.testsRun >= 7))
+        self.assertEqual(result.testsRun, 7)
+
+    def test_break_on_failure(self):
+        self.Case.fail_at = 3
+        result = self.run_loop(CaseLoop(iterations=10))
+        self.assertEqual((result.testsRun, len(result.failures)), (3, 1))
+
+    def test_break_on_subtest(self):
+        self.Case.fail_at = 4
+        result = _TestResult(quiet_logger(), fail_exit=False)
+        self.run_loop(CaseLoop(iterations=10), 'test_subtest', result)
+        # the subtest idx=1 of the iteration 3 failed
+        self.assertEqual((result.testsRun, result.failure_count, len(result.all)), (3, 1, 3))
+        self.assertEqual([res.status for res in result.all], [0, 0, 1])
+        self.assertFalse(result.wasSuccessful())
+        result.all.close()
+
+    def test_should_stop(self):
+        result = unittest.TestResult()
+        result.stop()
+        self.assertFalse(CaseLoop(iterations=0).should_continue(0, time.monotonic(), result))
+
+    def test_loop_suite(self):
+        suite = ArgsSuite('outer', [self.Case('test_a'), ArgsSuite('inner', [self.Case('test_a')])])
+        self.assertIs(loop_suite(suite, CaseLoop()), suite)
+        looped = loop_suite(suite, CaseLoop(iterations=3))
+        self.assertIsNot(looped, suite)
+        self.assertEqual((type(looped), looped.name), (ArgsSuite, 'outer'))
+        first, inner = list(looped)
+        self.assertIsInstance(first, LoopSuite)
+        self.assertEqual(inner.name, 'inner')
+        self.assertIsInstance(list(inner)[0], LoopSuite)
+        # the original suite is left as it was
+        self.assertEqual([type(test) for test in suite], [self.Case, ArgsSuite])
+        result = unittest.TestResult()
+        looped(result)
+        self.assertEqual(result.testsRun, 6)
+
+
+class TestConcurrency(unittest.TestCase):
+
+    class Case(unittest.TestCase):
+        lock = threading.Lock()
+        threads = collections.Counter()
+        set_up_class = 0
+        fail_at = None
+
+        @classmethod
+        def setUpClass(cls):
+            cls.set_up_class += 1
+
+        def test_a(self):
+            with self.lock:
+                self.threads[threading.current_thread().name] += 1
+                calls = sum(self.threads.values())
+            time.sleep(0.001)
+            if calls == self.fail_at:
+                self.fail('iteration {0}'.format(calls))
+
+    def setUp(self):
+        self.Case.threads = collections.Counter()
+        self.Case.set_up_class = 0
+        self.Case.fail_at = None
+        self.result = None
+
+    def tearDown(self):
+        self.result.all.close()
+
+    def run_loop(self, case_loop, fail_exit=True):
+        self.result = _TestResult(quiet_logger(), fail_exit=fail_exit)
+        LoopSuite(self.Case('test_a'), case_loop)(self.result)
+        return self.result
+
+    def test_threads(self):
+        result = self.run_loop(CaseLoop(iterations=25, concurrency=4))
+        self.assertEqual((result.testsRun, result.success_count, len(result.all)), (100, 100, 100))
+        test_id = self.Case('test_a').id()
+        self.assertEqual(self.Case.threads, {'{0}-{1}'.format(test_id, idx): 25 for idx in range(1, 5)})
+        self.assertEqual(self.Case.set_up_class, 1)
+        self.assertEqual(dict(result.latency.items())[test_id].count, 100)
+
+    def test_failure_stops_threads(self):
+        self.Case.fail_at = 20
+        start = time.monotonic()
+        result = self.run_loop(CaseLoop(iterations=0, duration=30, concurrency=4))
+        # the other threads stop after their running iteration
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(result.failure_count, 1)
+        self.assertLess(result.testsRun, 20 + 2 * 4)
+        self.assertTrue(result.shouldStop)
+
+    def test_duration(self):
+        result = self.run_loop(CaseLoop(iterations=0, duration=0.2, concurrency=3), fail_exit=False)
+        self.assertEqual(len(self.Case.threads), 3)
+        self.assertEqual(result.testsRun, result.success_count)
+        self.assertEqual(result.testsRun, sum(self.Case.threads.values()))
+
+
+class TestNewCase(unittest.TestCase):
+
+    class LoaderCase(unittest.TestCase):
+        instances = []
+
+        def setUp(self):
+            self.instances.append(self)
+            self.assertFalse(hasattr(self, 'state'))
+            self.state = 'set up'
+
+        def test_a(self):
+            pass
+
+    class InitCase(unittest.TestCase):
+        """A TestCase taking more constructor args than unittest.TestLoader gives"""
+        instances = []
+
+        def __init__(self, method_name, target):
+            super().__init__(method_name)
+            self.target = target
+
+        def setUp(self):
+            self.instances.append(self)
+            self.assertFalse(hasattr(self, 'state'))
+            self.state = 'set up'
+
+        def test_a(self):
+            self.assertEqual(self.target, 'host-1')
+
+    def setUp(self):
+        self.LoaderCase.instances = []
+        self.InitCase.instances = []
+
+    def test_loader_case(self):
+        test = self.LoaderCase('test_a')
+        case = new_case(test)
+        self.assertIsNot(case, test)
+        self.assertIs(type(case), self.LoaderCase)
+        self.assertEqual(case.id(), test.id())
+
+    def test_init_case(self):
+        test = self.InitCase('test_a', 'host-1')
+        test.addCleanup(lambda: None)
+        case = new_case(test)
+        self.assertIsNot(case, test)
+        self.assertEqual((case._testMethodName, case.target), ('test_a', 'host-1'))
+        self.assertEqual(case._cleanups, [])
+        self.assertEqual(len(test._cleanups), 1)
+
+    def test_loop_instances(self):
+        for cls, test in ((self.LoaderCase, self.LoaderCase('test_a')),
+                          (self.InitCase, self.InitCase('test_a', 'host-1'))):
+            result = unittest.TestResult()
+            LoopSuite(test, CaseLoop(iterations=5))(result)
+            # one instance per iteration, none of them carrying the setUp state of another
+            self.assertEqual((result.testsRun, len(result.failures), len(result.errors)), (5, 0, 0))
+            self.assertEqual(len(set(map(id, cls.instances))), 5)
+            self.assertIs(cls.instances[0], test)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_mail.py
+Tests of the mail attachments compressed under a budget, and of the mail delivery
+against a local SMTP stand-in server: the pooled connections, the retries of
+the transient errors with backoff, the permanent errors given up, and the
+mails sent in the background.
+"""
+
+import os
+import gzip
+import base64
+import shutil
+import smtplib
+import tempfile
+import threading
+import unittest
+import socketserver
+from unittest import mock
+
+from stressrunner import mail
+from stressrunner.mail import SmtpTransport, MailQueue, send_mail, attachment_part, _Base64Lines
+
+
+class TestAttachment(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_base64_lines(self):
+        data = os.urandom(1000)
+        encoded = _Base64Lines()
+        for start in range(0, len(data), 100):
+            self.assertEqual(encoded.write(data[start:start + 100]), 100)
+        value = encoded.getvalue()
+        self.assertEqual(base64.b64decode(value), data)
+        self.assertTrue(all(len(line) <= 76 for line in value.splitlines()))
+
+    def test_compressed_excerpt(self):
+        path = os.path.join(self.tmp_dir, 'report.log')
+        with open(path, 'wb') as fp:
+            fp.write(b'a' * 3000 + b'b' * 4000 + b'c' * 3000)
+        part = attachment_part(path, max_size=6000)
+        self.assertEqual(part.get_content_type(), 'application/gzip')
+        self.assertEqual(part.get_filename(), 'report.log.gz')
+        content = gzip.decompress(part.get_payload(decode=True))
+        self.assertTrue(content.startswith(b'a' * 3000 + b'\n... 4000 bytes truncated'))
+        self.assertTrue(content.endswith(b'c' * 3000))
+
+    def test_not_compressed(self):
+        path = os.path.join(self.tmp_dir, 'report.html')
+        with open(path, 'wb') as fp:
+            fp.write(b'<html></html>')
+        part = attachment_part(path, compress=False)
+        self.assertEqual(part.get_content_type(), 'text/html')
+        self.assertEqual(part.get_payload(decode=True), b'<html></html>')
+        self.assertIsNone(attachment_part(path, compress=False, max_size=5))
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """One SMTP session, just enough of RFC 5321 for smtplib"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                with server.lock:
+                    server.attempts += 1
+                    code = server.mail_replies.pop(0) if server.mail_replies else None
+                self.reply(code or '250 ok')
+            elif verb == 'RCPT':
+                self.reply('250 ok')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b'.\r\n', b''):
+                        break
+                    lines.append(line)
+                with server.lock:
+                    server.messages.append(b''.join(lines).decode('UTF-8', 'replace'))
+                self.reply('250 queued')
+                if server.drop_after_data:
+                    return
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server on a free port, counting the connections and keeping the messages
+    mail_replies: the replies of the next MAIL commands, e.g. '451 try later', then 250
+    drop_after_data: close the connection after each message, as a server closing the idle ones
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), _SmtpHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.attempts = 0
+        self.messages = []
+        self.mail_replies = []
+        self.drop_after_data = False
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class TestSmtpTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SmtpStandIn()
+        self.transport = SmtpTransport('127.0.0.1', self.server.port, timeout=10)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.close()
+
+    def test_reuse(self):
+        for idx in range(3):
+            refused = self.transport.send('a@test.com', ['b@test.com'], 'Subject: {0}\r\n\r\nbody'.format(idx))
+            self.assertEqual(refused, {})
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(len(self.transport._idle), 1)
+
+    def test_pool_size(self):
+        self.transport.pool_size = 1
+        first, _ = self.transport._acquire()
+        second, _ = self.transport._acquire()
+        self.assertEqual(self.server.connections, 2)
+        self.transport._release(first)
+        self.transport._release(second)  # quit, the pool is full
+        self.assertEqual(len(self.transport._idle), 1)
+        self.assertEqual(self.transport._acquire(), (first, True))
+        self.transport._release(first)
+
+    def test_reconnect(self):
+        self.server.drop_after_data = True
+        for idx in range(2):
+            self.transport.send('a@test.com', ['b@test.com'], 'Subject: {0}\r\n\r\nbody'.format(idx))
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_idle_timeout(self):
+        self.transport.idle_timeout = 0
+        for idx in range(2):
+            self.transport.send('a@test.com', ['b@test.com'], 'Subject: {0}\r\n\r\nbody'.format(idx))
+        self.assertEqual(self.server.connections, 2)
+
+
+class TestMailQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SmtpStandIn()
+        self.transport = SmtpTransport('127.0.0.1', self.server.port, timeout=10)
+        self.queue = MailQueue(retries=3, backoff=0.5, max_backoff=1.5)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.close()
+
+    def put(self):
+        return self.queue.put(self.transport, 'a@test.com', ['b@test.com'], 'Subject: queued\r\n\r\nbody')
+
+    @mock.patch('stressrunner.mail.time.sleep')
+    def test_retry_backoff(self, sleep):
+        self.server.mail_replies = ['451 try later'] * 3
+        future = self.put()
+        self.assertEqual(future.result(timeout=30), {})
+        self.assertEqual(self.server.attempts, 4)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [0.5, 1.0, 1.5])
+        self.assertTrue(self.queue.join(5))
+
+    @mock.patch('stressrunner.mail.time.sleep')
+    def test_retries_exhausted(self, sleep):
+        self.server.mail_replies = ['421 busy'] * 4
+        future = self.put()
+        error = future.exception(timeout=30)
+        self.assertIsInstance(error, smtplib.SMTPResponseException)
+        self.assertEqual(error.smtp_code, 421)
+        self.assertEqual(self.server.attempts, 4)
+        self.assertEqual(sleep.call_count, 3)
+
+    @mock.patch('stressrunner.mail.time.sleep')
+    def test_permanent_error(self, sleep):
+        self.server.mail_replies = ['550 no such sender']
+        future = self.put()
+        error = future.exception(timeout=30)
+        self.assertIsInstance(error, smtplib.SMTPSenderRefused)
+        self.assertEqual(error.smtp_code, 550)
+        self.assertEqual(self.server.attempts, 1)
+        self.assertFalse(sleep.called)
+        self.assertEqual(self.server.messages, [])
+
+    def test_join(self):
+        futures = [self.put() for _ in range(5)]
+        self.assertTrue(self.queue.join(30))
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+
+
+class TestSendMail(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SmtpStandIn()
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+
+    def tearDown(self):
+        mail.get_transport('127.0.0.1', self.server.port).close()
+        self.server.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_send_mail_background(self):
+        path = os.path.join(self.tmp_dir, 'report.log')
+        with open(path, 'w') as fp:
+            fp.write('log line\n' * 1000)
+        future = send_mail('stress report', '<p>digest</p>', 'a@test.com', 'b@test.com;c@test.com',
+                           '127.0.0.1', '', '', self.server.port, False, attachments=[path], block=False)
+        self.assertEqual(future.result(timeout=30), {})
+        message, = self.server.messages
+        self.assertIn('Subject: stress report', message)
+        self.assertIn('filename="report.log.gz"', message)
+
+    def test_send_mail_budget(self):
+        path = os.path.join(self.tmp_dir, 'report.log')
+        with open(path, 'w') as fp:
+            fp.write('log line\n' * 1000)
+        future = send_mail('stress report', 'body', 'a@test.com', 'b@test.com', '127.0.0.1', '', '',
+                           self.server.port, False, attachments=[path], block=False, max_size=100)
+        self.assertEqual(future.result(timeout=30), {})
+        message, = self.server.messages
+        payload = message.split('filename="report.log.gz"', 1)[1].split('\r\n\r\n', 1)[1].split('--', 1)[0]
+        content = gzip.decompress(base64.b64decode(payload))
+        self.assertTrue(content.startswith(b'log line\n' * 5 + b'log l\n... 8900 bytes truncated'))
+
+    def test_send_mail_block(self):
+        self.assertIsNone(send_mail('stress report', 'body', 'a@test.com', 'b@test.com', '127.0.0.1', '', '',
+                                    self.server.port, False))
+        self.assertEqual(len(self.server.messages), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_metrics.py
+Tests of the live metrics: the counts and the rolling window fed by the
+records, the summary line logged periodically, and the Prometheus text
+served on the HTTP endpoint.
+"""
+
+import time
+import logging
+import unittest
+import urllib.error
+import urllib.request
+
+from stressrunner.loop import CaseLoop, LoopSuite
+from stressrunner.metrics import LiveMetrics
+from stressrunner.runner import _TestResult
+
+MS = 1000000
+
+
+def quiet_logger():
+    logger = logging.getLogger('stressrunner.test')
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def samples(text):
+    """{name{labels}: value} of the sample lines"""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+class TestLiveMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = LiveMetrics()
+
+    def tearDown(self):
+        self.metrics.stop()
+
+    def feed(self):
+        for elapsed in range(1, 101):
+            self.metrics.add(0, 'mod.A.test_1', elapsed * MS)
+        self.metrics.add(1, 'mod.A.test_1', 200 * MS)
+        self.metrics.add(2, 'mod.B.test "2"\\', 300 * MS)
+        self.metrics.add(3, 'mod.B.test "2"\\', 0)
+
+    def test_counts(self):
+        self.feed()
+        self.assertEqual(self.metrics.counts, [100, 1, 1, 1, 0])
+        self.assertEqual(dict(self.metrics.case_counts),
+                         {'mod.A.test_1': [100, 1, 0, 0, 0], 'mod.B.test "2"\\': [0, 0, 1, 1, 0]})
+        line = self.metrics.summary_line()
+        self.assertTrue(line.startswith('[METRIC] Iterations: 103 (pass 100, fail 1, error 1, skip 1) --Rate: '))
+        self.assertIn('--FailureRate: 1.96% --Latency p50/p90/p99: 52.000/92.000/200.000 ms (last 60s)', line)
+
+    def test_prometheus(self):
+        self.feed()
+        text = self.metrics.prometheus()
+        self.assertTrue(text.endswith('\n'))
+        values = samples(text)
+        self.assertEqual(values['stressrunner_iterations_total{status="pass"}'], 100)
+        self.assertEqual(values['stressrunner_iterations_total{status="canceled"}'], 0)
+        self.assertEqual(values['stressrunner_case_iterations_total{case="mod.A.test_1",status="fail"}'], 1)
+        # the label values escaped
+        self.assertEqual(values['stressrunner_case_iterations_total{case="mod.B.test \\"2\\"\\\\",status="skip"}'], 1)
+        self.assertNotIn('stressrunner_case_iterations_total{case="mod.A.test_1",status="error"}', values)
+        self.assertAlmostEqual(values['stressrunner_failure_ratio'], 2 / 102.0, places=6)
+        self.assertEqual(values['stressrunner_latency_seconds{quantile="0.99"}'], 0.2)
+        self.assertEqual(values['stressrunner_case_latency_seconds_count{case="mod.A.test_1"}'], 101)
+        self.assertAlmostEqual(values['stressrunner_case_latency_seconds_sum{case="mod.A.test_1"}'], 5.25, places=6)
+        # each metric announced once, before its samples
+        for line in text.splitlines():
+            if line.startswith('# TYPE'):
+                self.assertEqual(text.count(line), 1)
+
+    def test_window(self):
+        self.metrics = LiveMetrics(window=0.05)
+        self.metrics.add(1, 'mod.A.test_1', MS)
+        time.sleep(0.1)
+        values = samples(self.metrics.prometheus())
+        # out of the window, still counted since the start
+        self.assertEqual(values['stressrunner_iterations_per_second'], 0)
+        self.assertEqual(values['stressrunner_failure_ratio'], 0)
+        self.assertNotIn('stressrunner_latency_seconds{quantile="0.5"}', values)
+        self.assertEqual(values['stressrunner_iterations_total{status="fail"}'], 1)
+
+    def test_max_samples(self):
+        self.metrics = LiveMetrics(max_samples=10)
+        for elapsed in range(1, 21):
+            self.metrics.add(0, 'mod.A.test_1', elapsed * MS)
+        values = samples(self.metrics.prometheus())
+        # the window quantiles of the last 10 samples, the case quantiles of all of them
+        self.assertEqual(values['stressrunner_latency_seconds{quantile="0.5"}'], 0.016)
+        self.assertEqual(values['stressrunner_case_latency_seconds_count{case="mod.A.test_1"}'], 20)
+
+    def test_endpoint(self):
+        self.feed()
+        self.metrics.start(port=0)
+        url = 'http://{0}:{1}'.format(*self.metrics.address)
+        with urllib.request.urlopen(url + '/metrics', timeout=10) as response:
+            self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+            values = samples(response.read().decode('UTF-8'))
+        self.assertEqual(values['stressrunner_iterations_total{status="pass"}'], 100)
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(url + '/other', timeout=10)
+        self.assertEqual(context.exception.code, 404)
+        context.exception.close()
+        self.metrics.stop()
+        self.assertIsNone(self.metrics.address)
+
+    def test_reporter(self):
+        records = []
+        logger = logging.getLogger('stressrunner.test.metrics')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.removeFilter, records.append)
+        logger.addFilter(records.append)
+        self.metrics.start(logger, interval=0.02)
+        time.sleep(0.2)
+        self.metrics.stop()
+        count = len(records)
+        self.assertGreater(count, 2)
+        self.assertTrue(all(record.getMessage().startswith('[METRIC] Iterations: 0 (-)') for record in records))
+        # not logged anymore once stopped
+        time.sleep(0.05)
+        self.assertEqual(len(records), count)
+
+    def test_result_feed(self):
+        class Case(unittest.TestCase):
+            def test_a(self):
+                pass
+
+        result = _TestResult(quiet_logger(), fail_exit=False)
+        result.metrics = self.metrics
+        LoopSuite(Case('test_a'), CaseLoop(iterations=30, concurrency=3))(result)
+        self.assertEqual(self.metrics.counts, [90, 0, 0, 0, 0])
+        self.assertEqual(list(self.metrics.case_counts), [Case('test_a').id()])
+        result.all.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_parallel.py
+Tests of the worker process pool: the records merged into the parent result
+and the workers exiting unexpectedly.
+"""
+
+import os
+import signal
+import logging
+import unittest
+
+from stressrunner.loop import CaseLoop
+from stressrunner.runner import _TestResult
+from stressrunner.parallel import WorkerPool
+
+logger = logging.getLogger('stressrunner.test')
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+
+def make_result():
+    return _TestResult(logger, verbosity=1, fail_exit=False)
+
+
+class TestWorkerPool(unittest.TestCase):
+    """The test cases run in the workers are nested, not collected on their own"""
+
+    class WorkerCase(unittest.TestCase):
+
+        def test_pass(self):
+            print('pass')
+
+        def test_fail(self):
+            self.fail('failed in the worker')
+
+        def test_error(self):
+            raise RuntimeError('error in the worker')
+
+        @unittest.skip('skipped in the worker')
+        def test_skip(self):
+            pass
+
+    class ExitCase(unittest.TestCase):
+
+        def test_exit(self):
+            os._exit(3)
+
+    def run_pool(self, suite, case_loop, result, workers=2):
+        pool = WorkerPool(workers, suite, case_loop, result)
+        pool.poll_interval = 0.1
+        try:
+            pool.run(result)
+        finally:
+            pool.close()
+
+    def test_merge_records(self):
+        suite = unittest.TestLoader().loadTestsFromTestCase(self.WorkerCase)
+        result = make_result()
+        self.run_pool(suite, CaseLoop(iterations=3), result)
+        self.assertEqual(result.success_count, 3)
+        self.assertEqual(result.failure_count, 1)
+        self.assertEqual(result.error_count, 1)
+        self.assertEqual(result.skipped_count, 1)
+        self.assertEqual(result.testsRun, 6)
+        self.assertEqual(len(result.all), 6)
+        statuses = sorted((res.case.test_id.split('.')[-1], res.status) for res in result.all)
+        self.assertEqual(statuses, [('test_error', 2), ('test_fail', 1), ('test_pass', 0),
+                                    ('test_pass', 0), ('test_pass', 0), ('test_skip', 3)])
+        stack_traces = [res.stack_trace for res in result.all if res.status == 1]
+        self.assertIn('failed in the worker', stack_traces[0])
+        self.assertEqual(len(result.latency), 3)  # the skipped case has no latency
+
+    def test_merge_loops(self):
+        suite = unittest.TestLoader().loadTestsFromName('test_pass', self.WorkerCase)
+        result = make_result()
+        for ts_loop in (1, 2):
+            result.ts_loop = ts_loop
+            self.run_pool(suite, CaseLoop(iterations=2), result, workers=1)
+        self.assertEqual(result.success_count, 4)
+        self.assertEqual([res.loop for res in result.all], [1, 1, 2, 2])
+
+    def test_check_workers(self):
+        suite = unittest.TestLoader().loadTestsFromTestCase(self.WorkerCase)
+        pool = WorkerPool(2, suite, CaseLoop(), make_result())
+        try:
+            pool._check_workers()
+            worker = pool._workers[0]
+            os.kill(worker.pid, signal.SIGKILL)
+            worker.join()
+            with self.assertRaisesRegex(Exception, 'exited unexpectedly, exitcode: -9'):
+                pool._check_workers()
+        finally:
+            pool.close()
+
+    def test_worker_exit(self):
+        suite = unittest.TestLoader().loadTestsFromTestCase(self.ExitCase)
+        with self.assertRaisesRegex(Exception, 'exited unexpectedly, exitcode: 3'):
+            self.run_pool(suite, CaseLoop(), make_result(), workers=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_render.py
+Tests of the report emitters: the mail digest with its counts, the test
+cases with the most failures and the highest latency, cut to their top N.
+"""
+
+import os
+import re
+import shutil
+import logging
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+from stressrunner import render
+from stressrunner.render import ReportModel, DigestEmitter
+from stressrunner.runner import StressRunner, _TestResult
+
+MS = 1000000
+
+
+def quiet_logger():
+    logger = logging.getLogger('stressrunner.test')
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def rows(html, title):
+    """The cells of each row of the table after the <h3> title"""
+    table = html.split('<h3>{0}</h3>'.format(title), 1)[1].split('</table>', 1)[0]
+    return [re.findall(r'<td[^>]*>(.*?)</td>', row) for row in re.findall(r'<tr[^>]*>(.*?)</tr>', table, re.S)]
+
+
+class TestDigestEmitter(unittest.TestCase):
+
+    class Case(unittest.TestCase):
+
+        def test_1(self):
+            pass
+
+        def test_2(self):
+            pass
+
+        def test_3(self):
+            pass
+
+        def test_4(self):
+            pass
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.runner = StressRunner(report_html=os.path.join(self.tmp_dir, 'report.html'), logger=quiet_logger(),
+                                   report_formats=('digest',))
+        self.runner.local_hostname = 'stress-1'
+        self.runner.local_ip = '192.0.2.1'
+        self.runner.start_time = datetime.datetime(2026, 1, 2, 3, 4, 5)
+        self.runner.stop_time = datetime.datetime(2026, 1, 2, 4, 4, 5)
+        self.runner.elapsedtime = 3600 * 10 ** 9
+        self.result = _TestResult(quiet_logger(), fail_exit=False)
+
+    def tearDown(self):
+        self.result.all.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def add(self, sn, method_name, elapsed_time, count=1, stack_trace=''):
+        for loop in range(1, count + 1):
+            self.result.merge_record((sn, self.Case(method_name), '', stack_trace, elapsed_time, loop))
+
+    def render(self, status):
+        self.runner.test_status = status
+        self.runner.report_title = status + ': Test Report'
+        render.render(ReportModel(self.runner, self.result), [DigestEmitter(self.runner.report_digest_html)])
+        with open(self.runner.report_digest_html, encoding='UTF-8') as fp:
+            return fp.read()
+
+    def test_passed(self):
+        self.add(0, 'test_1', 2 * MS, count=3)
+        self.add(3, 'test_2', 0)
+        html = self.render('PASS')
+        self.assertIn('<h2 style="color: #66CC66;">PASS: Test Report</h2>', html)
+        self.assertIn('<tr><td><b>Location</b></td><td>stress-1(192.0.2.1)</td></tr>', html)
+        self.assertEqual(rows(html, 'Summary')[1], ['4', '3', '0', '0', '1', '0', '100%'])
+        self.assertEqual(rows(html, 'Top Failures')[1:], [['None']])
+        # the skipped test case has no latency
+        self.assertEqual(rows(html, 'Latency (ms)')[1:],
+                         [[self.Case('test_1').id(), '3', '2.000', '2.000', '2.000', '2.000']])
+
+    def test_top_failures(self):
+        self.add(0, 'test_1', MS, count=4)
+        self.add(1, 'test_2', MS, count=2, stack_trace='Traceback\nAssertionError: <b>2</b> & "x"\n')
+        self.add(2, 'test_3', MS, count=5, stack_trace='Traceback\nOSError: disk full\n')
+        self.add(1, 'test_4', MS, stack_trace='Traceback\nAssertionError: 4\n')
+        with mock.patch.object(render, 'DIGEST_TOP_FAILURES', 2):
+            html = self.render('FAILED')
+        self.assertIn('<h2 style="color: #FF0000;">FAILED: Test Report</h2>', html)
+        # the most failures first, the last line of the first stack trace, escaped
+        self.assertEqual(rows(html, 'Top Failures')[1:], [
+            [self.Case('test_3').id(), '5', '5', 'OSError: disk full'],
+            [self.Case('test_2').id(), '2', '2', 'AssertionError: &lt;b&gt;2&lt;/b&gt; &amp; "x"'],
+            ['... 1 more failed test cases'],
+        ])
+        self.assertEqual(rows(html, 'Summary')[1], ['12', '4', '3', '5', '0', '0', '33%'])
+
+    def test_top_latency(self):
+        for idx, method_name in enumerate(('test_1', 'test_2', 'test_3', 'test_4')):
+            self.add(0, method_name, (idx % 2 * 10 + idx) * MS, count=2)
+        with mock.patch.object(render, 'DIGEST_TOP_LATENCY', 3):
+            html = self.render('PASS')
+        # the highest p99 first
+        latency = rows(html, 'Latency (ms)')[1:]
+        self.assertEqual([row[0].rsplit('.', 1)[1] for row in latency[:3]], ['test_4', 'test_2', 'test_3'])
+        self.assertEqual(latency[0][1:], ['2', '13.000', '13.000', '13.000', '13.000'])
+        self.assertEqual(latency[3], ['... 1 more test cases'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_stats.py
+Tests of the latency histograms: the percentiles within the sub-bucket
+precision, the exact count/min/max/mean/stddev.
+"""
+
+import math
+import random
+import unittest
+import statistics
+
+from stressrunner.stats import LatencyHistogram, LatencyStats, PERCENTILES, ns_to_ms
+
+
+def exact_percentile(values, percent):
+    """The nearest-rank percentile of the sorted values"""
+    rank = max(int(math.ceil(percent / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def check_samples(self, samples, sub_bits=5):
+        histogram = LatencyHistogram(sub_bits)
+        for value in samples:
+            histogram.add(value)
+        values = sorted(samples)
+        max_error = 1.0 / 2 ** sub_bits
+        for percent in (1, 10, 25) + PERCENTILES + (100,):
+            expected = exact_percentile(values, percent)
+            actual = histogram.percentile(percent)
+            self.assertLessEqual(abs(actual - expected), expected * max_error,
+                                 'p{0}: {1} != {2}'.format(percent, actual, expected))
+        self.assertEqual(histogram.count, len(samples))
+        self.assertEqual(histogram.min, values[0])
+        self.assertEqual(histogram.max, values[-1])
+        self.assertAlmostEqual(histogram.mean, statistics.mean(samples), delta=histogram.mean * 1e-9)
+        self.assertAlmostEqual(histogram.stddev, statistics.pstdev(samples), delta=histogram.stddev * 1e-6)
+        return histogram
+
+    def test_uniform(self):
+        rng = random.Random(1)
+        self.check_samples([rng.randint(1000, 10 ** 9) for _ in range(20000)])
+
+    def test_lognormal(self):
+        rng = random.Random(2)
+        self.check_samples([int(rng.lognormvariate(15, 2)) + 1 for _ in range(20000)])
+
+    def test_sub_bits(self):
+        rng = random.Random(3)
+        for sub_bits in (2, 3, 7):
+            self.check_samples([rng.randint(1, 10 ** 7) for _ in range(5000)], sub_bits)
+
+    def test_small_values_exact(self):
+        # below 2 * 2**sub_bits each value has its own bucket
+        samples = list(range(64)) * 3
+        histogram = self.check_samples(samples)
+        for percent in (10, 50, 90):
+            self.assertEqual(histogram.percentile(percent), exact_percentile(sorted(samples), percent))
+
+    def test_constant(self):
+        histogram = self.check_samples([123456789] * 100)
+        self.assertEqual(histogram.percentile(50), 123456789)
+        self.assertEqual(histogram.stddev, 0)
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+        self.assertIsNone(histogram.stddev)
+        self.assertEqual(histogram.summary()['count'], 0)
+
+    def test_negative(self):
+        histogram = LatencyHistogram()
+        histogram.add(-5)
+        self.assertEqual(histogram.min, 0)
+
+    def test_summary(self):
+        histogram = LatencyHistogram()
+        for value in (1000000, 2000000, 3000000):
+            histogram.add(value)
+        summary = histogram.summary()
+        self.assertEqual(list(summary), ['count', 'min', 'max', 'mean', 'stddev', 'p50', 'p90', 'p99', 'p99.9'])
+        self.assertEqual(summary['mean'], 2000000)
+        self.assertEqual(ns_to_ms(summary['mean']), '2.000')
+        self.assertEqual(ns_to_ms(None), '-')
+
+
+class TestLatencyStats(unittest.TestCase):
+
+    def test_order(self):
+        stats = LatencyStats()
+        for test_id, value in (('b', 2), ('a', 1), ('b', 3)):
+            stats.add(test_id, value)
+        self.assertEqual(len(stats), 2)
+        self.assertEqual([(test_id, histogram.count) for test_id, histogram in stats.items()],
+                         [('b', 2), ('a', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+@file  : test_store.py
+Tests of the result store: the records read back from the columns and the
+spill file, the journal truncated to the last completed loop on resume, and
+the records grouped by class.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from stressrunner.store import ResultStore, CaseInfo
+
+
+def case(class_name, method_name):
+    test_id = '{0}.{1}'.format(class_name, method_name)
+    return CaseInfo(test_id, class_name, method_name, '{0} ({1})'.format(method_name, test_id), None)
+
+
+CASE_A1 = case('mod.A', 'test_1')
+CASE_A2 = case('mod.A', 'test_2')
+CASE_B1 = case('mod.B', 'test_1')
+CASE_C1 = case('mod.C', 'test_1')
+
+
+def run_loop(store, loop, cases=(CASE_A1, CASE_B1)):
+    for idx, test in enumerate(cases):
+        sn = idx % 3
+        store.append((sn, test, 'out {0} {1}\n'.format(test.test_id, loop),
+                      'trace {0}'.format(loop) if sn else '', 1000 * loop + idx, loop))
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='stressrunner_test_')
+        self.path = os.path.join(self.tmp_dir, 'logs', 'report.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_records(self):
+        store = ResultStore(self.path, window=2)
+        run_loop(store, 1, (CASE_A1, CASE_A2, CASE_B1))
+        self.assertEqual(len(store), 3)
+        sn, test, output, stack_trace, elapsed_time, loop = store[1]
+        self.assertEqual((sn, test.test_id, output, stack_trace, elapsed_time, loop),
+                         (1, 'mod.A.test_2', 'out mod.A.test_2 1\n', 'trace 1', 1001, 1))
+        self.assertIs(store[0].case, store.cases['mod.A.test_1'])
+        self.assertEqual([res.case.test_id for res in store.recent], ['mod.A.test_2', 'mod.B.test_1'])
+        self.assertEqual(store.classes, ['mod.A', 'mod.B'])
+        with self.assertRaises(IndexError):
+            store[3]
+        store.close()
+        # the files are kept, the records still readable
+        self.assertEqual(store[2].output, 'out mod.B.test_1 1\n')
+        self.assertTrue(os.path.isfile(self.path + '.out'))
+
+    def test_temporary(self):
+        store = ResultStore()
+        run_loop(store, 1)
+        path, spill_path = store.path, store.spill_path
+        self.assertEqual(store[1].stack_trace, 'trace 1')
+        self.assertIsNone(store.resume())
+        store.close()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(spill_path))
+        self.assertEqual(len(store), 0)
+
+    def test_resume(self):
+        store = ResultStore(self.path)
+        run_loop(store, 1)
+        store.mark_loop(1, elapsed_time=10)
+        run_loop(store, 2)
+        store.mark_loop(2, elapsed_time=20)
+        log_size = os.path.getsize(self.path)
+        spill_size = os.path.getsize(self.path + '.out')
+        # crash in loop 3: records of the unfinished loop, and a torn last line
+        run_loop(store, 3, (CASE_A1, CASE_B1, CASE_C1))
+        store.flush()
+        with open(self.path, 'a', encoding='utf-8') as fp:
+            fp.write('{"id": "mod.A.te')
+
+        resumed = ResultStore(self.path)
+        marker = resumed.resume()
+        self.assertEqual(marker, {'loop_done': 2, 'records': 4, 'elapsed_time': 20})
+        self.assertEqual(os.path.getsize(self.path), log_size)
+        self.assertEqual(os.path.getsize(self.path + '.out'), spill_size)
+        self.assertEqual(len(resumed), 4)
+        self.assertEqual([(res.case.test_id, res.status, res.loop) for res in resumed],
+                         [('mod.A.test_1', 0, 1), ('mod.B.test_1', 1, 1),
+                          ('mod.A.test_1', 0, 2), ('mod.B.test_1', 1, 2)])
+        self.assertEqual(resumed[3].output, 'out mod.B.test_1 2\n')
+        self.assertEqual(resumed[3].stack_trace, 'trace 2')
+        self.assertEqual([summary.counts for summary in resumed.summarize()], [[2, 0, 0, 0, 0], [0, 2, 0, 0, 0]])
+        # mod.C was only seen in the dropped loop, its case line is dropped too
+        self.assertNotIn('mod.C.test_1', resumed.cases)
+
+        # the new records are appended after the last marker
+        run_loop(resumed, 3, (CASE_A1, CASE_B1, CASE_C1))
+        resumed.mark_loop(3, elapsed_time=30)
+        resumed.close()
+        self.assertEqual(resumed[6].output, 'out mod.C.test_1 3\n')
+        with open(self.path, encoding='utf-8') as fp:
+            entries = [json.loads(line) for line in fp]
+        self.assertEqual([entry['loop_done'] for entry in entries if 'loop_done' in entry], [1, 2, 3])
+        self.assertEqual(sum(1 for entry in entries if 'id' in entry), 7)
+        self.assertEqual([entry['case']['test_id'] for entry in entries if 'case' in entry],
+                         ['mod.A.test_1', 'mod.B.test_1', 'mod.C.test_1'])
+
+        again = ResultStore(self.path)
+        self.assertEqual(again.resume()['loop_done'], 3)
+        self.assertEqual(len(again), 7)
+        self.assertEqual(again[6].stack_trace, 'trace 3')
+        again.close()
+
+    def test_resume_nothing(self):
+        self.assertIsNone(ResultStore(self.path).resume())
+        store = ResultStore(self.path)
+        run_loop(store, 1)
+        store.close()
+        # no completed loop
+        self.assertIsNone(ResultStore(self.path).resume())
+
+    def test_iter_grouped(self):
+        store = ResultStore(self.path)
+        for loop in (1, 2):
+            run_loop(store, loop, (CASE_A1, CASE_B1, CASE_A2, CASE_C1))
+        run_loop(store, 3, (CASE_C1, CASE_A2))
+        grouped = [(res.case.test_id, res.loop) for res in store.iter_grouped()]
+        self.assertEqual(grouped, [
+            ('mod.A.test_1', 1), ('mod.A.test_2', 1), ('mod.A.test_1', 2), ('mod.A.test_2', 2), ('mod.A.test_2', 3),
+            ('mod.B.test_1', 1), ('mod.B.test_1', 2),
+            ('mod.C.test_1', 1), ('mod.C.test_1', 2), ('mod.C.test_1', 3),
+        ])
+        self.assertEqual([(res.case.test_id, res.loop) for res in store.iter_records('mod.A', start=4)],
+                         [('mod.A.test_1', 2), ('mod.A.test_2', 2), ('mod.A.test_2', 3)])
+        self.assertEqual([summary.case.test_id for summary in store.summarize()],
+                         ['mod.A.test_1', 'mod.A.test_2', 'mod.B.test_1', 'mod.C.test_1'])
+        self.assertEqual(list(ResultStore().iter_grouped()), [])
+        store.close()
+
+    def test_summarize_samples(self):
+        store = ResultStore(self.path, samples=1)
+        for loop in range(1, 6):
+            store.append((1, CASE_A1, '', 'trace {0}'.format(loop), 1, loop))
+        summary, = store.summarize()
+        first, last, omitted = summary.failure_samples()
+        self.assertEqual(([res.stack_trace for res in first], [res.stack_trace for res in last], omitted),
+                         (['trace 1'], ['trace 5'], 3))
+        summary, = store.summarize(samples=2)
+        first, last, omitted = summary.failure_samples()
+        self.assertEqual(([res.loop for res in first], [res.loop for res in last], omitted), ([1, 2], [4, 5], 1))
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming report writers.
+The elements are written to the file as they are added, nothing is kept in
+memory, so the size of the report does not matter.
+"""
+
+import io
+import os
+import re
+import json
+from xml.sax.saxutils import XMLGenerator, quoteattr
+
+# characters not allowed in XML 1.0, may be printed by a test case
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff￾￿]')
+
+
+def xml_safe(text):
+    return _ILLEGAL_XML_CHARS.sub('?', text or '')
+
+
+class JUnitXmlWriter(object):
+    """
+    Write a JUnit XML report incrementally:
+        <testsuites><testsuite ...><properties/><testcase/>...</testsuite></testsuites>
+    :param path: the xml file path
+    :param indent: indent of each level
+    :param fp: write the elements into this text stream instead, without the document start/end
+    """
+
+    def __init__(self, path, indent='  ', fp=None):
+        self.path = path
+        self.indent = indent
+        self._document = fp is None
+        self._fp = open(path, 'w', encoding='utf-8') if fp is None else fp
+        self._xml = XMLGenerator(self._fp, encoding='utf-8', short_empty_elements=True)
+        if self._document:
+            self._xml.startDocument()
+            self._xml.startElement('testsuites', {})
+        self._in_suite = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _newline(self, level):
+        self._xml.ignorableWhitespace('\n' + self.indent * level)
+
+    def _element(self, level, name, attrs, text=None):
+        self._newline(level)
+        self._xml.startElement(name, {k: xml_safe(str(v)) for k, v in attrs.items()})
+        if text:
+            self._xml.characters(xml_safe(text))
+        self._xml.endElement(name)
+
+    def start_suite(self, attrs):
+        """
+        :param attrs: dict of the testsuite attributes, name/tests/failures/errors/time...
+        :return:
+        """
+        self._newline(1)
+        self._xml.startElement('testsuite', {k: xml_safe(str(v)) for k, v in attrs.items()})
+        self._in_suite = True
+
+    def add_properties(self, properties):
+        """
+        :param properties: iterable of (name, value)
+        :return:
+        """
+        started = False
+        for name, value in properties:
+            if not started:
+                self._newline(2)
+                self._xml.startElement('properties', {})
+                started = True
+            self._element(3, 'property', {'name': name, 'value': value})
+        if started:
+            self._newline(2)
+            self._xml.endElement('properties')
+
+    def add_testcase(self, attrs, skipped=None, failure=None, error=None, system_out=None):
+        """
+        Write one <testcase>
+        :param attrs: dict of the testcase attributes, classname/name/time
+        :param skipped: the skip reason
+        :param failure: (message, type, body)
+        :param error: (message, type, body)
+        :param system_out: the captured output
+        :return:
+        """
+        self._newline(2)
+        self._xml.startElement('testcase', {k: xml_safe(str(v)) for k, v in attrs.items()})
+        has_children = False
+        if skipped is not None:
+            self._element(3, 'skipped', {'message': skipped})
+            has_children = True
+        for name, detail in (('failure', failure), ('error', error)):
+            if detail is not None:
+                message, type_, body = detail
+                self._element(3, name, {'message': message, 'type': type_}, body)
+                has_children = True
+        if system_out:
+            self._element(3, 'system-out', {}, system_out)
+            has_children = True
+        if has_children:
+            self._newline(2)
+        self._xml.endElement('testcase')
+
+    def end_suite(self):
+        if self._in_suite:
+            self._newline(1)
+            self._xml.endElement('testsuite')
+            self._in_suite = False
+
+    def close(self):
+        if not self._document or self._fp.closed:
+            return
+        self.end_suite()
+        self._newline(0)
+        self._xml.endElement('testsuites')
+        self._xml.ignorableWhitespace('\n')
+        self._xml.endDocument()
+        self._fp.close()
+
+
+class JUnitXmlCheckpoint(object):
+    """
+    A JUnit XML report updated in place at each checkpoint: only the new
+    <testcase> elements are appended before the closing tags, and the
+    <testsuite> start tag is rewritten at its offset, so a checkpoint costs
+    the new results only. The testsuite attributes must keep the same length,
+    e.g. zero padded numbers, the file is valid XML after each checkpoint.
+    :param path: the xml file path
+    :param indent: indent of each level
+    """
+
+    def __init__(self, path, indent='  '):
+        self.path = path
+        self.indent = indent
+        self._buffer = io.StringIO()
+        self._writer = JUnitXmlWriter(None, indent, fp=self._buffer)
+        self._fp = None
+        self._suite_offset = 0
+        self._suite_size = 0
+        self._body_end = 0
+
+    def _suite_tag(self, attrs):
+        return '<testsuite {0}>'.format(' '.join(
+            '{0}={1}'.format(k, quoteattr(xml_safe(str(v)))) for k, v in attrs.items())).encode('UTF-8')
+
+    def checkpoint(self, suite_attrs, testcases):
+        """
+        :param suite_attrs: dict of the testsuite attributes, same length at each checkpoint
+        :param testcases: iterable of (attrs, kwargs of JUnitXmlWriter.add_testcase), the new ones
+        :return:
+        """
+        tag = self._suite_tag(suite_attrs)
+        if self._fp is None:
+            self._fp = open(self.path, 'wb')
+            self._fp.write('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>\n{0}'.format(
+                self.indent).encode('UTF-8'))
+            self._suite_offset = self._fp.tell()
+            self._suite_size = len(tag)
+            self._fp.write(tag)
+            self._body_end = self._fp.tell()
+        elif len(tag) != self._suite_size:
+            raise ValueError('the testsuite tag size changed: {0} -> {1}'.format(self._suite_size, len(tag)))
+        else:
+            self._fp.seek(self._suite_offset)
+            self._fp.write(tag)
+
+        self._fp.seek(self._body_end)
+        for attrs, kwargs in testcases:
+            self._writer.add_testcase(attrs, **kwargs)
+            if self._buffer.tell() > 65536:
+                self._write_buffer()
+        self._write_buffer()
+        self._body_end = self._fp.tell()
+        self._fp.write('\n{0}</testsuite>\n</testsuites>\n'.format(self.indent).encode('UTF-8'))
+        self._fp.truncate()
+        self._fp.flush()
+
+    def _write_buffer(self):
+        self._fp.write(self._buffer.getvalue().encode('UTF-8'))
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class NdjsonWriter(object):
+    """
+    Newline delimited JSON, one compact object per line, e.g. a record per
+    line with the same keys in the same order, so it can be loaded line by
+    line or all at once (pandas.read_json(lines=True), pyarrow.json).
+    Flushed every flush_lines lines and at flush(), the file can be read while written.
+    :param path: the file path
+    :param append: append to the file instead of truncating it
+    :param flush_lines: flush every N lines
+    """
+
+    def __init__(self, path, append=False, flush_lines=1000):
+        self.path = path
+        self.flush_lines = flush_lines
+        self.count = 0  # lines written
+        path_dir = os.path.dirname(path)
+        if path_dir and not os.path.isdir(path_dir):
+            os.makedirs(path_dir)
+        self._fp = open(path, 'a' if append else 'w', encoding='utf-8', buffering=1024 * 1024)
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, obj):
+        self._fp.write(self._encode(obj))
+        self._fp.write('\n')
+        self.count += 1
+        if self.flush_lines and self.count % self.flush_lines == 0:
+            self._fp.flush()
+
+    def flush(self):
+        if not self._fp.closed:
+            self._fp.flush()
+
+    def close(self):
+        if not self._fp.closed:
+            self._fp.close()